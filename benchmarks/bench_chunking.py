@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark de fragmentación: splitter recursivo (300/30) vs StructuredTextSplitter
+
+Para cada splitter reporta cantidad de fragmentos, tamaño medio, tokens a embeber,
+tamaño estimado del índice (vectores float32 + texto en metadatos) y tasa de
+acierto de recuperación con top-k:
+- por pregunta: la consulta es el texto de una pregunta numerada; acierta si alguno
+  de los k fragmentos la contiene completa;
+- por categoría: la consulta es el nombre de la categoría (p. ej. "Humor y Estado
+  de Ánimo"); acierta si alguno de los k fragmentos contiene una pregunta de ella.
+
+El recuperador por defecto es TF-IDF local (sin API); con `--retriever openai` se
+usan los embeddings reales (consume cuota de OpenAI).
+
+Uso:
+    python benchmarks/bench_chunking.py materials/bancodepreguntas.txt --k 3
+    python benchmarks/bench_chunking.py materials/bancodepreguntas.txt --retriever openai --dimensions 3072
+"""
+
+import os
+import re
+import sys
+import math
+import argparse
+import statistics
+from collections import Counter
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.documents import Document
+from structured_splitter import StructuredTextSplitter, create_text_splitter
+from ingest_pipeline import token_counter
+
+QUESTION = re.compile(r'^\s*\d+[.)]\s+"?(.+?)"?\s*$')
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def load_documents(paths):
+    """Carga los archivos como Documents (PDF página a página)"""
+    documents = []
+    for path in paths:
+        if path.endswith('.pdf'):
+            from langchain_community.document_loaders import PyPDFLoader
+            documents.extend(PyPDFLoader(path).lazy_load())
+        else:
+            with open(path, encoding='utf-8') as f:
+                documents.append(Document(page_content=f.read(), metadata={'source': path}))
+    return documents
+
+
+def build_queries(documents):
+    """Consultas por pregunta y por categoría a partir de la estructura del texto"""
+    question_queries, category_queries = [], []
+    splitter = StructuredTextSplitter(chunk_size=10 ** 9)
+    for document in documents:
+        for path, units in splitter._sections(document.page_content):
+            questions = [m.group(1) for unit in units for m in [QUESTION.match(unit)] if m]
+            question_queries.extend((q, q) for q in questions)
+            if path and questions:
+                name = re.sub(r'^(CATEGORÍA\s+)?[A-Z]\d*[.:]\s*', '', splitter.category_name(path[-1]))
+                category_queries.append((name, questions))
+    return question_queries, category_queries
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+class TfidfRetriever:
+    """Recuperador léxico local: vectores TF-IDF normalizados y producto punto"""
+
+    def __init__(self, texts):
+        self.vocabulary = {}
+        counts = [Counter(tokenize(text)) for text in texts]
+        document_frequency = Counter(word for count in counts for word in count)
+        for word in document_frequency:
+            self.vocabulary[word] = len(self.vocabulary)
+        self.idf = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for word, df in document_frequency.items():
+            self.idf[self.vocabulary[word]] = math.log((1 + len(texts)) / (1 + df)) + 1
+        self.matrix = np.stack([self._vector(count) for count in counts])
+
+    def _vector(self, count):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for word, tf in count.items():
+            if word in self.vocabulary:
+                vector[self.vocabulary[word]] = tf * self.idf[self.vocabulary[word]]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def top_k(self, query, k):
+        scores = self.matrix @ self._vector(Counter(tokenize(query)))
+        return np.argsort(-scores)[:k]
+
+
+class EmbeddingRetriever:
+    """Recuperador con embeddings de OpenAI y similitud coseno"""
+
+    def __init__(self, texts, dimensions):
+        from langchain_openai import OpenAIEmbeddings
+        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large", dimensions=dimensions)
+        matrix = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def top_k(self, query, k):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return np.argsort(-(self.matrix @ (vector / np.linalg.norm(vector))))[:k]
+
+
+def hit_rate(retriever, texts, queries, k):
+    """Fracción de consultas con al menos un fragmento esperado entre los k primeros"""
+    if not queries:
+        return float('nan')
+    hits = 0
+    for query, expected in queries:
+        expected = [expected] if isinstance(expected, str) else expected
+        top = [texts[i] for i in retriever.top_k(query, k)]
+        hits += any(e in text for text in top for e in expected)
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de fragmentación para la carga de documentos")
+    parser.add_argument('files', nargs='*', default=[os.path.join(os.path.dirname(__file__), '..', 'materials', 'bancodepreguntas.txt')])
+    parser.add_argument('--k', type=int, default=3, help="Fragmentos recuperados por consulta")
+    parser.add_argument('--retriever', default='tfidf', choices=['tfidf', 'openai'])
+    parser.add_argument('--dimensions', type=int, default=3072, help="Dimensión de los vectores (tamaño del índice)")
+    args = parser.parse_args()
+
+    documents = load_documents(args.files)
+    question_queries, category_queries = build_queries(documents)
+    count_tokens = token_counter()
+    print(f"📊 {len(args.files)} archivo(s), {len(question_queries)} consultas por pregunta, "
+          f"{len(category_queries)} por categoría, k={args.k}, recuperador={args.retriever}")
+
+    for kind in ('recursive', 'structured'):
+        chunks = create_text_splitter(kind).split_documents(documents)
+        texts = [chunk.page_content for chunk in chunks]
+        lengths = [len(text) for text in texts]
+        tokens = sum(count_tokens(text) for text in texts)
+        # Cada vector ocupa dim * 4 bytes; el texto viaja en los metadatos de Pinecone
+        index_bytes = len(texts) * args.dimensions * 4 + sum(len(text.encode('utf-8')) for text in texts)
+        retriever = TfidfRetriever(texts) if args.retriever == 'tfidf' else EmbeddingRetriever(texts, args.dimensions)
+
+        print(f"\n🔹 {kind}")
+        print(f"   Fragmentos: {len(texts)} (media {statistics.mean(lengths):.0f} caracteres, "
+              f"mín {min(lengths)}, máx {max(lengths)})")
+        print(f"   Tokens a embeber: {tokens}")
+        print(f"   Tamaño del índice: {index_bytes / 1024:.1f} KiB")
+        print(f"   Acierto por pregunta@{args.k}: {hit_rate(retriever, texts, question_queries, args.k):.1%}")
+        print(f"   Acierto por categoría@{args.k}: {hit_rate(retriever, texts, category_queries, args.k):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark de dimensión de embeddings: recall@k y latencia con 3072, 1024 y 256
+
+Embebe una vez los fragmentos de los materiales y las preguntas del banco con
+text-embedding-3-large a 3072 dimensiones y obtiene las demás dimensiones
+acortando los vectores (lo mismo que hace la API con `dimensions`; con `--native`
+se piden a la API para comprobarlo). Los vectores quedan en el almacén local de
+embeddings, así que repetir el benchmark no vuelve a consumir cuota.
+
+Para cada dimensión reporta:
+- recall@k respecto de 3072: fracción de los k fragmentos que trae 3072 que
+  también trae la dimensión reducida;
+- acierto@k: fracción de preguntas cuyo fragmento (el que contiene la pregunta)
+  está entre los k primeros;
+- latencia de búsqueda por consulta (fuerza bruta local, p50/p95) y tamaño de los
+  vectores; con `--pad N` se agregan N vectores aleatorios para simular un índice
+  más grande.
+
+Uso:
+    python benchmarks/bench_embedding_dimensions.py materials/bancodepreguntas.txt --k 3
+    python benchmarks/bench_embedding_dimensions.py materials/bancodepreguntas.txt --pad 100000 --dimensions 3072 1024 256
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bench_chunking import load_documents, build_queries
+from structured_splitter import create_text_splitter
+from embedding_config import EMBEDDING_MODEL, NATIVE_DIMENSIONS, create_embeddings, shorten
+from embedding_store import EmbeddingStore
+from ingest_manifest import PROJECT_ROOT, content_hash
+
+
+def embed_cached(texts, dimensions, store_dir):
+    """Embeddings de `texts` a `dimensions`, reutilizando el almacén local"""
+    store = EmbeddingStore(store_dir, EMBEDDING_MODEL, dimensions)
+    hashes = [content_hash(text) for text in texts]
+    vectors = store.get_many(hashes)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        embeddings = create_embeddings(dimensions)
+        for start in range(0, len(missing), 500):
+            batch = missing[start:start + 500]
+            new_vectors = embeddings.embed_documents([texts[i] for i in batch])
+            store.put_many([hashes[i] for i in batch], new_vectors)
+            for i, vector in zip(batch, new_vectors):
+                vectors[i] = vector
+    print(f"   {len(texts) - len(missing)} vectores del almacén, {len(missing)} embebidos ({dimensions} dim)")
+    return shorten(vectors, dimensions)
+
+
+def search_latencies(matrix, queries, k):
+    """Top-k por producto punto (vectores normalizados) y latencia de cada consulta en ms"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        scores = matrix @ query
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(top)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recall@k y latencia por dimensión de embeddings")
+    parser.add_argument('files', nargs='*', default=[os.path.join(PROJECT_ROOT, 'materials', 'bancodepreguntas.txt')])
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[3072, 1024, 256])
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--pad', type=int, default=0, help="Vectores aleatorios extra para simular un índice más grande")
+    parser.add_argument('--native', action='store_true', help="Pedir cada dimensión a la API en lugar de acortar")
+    parser.add_argument('--store', default=os.getenv('INGEST_EMBEDDING_STORE', os.path.join(PROJECT_ROOT, 'materials', '.embeddings')),
+                        help="Directorio del almacén de embeddings")
+    args = parser.parse_args()
+
+    documents = load_documents(args.files)
+    chunks = [chunk.page_content for chunk in create_text_splitter().split_documents(documents)]
+    question_queries, _ = build_queries(documents)
+    questions = [query for query, _ in question_queries]
+    expected = [[i for i, chunk in enumerate(chunks) if question in chunk] for question in questions]
+    print(f"📊 {len(chunks)} fragmentos, {len(questions)} preguntas, k={args.k}, relleno={args.pad}")
+
+    base_chunks = embed_cached(chunks, NATIVE_DIMENSIONS, args.store)
+    base_queries = embed_cached(questions, NATIVE_DIMENSIONS, args.store)
+    rng = np.random.default_rng(0)
+    padding = shorten(rng.standard_normal((args.pad, NATIVE_DIMENSIONS), dtype=np.float32), NATIVE_DIMENSIONS) if args.pad else None
+
+    reference = None
+    for dimensions in sorted(args.dimensions, reverse=True):
+        if args.native and dimensions != NATIVE_DIMENSIONS:
+            chunk_vectors = embed_cached(chunks, dimensions, args.store)
+            query_vectors = embed_cached(questions, dimensions, args.store)
+        else:
+            chunk_vectors, query_vectors = shorten(base_chunks, dimensions), shorten(base_queries, dimensions)
+        matrix = chunk_vectors if padding is None else np.vstack([chunk_vectors, shorten(padding, dimensions)])
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+        search_latencies(matrix, query_vectors[:10], args.k)  # Calentamiento
+        results, latencies = search_latencies(matrix, query_vectors, args.k)
+        if reference is None:
+            reference = results
+        recall = statistics.mean(len(set(r) & set(ref)) / len(ref) for r, ref in zip(results, reference))
+        hits = statistics.mean(any(i in e for i in r) for r, e in zip(results, expected) if e)
+        ordered = sorted(latencies)
+
+        print(f"\n🔹 {dimensions} dimensiones")
+        print(f"   recall@{args.k} vs {max(args.dimensions)}: {recall:.1%}")
+        print(f"   Acierto@{args.k}: {hits:.1%}")
+        print(f"   Latencia de búsqueda: p50={statistics.median(ordered):.3f}ms "
+              f"p95={ordered[int(len(ordered) * 0.95) - 1]:.3f}ms")
+        print(f"   Vectores: {matrix.nbytes / 1024 / 1024:.1f} MiB ({dimensions * 4} bytes por vector)")
+
+
+if __name__ == "__main__":
+    main()
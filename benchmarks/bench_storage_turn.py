@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la parte de almacenamiento de un turno de conversación
+
+Reproduce, sin OpenAI ni Pinecone, las operaciones de UserManager y SessionManager
+que BotCore ejecuta en cada mensaje, con varios hilos concurrentes, y reporta
+turnos por segundo y latencia por turno.
+
+Uso:
+    python benchmarks/bench_storage_turn.py --backend sqlite --sqlite-path :memory: --users 50 --turns 20 --threads 8 [--write-behind]
+    DATABASE_URL=postgresql://... DATABASE_SSLMODE=disable python benchmarks/bench_storage_turn.py --backend postgres
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from storage_backend import create_storage_backend
+from session_manager import SessionManager
+from user_manager import UserManager
+from message_writer import MessageWriter
+
+USER_PREFIX = '__bench_turn_'
+
+
+def seed_users(db_manager, count):
+    """Crea los usuarios de prueba (la tabla users existe en SQLite; en Postgres debe existir)"""
+    names = [f"{USER_PREFIX}{i}" for i in range(count)]
+    p = placeholder(db_manager)
+    with db_manager.get_connection() as (conn, cursor):
+        for name in names:
+            cursor.execute(f"DELETE FROM users WHERE telegram_username = {p};", (name,))
+            cursor.execute(
+                f"INSERT INTO users (telegram_username, name, email, message_count) VALUES ({p}, {p}, {p}, 0);",
+                (name, name, f"{name}@example.com")
+            )
+        conn.commit()
+    return names
+
+
+def placeholder(db_manager):
+    """Marcador de parámetros del driver del backend"""
+    return '?' if type(db_manager).__name__ == 'SQLiteDatabaseManager' else '%s'
+
+
+def save_message(session_manager, session_id, message, is_user):
+    """Igual que BotCore._safe_add_message: encola si hay writer, si no escribe directo"""
+    if not session_manager.enqueue_message(session_id, message, is_user):
+        session_manager.add_message_to_history(session_id, message, is_user)
+
+
+def run_turn(user_manager, session_manager, name, turn):
+    """Operaciones de almacenamiento de un turno, en el mismo orden que BotCore"""
+    start = time.perf_counter()
+    user_info = user_manager.get_user_by_name(name)
+    session = session_manager.get_or_create_session(name, user_info)
+    user_manager.increment_message_count_by_name(name)
+    save_message(session_manager, session.session_id, f"mensaje {turn} de {name}", True)
+    user_manager.get_user(name)
+    session_manager.get_conversation_context(session.session_id, limit=5)
+    save_message(session_manager, session.session_id, f"respuesta {turn} para {name}", False)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de almacenamiento por turno")
+    parser.add_argument('--backend', default=os.getenv('STORAGE_BACKEND', 'sqlite'), choices=['sqlite', 'postgres'])
+    parser.add_argument('--sqlite-path', default=':memory:', help="Archivo SQLite (':memory:' por defecto)")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--turns', type=int, default=20, help="Turnos por usuario")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--write-behind', action='store_true', help="Persistir mensajes con MessageWriter")
+    args = parser.parse_args()
+
+    os.environ['SQLITE_PATH'] = args.sqlite_path
+    db_manager = create_storage_backend(args.backend)
+    user_manager = UserManager(db_manager)
+    session_manager = SessionManager(db_manager)
+    names = seed_users(db_manager, args.users)
+    message_writer = None
+    if args.write_behind:
+        message_writer = MessageWriter(session_manager.add_messages_to_history)
+        session_manager.set_message_writer(message_writer)
+
+    jobs = [(name, turn) for turn in range(args.turns) for name in names]
+    print(f"📊 Backend={args.backend} usuarios={args.users} turnos={len(jobs)} hilos={args.threads}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = list(pool.map(lambda job: run_turn(user_manager, session_manager, *job), jobs))
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    print(f"✅ {len(jobs) / elapsed:.1f} turnos/s en {elapsed:.2f}s")
+    print(f"⏱️ Latencia por turno: media={statistics.mean(ordered):.2f}ms "
+          f"p50={statistics.median(ordered):.2f}ms p95={ordered[int(len(ordered) * 0.95) - 1]:.2f}ms")
+
+    if message_writer:
+        message_writer.close()
+        print(f"💾 MessageWriter: {message_writer.stats()}")
+    session_manager.close()
+    user_manager.close()
+    db_manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,32 +5,29 @@ Script para ejecutar el bot SAÚ AI con interfaz web
 
 import sys
 import os
+import signal
 import logging
 
-# Configurar logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('web_bot.log')
-    ]
-)
-logger = logging.getLogger(__name__)
-
 # Agregar directorio src al path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+# Configurar logging: JSON en stdout y web_bot.log (con rotación), escrito desde un hilo de fondo
+from src.logging_setup import configure_logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
 def check_requirements():
     """Verifica que los requirements estén instalados"""
     try:
         import flask
         import flask_cors
         from dotenv import load_dotenv
+        load_dotenv()
         from pinecone import Pinecone
         import openai
         import langchain
-        import psycopg2
+        if os.getenv('STORAGE_BACKEND', 'postgres').lower() != 'sqlite':
+            import psycopg2
         return True
     except ImportError as e:
         logger.error(f"❌ Dependencia faltante: {e}")
@@ -42,7 +39,10 @@ def check_environment():
     from dotenv import load_dotenv
     load_dotenv()
     
-    required_vars = ['OPENAI_API_KEY', 'PINECONE_API_KEY', 'DATABASE_URL']
+    required_vars = ['OPENAI_API_KEY', 'PINECONE_API_KEY']
+    # DATABASE_URL solo es necesaria con el backend PostgreSQL
+    if os.getenv('STORAGE_BACKEND', 'postgres').lower() != 'sqlite':
+        required_vars.append('DATABASE_URL')
     missing_vars = []
     
     for var in required_vars:
@@ -73,13 +73,17 @@ def main():
         sys.exit(1)
     logger.info("✅ Variables de entorno verificadas")
     
-    # Inicializar DatabaseManager, UserManager y SessionManager
+    # SIGTERM (Railway al redeployar) debe pasar por el finally para escribir lo pendiente
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # Inicializar backend de almacenamiento, UserManager y SessionManager
     db_manager = None
+    web_handler = None
     try:
-        logger.info("📦 Inicializando DatabaseManager...")
-        from src.database_manager import DatabaseManager
-        db_manager = DatabaseManager()
-        logger.info("✅ DatabaseManager inicializado y tablas verificadas/creadas.")
+        logger.info(f"📦 Inicializando backend de almacenamiento ({os.getenv('STORAGE_BACKEND', 'postgres')})...")
+        from src.storage_backend import create_storage_backend
+        db_manager = create_storage_backend()
+        logger.info("✅ Backend de almacenamiento inicializado y tablas verificadas/creadas.")
         
         logger.info("👨‍💻 Inicializando UserManager...")
         from src.user_manager import UserManager
@@ -121,6 +125,8 @@ def main():
         logger.error("💡 Revisa los logs arriba para más detalles")
         sys.exit(1)
     finally:
+        if web_handler:
+            web_handler.close()
         if db_manager:
             db_manager.close()
             logger.info("🔌 Conexión a la base de datos cerrada.")
@@ -1,4 +1,3 @@
-from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from dotenv import load_dotenv
 import os
@@ -6,23 +5,27 @@ from pinecone import Pinecone
 from langchain import PromptTemplate
 from langchain.chains import RetrievalQA
 from langchain_openai import ChatOpenAI
+from metrics import STAGE_LATENCY, timed
+from tracing import span, traced
+from embedding_config import EMBEDDING_MODEL, create_embeddings, embedding_dimensions, index_name_for
 
 
 class SauAI:
-    def __init__(self, index_name="sauai"):
+    def __init__(self, index_name=None):
         """
         Inicializa Saú AI - Asistente especializado en vida saludable y salud preventiva
         
         Args:
-            index_name (str): sauai
+            index_name (str): Índice de Pinecone (por defecto el de EMBEDDING_DIMENSIONS:
+                sauai para 3072, sauai-<dim> para las demás)
         """
         load_dotenv()
-        self.index_name = index_name
+        self.embedding_dimensions = embedding_dimensions()
+        self.index_name = index_name or index_name_for(self.embedding_dimensions)
+        self.search_k = 3  # Fragmentos recuperados por pregunta
         
-        # Inicializar embeddings (necesario para consultas)
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-large"
-        )
+        # Inicializar embeddings (necesario para consultas), con la misma dimensión que la carga
+        self.embeddings = create_embeddings(self.embedding_dimensions)
         
         # Inicializar Pinecone
         pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
@@ -31,6 +34,10 @@ class SauAI:
         if self.index_name not in pc.list_indexes().names():
             raise ValueError(f"El índice '{self.index_name}' no existe en Pinecone. "
                            f"Ejecuta context_upload.py primero para crear y poblar el índice.")
+        index_dimension = pc.describe_index(self.index_name).dimension
+        if index_dimension != self.embedding_dimensions:
+            raise ValueError(f"El índice '{self.index_name}' es de dimensión {index_dimension} y "
+                             f"EMBEDDING_DIMENSIONS es {self.embedding_dimensions}.")
         
         # Conectar al vector store existente
         self.docsearch = PineconeVectorStore(
@@ -576,15 +583,51 @@ class SauAI:
         Answer:
         """
         
-        prompt = PromptTemplate(template=template, input_variables=["context", "question"])
+        self.prompt = PromptTemplate(template=template, input_variables=["context", "question"])
         
         # Crear cadena RAG
         self.rag_chain = RetrievalQA.from_chain_type(
             self.llm, 
-            retriever=self.docsearch.as_retriever(search_kwargs={"k": 3}), 
-            chain_type_kwargs={"prompt": prompt}
+            retriever=self.docsearch.as_retriever(search_kwargs={"k": self.search_k}), 
+            chain_type_kwargs={"prompt": self.prompt}
         )
     
+    def retrieve(self, query):
+        """
+        Recupera los fragmentos más relevantes para una consulta (embedding + búsqueda vectorial)
+        
+        Se puede llamar por separado de generate() para adelantar la búsqueda
+        mientras se prepara el resto del contexto.
+        
+        Args:
+            query (str): Texto de búsqueda (normalmente el mensaje del usuario)
+            
+        Returns:
+            list: Documentos recuperados de Pinecone
+        """
+        with span("sau_ai.embedding"), STAGE_LATENCY.time(stage="embedding"):
+            query_embedding = self.embeddings.embed_query(query)
+        with span("sau_ai.vector_search", k=self.search_k), STAGE_LATENCY.time(stage="vector_search"):
+            return self.docsearch.similarity_search_by_vector(query_embedding, k=self.search_k)
+    
+    @timed("llm")
+    @traced("sau_ai.generate")
+    def generate(self, question, documents):
+        """
+        Genera la respuesta con el LLM a partir de fragmentos ya recuperados
+        
+        Args:
+            question (str): Pregunta (puede incluir contexto del usuario)
+            documents (list): Documentos devueltos por retrieve()
+            
+        Returns:
+            str: Respuesta de Saú AI
+        """
+        # Mismo formato que la cadena "stuff" de RetrievalQA
+        context = "\n\n".join(doc.page_content for doc in documents)
+        result = self.llm.invoke(self.prompt.format(context=context, question=question))
+        return result.content
+    
     def ask(self, question):
         """
         Hace una pregunta a Saú AI
@@ -619,9 +662,10 @@ class SauAI:
         """
         return {
             "index_name": self.index_name,
-            "embedding_model": "text-embedding-3-large",
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_dimensions": self.embedding_dimensions,
             "chat_model": "gpt-5-mini-2025-08-07", 
-            "search_k": 3,
+            "search_k": self.search_k,
             "bot_name": "Saú AI",
             "specialty": "Asistente especializado en vida saludable y salud preventiva"
         }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Admission - Control de admisión y backpressure para endpoints costosos
+
+Limita cuántas peticiones se procesan a la vez y cuántas pueden esperar turno.
+Cuando la cola está llena o la espera supera el límite, la petición se rechaza
+de inmediato con una estimación de cuándo reintentar, en lugar de acumular hilos
+hasta que todas fallen por timeout.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """La petición no fue admitida por sobrecarga"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Petición rechazada ({reason}), reintentar en {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Semáforo con cola acotada, timeout de espera y métricas"""
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        max_queue: int = None,
+        queue_timeout: float = None,
+        name: str = "chat"
+    ):
+        """
+        Args:
+            max_concurrency: Peticiones procesándose a la vez (CHAT_MAX_CONCURRENCY, por defecto 8)
+            max_queue: Peticiones que pueden esperar turno (CHAT_MAX_QUEUE, por defecto 32)
+            queue_timeout: Segundos máximos de espera en cola (CHAT_QUEUE_TIMEOUT, por defecto 10)
+            name: Nombre usado en los logs
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("CHAT_MAX_CONCURRENCY", 8))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("CHAT_MAX_QUEUE", 32))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv("CHAT_QUEUE_TIMEOUT", 10))
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+
+        # Estadísticas
+        self._admitted = 0
+        self._rejected_queue_full = 0
+        self._rejected_timeout = 0
+        self._total_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+        self._last_wait_ms = 0.0
+        self._avg_service_s = 0.0
+
+    @contextmanager
+    def admit(self):
+        """Reserva un turno durante el bloque; lanza AdmissionRejected si no hay capacidad"""
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def _acquire(self):
+        queued_at = time.perf_counter()
+        with self._cond:
+            if self._active >= self.max_concurrency or self._waiting:
+                if self._waiting >= self.max_queue:
+                    self._rejected_queue_full += 1
+                    retry_after = self._retry_after()
+                    logger.warning(f"⚠️ Admisión '{self.name}': cola llena ({self._waiting}), reintentar en {retry_after}s")
+                    raise AdmissionRejected("queue_full", retry_after)
+
+                self._waiting += 1
+                try:
+                    deadline = queued_at + self.queue_timeout
+                    while self._active >= self.max_concurrency:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self._rejected_timeout += 1
+                            retry_after = self._retry_after()
+                            logger.warning(f"⚠️ Admisión '{self.name}': espera agotada tras {self.queue_timeout}s")
+                            raise AdmissionRejected("queue_timeout", retry_after)
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._active += 1
+            self._admitted += 1
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            self._last_wait_ms = wait_ms
+            self._total_wait_ms += wait_ms
+            self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+
+    def _release(self, service_s: float):
+        with self._cond:
+            self._active -= 1
+            # Media móvil del tiempo de servicio para estimar Retry-After
+            if self._avg_service_s:
+                self._avg_service_s = 0.9 * self._avg_service_s + 0.1 * service_s
+            else:
+                self._avg_service_s = service_s
+            self._cond.notify()
+
+    def _retry_after(self) -> int:
+        """Segundos estimados hasta que se libere capacidad para la cola actual"""
+        rounds = (self._waiting + 1) / self.max_concurrency
+        return max(1, min(60, math.ceil(self._avg_service_s * rounds)))
+
+    def stats(self) -> Dict:
+        """Estado actual y acumulado del control de admisión"""
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_timeout_s": self.queue_timeout,
+                "active": self._active,
+                "queue_depth": self._waiting,
+                "admitted": self._admitted,
+                "rejected_queue_full": self._rejected_queue_full,
+                "rejected_timeout": self._rejected_timeout,
+                "last_wait_ms": round(self._last_wait_ms, 2),
+                "avg_wait_ms": round(self._total_wait_ms / self._admitted, 2) if self._admitted else 0.0,
+                "max_wait_ms": round(self._max_wait_ms, 2),
+                "avg_service_ms": round(self._avg_service_s * 1000, 2),
+            }
@@ -9,11 +9,15 @@ import asyncio
 import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
 from RAG_ChatBot import SauAI
+from pipeline import StageGraph
+from executors import create_executor
+from metrics import ERRORS, PIPELINE_STAGE_LATENCY
+from tracing import span, add_event, get_request_id
 from session_manager import SessionManager
+from message_writer import MessageWriter
 from user_manager import UserManager, UserInfo
 
 # Configurar logging
@@ -62,8 +66,20 @@ class BotCore:
         self.session_manager = session_manager
         self.user_manager = user_manager
         
-        # Inicializar ThreadPoolExecutor para procesamiento concurrente
-        self.executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="BotCore-")
+        # Pools separados por tipo de trabajo: las llamadas lentas al LLM no pueden
+        # acaparar los hilos que necesitan las operaciones rápidas de base de datos
+        self.db_executor = create_executor("BotCore-DB", "BOTCORE_DB_WORKERS", 10)
+        self.retrieval_executor = create_executor("BotCore-Retrieval", "BOTCORE_RETRIEVAL_WORKERS", 8)
+        self.llm_executor = create_executor("BotCore-LLM", "BOTCORE_LLM_WORKERS", 8)
+        self.executors = {
+            "db": self.db_executor,
+            "retrieval": self.retrieval_executor,
+            "llm": self.llm_executor
+        }
+        
+        # Persistencia diferida de mensajes: la respuesta no espera a estas escrituras
+        self.message_writer = MessageWriter(self.session_manager.add_messages_to_history)
+        self.session_manager.set_message_writer(self.message_writer)
         
         logger.info("✅ BotCore inicializado correctamente")
     
@@ -71,48 +87,100 @@ class BotCore:
         """
         Procesa un mensaje de forma genérica, independiente de la plataforma
         
+        Las etapas se ejecutan como grafo de dependencias: la búsqueda en Pinecone
+        arranca en cuanto llega el mensaje, en paralelo con la sesión y el perfil,
+        y solo la generación espera a que todo el contexto esté listo.
+        
+            retrieval ──────────────────────────────────┐
+            profile ────────────────────────────────────┤
+            session ─┬─ count                           ├─ generation ─ save_reply
+                     └─ save_user_message ─ history ────┘
+        
         Args:
             message_input: Datos del mensaje en formato genérico
             
         Returns:
             MessageResponse: Respuesta en formato genérico
         """
+        graph = StageGraph()
         try:
             logger.info(f"🔄 Procesando mensaje de {message_input.username} desde {message_input.origin}")
+            name = message_input.username  # name del usuario
+            user_message = message_input.message
+            
+            # Búsqueda semántica con el mensaje tal cual llega (no necesita la base de datos)
+            graph.add("retrieval", lambda: self._safe_retrieve(user_message))
+            
+            # Datos de perfil para personalizar la respuesta
+            graph.add("profile", lambda: self._safe_get_user_info(name))
             
             # 1. Obtener o crear sesión del usuario (usando name)
-            user_session = await self._safe_session_operation(message_input.username)
+            graph.add("session", lambda: self._safe_session_operation(name))
             
             # 2. Incrementar contador de mensajes del usuario (usando name)
-            await self._safe_increment_message_count_by_name(message_input.username)
+            graph.add(
+                "count",
+                lambda session: self._safe_increment_message_count_by_name(name),
+                deps=["session"]
+            )
             
             # 3. Guardar mensaje del usuario en historial
-            await self._safe_add_message(user_session.session_id, message_input.message, is_user=True)
+            graph.add(
+                "save_user_message",
+                lambda session: self._safe_add_message(session.session_id, user_message, is_user=True),
+                deps=["session"]
+            )
+            
+            # 4. Contexto de conversación reciente (incluye el mensaje recién guardado)
+            graph.add(
+                "history",
+                lambda session, save_user_message: self._safe_get_conversation_context(session.session_id),
+                deps=["session", "save_user_message"]
+            )
+            
+            # 5. Generar respuesta con SauAI
+            graph.add(
+                "generation",
+                lambda retrieval, profile, history: self._safe_generate(
+                    name,
+                    self._build_enhanced_question(profile, history, user_message),
+                    retrieval
+                ),
+                deps=["retrieval", "profile", "history"]
+            )
             
-            # 4. Procesar mensaje con SauAI (usando name directamente)
-            response_content = await self._safe_process_with_sauai(
-                message_input.username,  # name del usuario
-                user_session.session_id, 
-                message_input.message
+            # 6. Guardar respuesta en historial
+            graph.add(
+                "save_reply",
+                lambda session, generation: self._safe_add_message(session.session_id, generation, is_user=False),
+                deps=["session", "generation"]
             )
             
-            # 5. Guardar respuesta en historial
-            await self._safe_add_message(user_session.session_id, response_content, is_user=False)
+            with span("bot_core.process_message", origin=message_input.origin):
+                results = await graph.run()
+            user_session = results["session"]
+            response_content = results["generation"]
+            logger.info(f"⏱️ Etapas para {name}: {graph.timings}")
+            for stage, elapsed_ms in graph.timings.items():
+                PIPELINE_STAGE_LATENCY.observe(elapsed_ms / 1000, stage=stage)
             
-            # 6. Retornar respuesta genérica
+            # 7. Retornar respuesta genérica
             return MessageResponse(
                 content=response_content,
                 response_type="text",
                 metadata={
                     "session_id": str(user_session.session_id),
-                    "name": message_input.username,  # name del usuario
+                    "name": name,  # name del usuario
                     "origin": message_input.origin,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "request_id": get_request_id(),
+                    "stage_timings_ms": graph.timings
                 }
             )
             
         except Exception as e:
             logger.error(f"❌ Error procesando mensaje de {message_input.username}: {e}")
+            ERRORS.inc(stage="process_message", type=type(e).__name__)
             return MessageResponse(
                 content="❌ Lo siento, ocurrió un error al procesar tu pregunta. Por favor, intenta nuevamente.",
                 response_type="error",
@@ -120,7 +188,9 @@ class BotCore:
                     "error": str(e),
                     "name": message_input.username,  # name del usuario
                     "origin": message_input.origin,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now().isoformat(),
+                    "request_id": get_request_id(),
+                    "stage_timings_ms": graph.timings
                 }
             )
     
@@ -132,7 +202,7 @@ class BotCore:
                 
                 # Obtener usuario por name (debe existir en users)
                 user_info = await loop.run_in_executor(
-                    self.executor,
+                    self.db_executor,
                     self.user_manager.get_user_by_name,
                     name
                 )
@@ -141,14 +211,21 @@ class BotCore:
                     raise Exception(f"Usuario con name '{name}' no encontrado en la tabla users")
                 
                 # Obtener o crear sesión
-                return await loop.run_in_executor(
-                    self.executor,
+                user_session = await loop.run_in_executor(
+                    self.db_executor,
                     self.session_manager.get_or_create_session,
                     name,
                     user_info
                 )
                 
+                # Una sesión nueva reescribe users.session_id: descartar el UserInfo cacheado
+                if str(user_session.session_id) != str(user_info.session_id):
+                    self.user_manager.invalidate_user(name=name)
+                
+                return user_session
+                
             except Exception as e:
+                add_event("retry", attempt=attempt + 1, error=f"{type(e).__name__}: {e}")
                 if attempt < 2:
                     logger.warning(f"⚠️ Intento {attempt + 1} fallido para operación de sesión: {e}")
                     await asyncio.sleep(1)
@@ -157,13 +234,16 @@ class BotCore:
                     raise
 
     async def _safe_add_message(self, session_id: uuid.UUID, message: str, is_user: bool = True):
-        """Operación segura para agregar mensaje con reintentos"""
+        """Encola el mensaje en el writer de fondo; si no es posible, lo escribe con reintentos"""
+        if self.session_manager.enqueue_message(session_id, message, is_user):
+            return
+        
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 loop = asyncio.get_event_loop()
                 await loop.run_in_executor(
-                    self.executor,
+                    self.db_executor,
                     self.session_manager.add_message_to_history,
                     session_id,
                     message,
@@ -183,7 +263,7 @@ class BotCore:
             try:
                 loop = asyncio.get_event_loop()
                 await loop.run_in_executor(
-                    self.executor,
+                    self.db_executor,
                     self.user_manager.increment_message_count,
                     username
                 )
@@ -201,7 +281,7 @@ class BotCore:
             try:
                 loop = asyncio.get_event_loop()
                 await loop.run_in_executor(
-                    self.executor,
+                    self.db_executor,
                     self.user_manager.increment_message_count_by_name,
                     name
                 )
@@ -219,7 +299,7 @@ class BotCore:
             try:
                 loop = asyncio.get_event_loop()
                 return await loop.run_in_executor(
-                    self.executor,
+                    self.db_executor,
                     self.user_manager.get_user,
                     username
                 )
@@ -229,73 +309,98 @@ class BotCore:
                     raise
                 await asyncio.sleep(1)  # Esperar antes del siguiente intento
 
-    async def _safe_process_with_sauai(self, username: str, session_id: uuid.UUID, user_message: str) -> str:
-        """Procesa un mensaje con SauAI de forma segura con timeout y reintentos"""
+    async def _safe_get_conversation_context(self, session_id: uuid.UUID, limit: int = 5) -> str:
+        """Obtiene el contexto de conversación reciente (la cache de sesiones suele evitar la base)"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.db_executor,
+            self.session_manager.get_conversation_context,
+            session_id,
+            limit
+        )
+
+    async def _safe_retrieve(self, query: str):
+        """
+        Recupera fragmentos de Pinecone para el mensaje
+        
+        Returns:
+            list | None: Documentos, o None si falló (la generación reintentará la búsqueda)
+        """
+        try:
+            loop = asyncio.get_event_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.retrieval_executor, self.sau_ai.retrieve, query),
+                timeout=30
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Falló la búsqueda anticipada en Pinecone, se reintentará en la generación: {e}")
+            ERRORS.inc(stage="retrieval", type=type(e).__name__)
+            return None
+
+    async def _safe_generate(self, username: str, question: str, documents) -> str:
+        """Genera la respuesta con SauAI de forma segura con timeout y reintentos"""
         max_retries = 2
         for attempt in range(max_retries):
             try:
                 loop = asyncio.get_event_loop()
                 response = await asyncio.wait_for(
                     loop.run_in_executor(
-                        self.executor,
-                        self._process_with_sauai,
-                        username,
-                        session_id,
-                        user_message
+                        self.llm_executor,
+                        self._generate_with_sauai,
+                        question,
+                        documents
                     ),
                     timeout=60
                 )
                 return response
             except asyncio.TimeoutError:
                 logger.warning(f"⚠️ Timeout en intento {attempt + 1} para usuario {username}")
+                ERRORS.inc(stage="generation", type="TimeoutError")
+                add_event("timeout", attempt=attempt + 1)
                 if attempt == max_retries - 1:
                     return "❌ Lo siento, el procesamiento está tomando demasiado tiempo. Por favor, intenta con una pregunta más simple."
             except Exception as e:
                 logger.warning(f"⚠️ Error en intento {attempt + 1} para usuario {username}: {e}")
+                ERRORS.inc(stage="generation", type=type(e).__name__)
+                add_event("retry", attempt=attempt + 1, error=f"{type(e).__name__}: {e}")
                 if attempt == max_retries - 1:
                     return "❌ Lo siento, ocurrió un error al procesar tu pregunta. Por favor, intenta nuevamente."
                 await asyncio.sleep(2)  # Esperar antes del siguiente intento
+                documents = None  # Repetir también la búsqueda
 
-    def _process_with_sauai(self, username: str, session_id: uuid.UUID, user_message: str) -> str:
+    def _generate_with_sauai(self, question: str, documents) -> str:
+        """Llama al LLM; si no hay documentos de la búsqueda anticipada, busca con la pregunta completa"""
+        if documents is None:
+            documents = self.sau_ai.retrieve(question)
+        return self.sau_ai.generate(question, documents)
+
+    def _build_enhanced_question(self, user_info: Optional[UserInfo], conversation_context: str, user_message: str) -> str:
         """
-        Procesa un mensaje con SauAI - LÓGICA CENTRAL EXTRAÍDA DE TELEGRAM_BOT.PY
+        Construye la pregunta enriquecida con el contexto del usuario - LÓGICA CENTRAL EXTRAÍDA DE TELEGRAM_BOT.PY
         
         Esta es la lógica de negocio principal que se mantiene igual independientemente
         de si el mensaje viene de Telegram, web, o cualquier otra plataforma.
         """
-        try:
-            # Obtener información básica del usuario para contexto desde UserManager
-            user_info = self.user_manager.get_user(username)
-            
-            # Crear contexto mínimo y natural
-            context_parts = []
-            
-            if user_info and user_info.personal_name:
-                context_parts.append(f"El usuario se llama {user_info.personal_name}")
-            
-            if user_info and user_info.age:
-                context_parts.append(f"tiene {user_info.age} años")
-            
-            if user_info and user_info.user_needs:
-                context_parts.append(f"sus objetivos son: {user_info.user_needs}")
-            
-            # Obtener contexto de conversación reciente usando session_id
-            conversation_context = self.session_manager.get_conversation_context(session_id, limit=5)
-            
-            if context_parts or conversation_context:
-                context_info = ". ".join(context_parts) if context_parts else ""
-                full_context = f"{context_info}\n\nConversación reciente:\n{conversation_context}" if conversation_context else context_info
-                enhanced_question = f"Contexto: {full_context}\n\nPregunta: {user_message}"
-            else:
-                enhanced_question = user_message
-            
-            # Procesar con SauAI
-            response = self.sau_ai.ask(enhanced_question)
-            return response
-            
-        except Exception as e:
-            logger.error(f"❌ Error procesando con SauAI para usuario {username}: {e}")
-            return "❌ Lo siento, ocurrió un error al procesar tu pregunta. Por favor, intenta nuevamente."
+        # Crear contexto mínimo y natural (UserInfo no siempre trae estos campos)
+        context_parts = []
+        
+        personal_name = getattr(user_info, 'personal_name', None)
+        if personal_name:
+            context_parts.append(f"El usuario se llama {personal_name}")
+        
+        age = getattr(user_info, 'age', None)
+        if age:
+            context_parts.append(f"tiene {age} años")
+        
+        user_needs = getattr(user_info, 'user_needs', None)
+        if user_needs:
+            context_parts.append(f"sus objetivos son: {user_needs}")
+        
+        if context_parts or conversation_context:
+            context_info = ". ".join(context_parts) if context_parts else ""
+            full_context = f"{context_info}\n\nConversación reciente:\n{conversation_context}" if conversation_context else context_info
+            return f"Contexto: {full_context}\n\nPregunta: {user_message}"
+        return user_message
     
     def get_typing_response(self, duration: int = 3) -> MessageResponse:
         """
@@ -329,13 +434,37 @@ class BotCore:
             metadata={"timestamp": datetime.now().isoformat()}
         )
     
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas internas de BotCore para monitoreo
+        
+        Returns:
+            Dict: Estado de la cola de persistencia, de las caches y de los pools de hilos
+        """
+        return {
+            "message_writer": self.message_writer.stats(),
+            "session_cache": self.session_manager.cache_stats(),
+            "user_cache": self.user_manager.cache_stats(),
+            "executors": {name: executor.stats() for name, executor in self.executors.items()},
+            "db_pool": self.session_manager.db_manager.pool_stats()
+        }
+    
     def cleanup(self):
         """Limpia recursos al cerrar el bot"""
         logger.info("🧹 Limpiando recursos de BotCore...")
         try:
-            if hasattr(self, 'executor') and self.executor:
-                self.executor.shutdown(wait=True, cancel_futures=True)
-                logger.info("✅ ThreadPoolExecutor de BotCore cerrado correctamente")
+            if hasattr(self, 'message_writer') and self.message_writer:
+                # Escribir los mensajes pendientes antes de cerrar la base de datos
+                self.message_writer.close()
+            if hasattr(self, 'session_manager') and self.session_manager:
+                # Escribir los last_activity acumulados
+                self.session_manager.close()
+            if hasattr(self, 'user_manager') and self.user_manager:
+                # Escribir los contadores de mensajes acumulados
+                self.user_manager.close()
+            for name, executor in getattr(self, 'executors', {}).items():
+                executor.shutdown(wait=True, cancel_futures=True)
+                logger.info(f"✅ Pool '{name}' de BotCore cerrado correctamente")
         except Exception as e:
             logger.error(f"❌ Error durante cleanup de BotCore: {e}")
 
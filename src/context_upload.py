@@ -5,41 +5,146 @@ Este módulo maneja la carga, splitting, embedding y almacenamiento de documento
 """
 
 from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from dotenv import load_dotenv
 import os
+import json
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pinecone import Pinecone, ServerlessSpec
+from ingest_manifest import IngestManifest, PROJECT_ROOT, source_key, content_hash, chunk_id
+from ingest_pipeline import IngestPipeline
+from embedding_store import EmbeddingStore
+from structured_splitter import create_text_splitter
+from near_dedup import NearDuplicateFilter, load_signatures, save_signatures
+from index_snapshot import IndexSnapshot, export_index, import_snapshot, list_index_ids, fetch_vectors
+from embedding_config import EMBEDDING_MODEL, create_embeddings, embedding_dimensions, index_name_for, shorten
+
+def loader_for(file_path):
+    """Loader de langchain según la extensión del archivo"""
+    if file_path.endswith('.pdf'):
+        from langchain_community.document_loaders import PyPDFLoader
+        return PyPDFLoader(file_path)
+    from langchain_community.document_loaders import TextLoader
+    return TextLoader(file_path)
+
+def prepare_chunks(docs):
+    """Metadatos para el ID determinista y la sincronización con el manifiesto"""
+    for doc in docs:
+        doc.metadata['source'] = source_key(doc.metadata.get('source', ''))
+        doc.metadata['chunk_hash'] = content_hash(doc.page_content)
+    return docs
+
+# Splitter de cada proceso del pool de parseo (lo fija el initializer)
+_worker_splitter = None
+
+def _init_chunk_worker(text_splitter):
+    global _worker_splitter
+    _worker_splitter = text_splitter
+
+def _chunk_file(file_path):
+    """
+    Lee y divide un archivo completo dentro de un proceso del pool (solo archivos
+    de hasta INGEST_PARALLEL_MAX_BYTES: el resultado viaja entero al proceso principal)
+
+    Returns:
+        tuple: (fragmentos, páginas, error o None)
+    """
+    chunks, pages = [], 0
+    try:
+        for page in loader_for(file_path).lazy_load():
+            pages += 1
+            chunks.extend(prepare_chunks(_worker_splitter.split_documents([page])))
+        return chunks, pages, None
+    except Exception as e:
+        return [], pages, f"{type(e).__name__}: {e}"
 
 class DocumentProcessor:
     """Clase para procesar y subir documentos a Pinecone"""
     
-    def __init__(self, index_name="sauai"):
+    def __init__(self, index_name=None, workers=None, dedup_threshold=None, dimensions=None):
         """
         Inicializa el procesador de documentos
         
         Args:
-            index_name (str): Nombre del índice en Pinecone
+            index_name (str): Nombre del índice en Pinecone (por defecto el de la
+                dimensión: sauai para 3072, sauai-<dim> para las demás)
+            workers (int): Procesos para leer y dividir archivos en paralelo
+                (INGEST_WORKERS, por defecto un proceso por núcleo; 1 = sin pool)
+                Los archivos de más de INGEST_PARALLEL_MAX_BYTES (8 MiB) se leen
+                siempre página a página en el proceso principal
+            dedup_threshold (float): Similitud a partir de la cual se descarta un fragmento
+                casi duplicado (INGEST_DEDUP_THRESHOLD, por defecto 0.9; 0 = desactivado)
+            dimensions (int): Dimensión de los embeddings (por defecto EMBEDDING_DIMENSIONS)
         """
         load_dotenv()
-        self.index_name = index_name
+        self.dimensions = dimensions or embedding_dimensions()
+        self.index_name = index_name or index_name_for(self.dimensions)
+        index_name = self.index_name
+        self.workers = max(1, workers or int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1)))
+        # spawn: el pool se crea mientras corren los hilos del pipeline, y fork con hilos no es seguro
+        self.mp_context = multiprocessing.get_context('spawn')
+        self.parallel_max_bytes = int(os.getenv('INGEST_PARALLEL_MAX_BYTES', 8 * 1024 * 1024))
+        self._pool = None  # Pool de parseo, creado en el primer uso y reutilizado (ver close)
         
-        # Inicializar embeddings
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-large"
-        )
+        # Inicializar embeddings (misma dimensión que SauAI, ver embedding_config)
+        self.embeddings = create_embeddings(self.dimensions)
         
         # Inicializar Pinecone
         self.pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
         
-        # Configurar text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=300,  # Reducir de 500 a 300
-            chunk_overlap=30,  # Reducir de 50 a 30
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # Configurar text splitter (INGEST_CHUNKER: structured o recursive)
+        self.text_splitter = create_text_splitter()
+        
+        # Manifiesto local de fragmentos indexados (IDs deterministas por archivo + contenido);
+        # `{index}` en INGEST_MANIFEST_PATH se reemplaza por el nombre del índice
+        manifest_path = os.getenv(
+            'INGEST_MANIFEST_PATH',
+            os.path.join(PROJECT_ROOT, 'materials', '.ingest_manifest_{index}.json')
+        ).replace('{index}', index_name)
+        self.manifest = IngestManifest(manifest_path, index_name)
+        
+        # Vectores ya calculados, por hash de contenido (vacío = desactivado)
+        store_dir = os.getenv('INGEST_EMBEDDING_STORE', os.path.join(PROJECT_ROOT, 'materials', '.embeddings'))
+        self.embedding_store = EmbeddingStore(store_dir, EMBEDDING_MODEL, self.dimensions) if store_dir else None
+        
+        # Casi duplicados: firmas MinHash de lo indexado, para comparar entre cargas
+        self.dedup_threshold = float(os.getenv('INGEST_DEDUP_THRESHOLD', 0.9)) if dedup_threshold is None else dedup_threshold
+        self.last_sync = {}
+        self.signatures_path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), f'.ingest_minhash_{index_name}.npz')
+    
+    def file_fingerprint(self, file_path):
+        """
+        Huella de un archivo: su contenido más la configuración de fragmentación
+        
+        Si no cambió desde la última carga, sus fragmentos tampoco. Incluye el umbral
+        de casi duplicados porque cambia qué fragmentos se conservan.
+        """
+        digest = hashlib.sha256()
+        splitter = self.text_splitter
+        digest.update(f"{type(splitter).__name__}:{splitter._chunk_size}:{splitter._chunk_overlap}:"
+                      f"{self.dedup_threshold}\n".encode("utf-8"))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def iter_pages(self, file_path):
+        """
+        Recorre un documento página a página sin cargarlo entero
+        
+        Args:
+            file_path (str): Ruta al archivo
+            
+        Yields:
+            Document: Una página (PDF) o el archivo completo (texto)
+        """
+        yield from loader_for(file_path).lazy_load()
     
     def load_document(self, file_path):
         """
@@ -52,14 +157,7 @@ class DocumentProcessor:
             list: Lista de documentos cargados
         """
         try:
-            if file_path.endswith('.pdf'):
-                from langchain_community.document_loaders import PyPDFLoader
-                loader = PyPDFLoader(file_path)
-            else:
-                from langchain_community.document_loaders import TextLoader
-                loader = TextLoader(file_path)
-            
-            documents = loader.load()
+            documents = list(self.iter_pages(file_path))
             print(f"✅ Documento cargado: {file_path}")
             return documents
         except Exception as e:
@@ -79,14 +177,126 @@ class DocumentProcessor:
         if not documents:
             return []
             
-        docs = self.text_splitter.split_documents(documents)
+        docs = prepare_chunks(self.text_splitter.split_documents(documents))
         print(f"✅ Documentos divididos en {len(docs)} fragmentos")
         return docs
     
-    def create_or_get_index(self):
+    def iter_chunks(self, file_paths, failed_sources):
+        """
+        Genera los fragmentos de varios archivos página a página
+        
+        Cada página se divide apenas se lee y sus fragmentos pasan al pipeline, así
+        que en memoria solo hay unas pocas páginas a la vez (los fragmentos no cruzan
+        de una página a otra). Un archivo que falla a mitad de lectura se anota en
+        `failed_sources` para no borrar ni registrar sus fragmentos.
+        
+        Args:
+            file_paths (list): Archivos a recorrer
+            failed_sources (set): Se agregan los orígenes que no se pudieron leer
+            
+        Yields:
+            Document: Fragmentos con metadatos `source` y `chunk_hash`
+        """
+        small = [file_path for file_path in file_paths if self._fits_in_worker(file_path)]
+        if self.workers > 1 and len(small) > 1:
+            yield from self._iter_chunks_parallel(file_paths, failed_sources)
+            return
+        
+        for file_path in file_paths:
+            yield from self._iter_file_chunks(file_path, failed_sources)
+    
+    def _iter_file_chunks(self, file_path, failed_sources):
+        """Fragmentos de un archivo, leído y dividido página a página en este proceso"""
+        pages = chunks = 0
+        try:
+            for page in self.iter_pages(file_path):
+                pages += 1
+                page_chunks = prepare_chunks(self.text_splitter.split_documents([page]))
+                chunks += len(page_chunks)
+                yield from page_chunks
+            print(f"✅ Documento leído: {file_path} ({pages} páginas, {chunks} fragmentos)")
+        except Exception as e:
+            print(f"❌ Error al cargar {file_path}: {e}")
+            failed_sources.add(source_key(file_path))
+    
+    def _fits_in_worker(self, file_path):
+        """Archivos que se pueden dividir enteros en el pool (el resultado cabe en memoria)"""
+        try:
+            return os.path.getsize(file_path) <= self.parallel_max_bytes
+        except OSError:
+            return True  # El error se reporta al leerlo
+    
+    def _chunk_pool(self):
+        """Pool de procesos de parseo, compartido por todas las cargas de este procesador"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.mp_context,
+                                             initializer=_init_chunk_worker, initargs=(self.text_splitter,))
+        return self._pool
+    
+    def close(self):
+        """Detiene el pool de procesos de parseo (se vuelve a crear si hace falta)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+    
+    def _iter_chunks_parallel(self, file_paths, failed_sources):
+        """
+        Lee y divide los archivos en un pool de procesos, entregándolos en orden
+        
+        Cada proceso devuelve los fragmentos de un archivo completo, por eso solo van
+        al pool los archivos de hasta `parallel_max_bytes` y como mucho hay 2 por
+        proceso en vuelo: la memoria queda acotada por workers × 2 × ese tamaño. Los
+        archivos más grandes se leen página a página en este proceso cuando les toca,
+        mientras el pool sigue con los siguientes. El resultado se entrega en el orden
+        de `file_paths` (el embedding y los IDs no dependen de qué proceso termina primero).
+        """
+        pool = self._chunk_pool()
+        print(f"🔄 Leyendo {len(file_paths)} archivos con {self.workers} procesos")
+        paths = iter(file_paths)
+        pending = deque()  # (archivo, futuro o None si se lee aquí), en orden
+        in_flight = 0
+        
+        def schedule():
+            nonlocal in_flight
+            while in_flight < self.workers * 2:
+                file_path = next(paths, None)
+                if file_path is None:
+                    return
+                if self._fits_in_worker(file_path):
+                    pending.append((file_path, pool.submit(_chunk_file, file_path)))
+                    in_flight += 1
+                else:
+                    pending.append((file_path, None))
+        
+        schedule()
+        while pending:
+            file_path, future = pending.popleft()
+            if future is None:
+                yield from self._iter_file_chunks(file_path, failed_sources)
+                schedule()
+                continue
+            in_flight -= 1
+            schedule()
+            try:
+                chunks, pages, error = future.result()
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. sin memoria): la próxima carga arma un pool nuevo
+                self.close()
+                raise
+            if error:
+                print(f"❌ Error al cargar {file_path}: {error}")
+                failed_sources.add(source_key(file_path))
+                continue
+            print(f"✅ Documento leído: {file_path} ({pages} páginas, {len(chunks)} fragmentos)")
+            yield from chunks
+    
+    def create_or_get_index(self, dimension=None):
         """
         Crea o obtiene el índice de Pinecone
         
+        Args:
+            dimension (int): Dimensión si hay que crearlo (por defecto la de los embeddings)
+        
         Returns:
             pinecone.Index: Índice de Pinecone
         """
@@ -95,7 +305,7 @@ class DocumentProcessor:
                 print(f"🔄 Creando índice '{self.index_name}' en Pinecone...")
                 self.pc.create_index(
                     name=self.index_name,
-                    dimension=3072,  # Dimensión para text-embedding-3-large
+                    dimension=dimension or self.dimensions,
                     metric="cosine",
                     spec=ServerlessSpec(
                         cloud="aws",
@@ -111,12 +321,23 @@ class DocumentProcessor:
             print(f"❌ Error al crear/obtener índice: {e}")
             raise
     
-    def upload_documents_to_pinecone(self, docs):
+    def upload_documents_to_pinecone(self, docs, fingerprints=None, failed_sources=None):
         """
-        Sube los documentos procesados a Pinecone en lotes
+        Sincroniza los fragmentos de cada archivo con Pinecone
+        
+        Solo se embeben y suben los fragmentos nuevos o modificados (según su ID
+        determinista); los que el manifiesto tenía para ese archivo y ya no existen se
+        borran del índice. Volver a cargar el mismo archivo no genera duplicados.
+        Los fragmentos nuevos de todos los archivos pasan por un único IngestPipeline
+        (lotes por tokens, embedding concurrente y upsert solapado). `docs` puede ser
+        un generador: se consume a medida que el pipeline avanza y de cada fragmento
+        solo se conserva su ID.
         
         Args:
-            docs (list): Lista de fragmentos de documentos
+            docs (iterable): Fragmentos de documentos (lista o generador)
+            fingerprints (dict): Huella de cada archivo (source -> huella) para el manifiesto
+            failed_sources (set): Orígenes que no se leyeron completos; se consulta al
+                terminar el recorrido y esos archivos no se borran ni se registran
             
         Returns:
             PineconeVectorStore: Almacén de vectores de Pinecone
@@ -125,38 +346,264 @@ class DocumentProcessor:
             # Crear o obtener índice
             index = self.create_or_get_index()
             
-            # Procesar en lotes para evitar límites de tamaño
-            BATCH_SIZE = 100  # Procesar de 100 en 100
-            total_docs = len(docs)
-            
-            print(f"🔄 Subiendo {total_docs} fragmentos en lotes de {BATCH_SIZE}...")
-            
             # Conectar al vector store existente
             docsearch = PineconeVectorStore(
                 index_name=self.index_name,
                 embedding=self.embeddings
             )
             
-            # Procesar en lotes
-            for i in range(0, total_docs, BATCH_SIZE):
-                batch = docs[i:i+BATCH_SIZE]
-                batch_num = (i // BATCH_SIZE) + 1
-                total_batches = (total_docs + BATCH_SIZE - 1) // BATCH_SIZE
-                
-                print(f"📦 Procesando lote {batch_num}/{total_batches} ({len(batch)} documentos)...")
-                
-                # Agregar documentos al índice existente
-                docsearch.add_documents(batch)
-                
-                print(f"✅ Lote {batch_num} completado")
+            # Descartar casi duplicados entre la división y el embedding
+            dedup = self._near_duplicate_filter(fingerprints or {})
+            if dedup:
+                docs = dedup.filter(
+                    docs,
+                    key_fn=lambda doc: chunk_id(doc.metadata['source'], doc.metadata['chunk_hash']),
+                    label_fn=lambda doc: doc.metadata['source']
+                )
+            
+            # IDs actuales por archivo de origen (un mismo texto repetido se indexa una vez)
+            seen = {}
+            indexed = {}
+            new_count = {}
+            
+            def new_chunks():
+                for doc in docs:
+                    source = doc.metadata['source']
+                    doc_id = chunk_id(source, doc.metadata['chunk_hash'])
+                    if source not in seen:
+                        seen[source] = set()
+                        indexed[source] = set(self.manifest.chunk_ids(source))
+                        new_count[source] = 0
+                    if doc_id in seen[source]:
+                        continue
+                    seen[source].add(doc_id)
+                    if doc_id not in indexed[source]:
+                        new_count[source] += 1
+                        yield doc_id, doc
+            
+            # Con el mismo ID, Pinecone reemplaza el vector en lugar de duplicarlo
+            IngestPipeline(self.embeddings, index, store=self.embedding_store).run(new_chunks())
+            
+            # Los borrados necesitan el recorrido completo de cada archivo
+            failed_sources = failed_sources or set()
+            for source in fingerprints or {}:
+                # Archivo leído sin fragmentos (vacío o todo duplicado): sus vectores anteriores sobran
+                if source not in seen and source not in failed_sources:
+                    seen[source], indexed[source], new_count[source] = set(), set(self.manifest.chunk_ids(source)), 0
+            to_delete = []
+            total_uploaded = total_kept = 0
+            for source, chunk_ids in seen.items():
+                removed_ids = [] if source in failed_sources else sorted(indexed[source] - chunk_ids)
+                to_delete.extend(removed_ids)
+                total_uploaded += new_count[source]
+                total_kept += len(chunk_ids) - new_count[source]
+                print(f"🔄 {source}: {new_count[source]} nuevos, {len(removed_ids)} eliminados, "
+                      f"{len(chunk_ids) - new_count[source]} sin cambios")
+            self._delete_chunks(index, to_delete)
+            
+            # Registrar después de subir: si algo falla, el próximo intento lo repite
+            duplicates = {}
+            for entry in dedup.dropped if dedup else ():
+                duplicates.setdefault(entry['label'], {})[entry['key']] = entry['duplicate_of']
+            updated = {source for source in seen if source not in failed_sources}
+            for source in updated:
+                self.manifest.update_source(source, seen[source], (fingerprints or {}).get(source),
+                                            duplicates.get(source))
+            self._invalidate_dependents(to_delete, exclude=updated)
+            self.manifest.save()
             
-            print(f"✅ Todos los documentos subidos exitosamente")
+            if dedup:
+                print(dedup.report())
+                indexed_ids = {doc_id for source in self.manifest.sources for doc_id in self.manifest.chunk_ids(source)}
+                save_signatures(self.signatures_path, {
+                    doc_id: signature for doc_id, signature in dedup.signatures().items() if doc_id in indexed_ids
+                })
+            
+            self.last_sync = {"uploaded": total_uploaded, "deleted": len(to_delete), "unchanged": total_kept}
+            print(f"✅ Sincronización completa: {total_uploaded} subidos, {len(to_delete)} eliminados, "
+                  f"{total_kept} sin cambios")
             return docsearch
             
         except Exception as e:
             print(f"❌ Error al subir documentos a Pinecone: {e}")
             raise
     
+    def export_snapshot(self, path, float16=False):
+        """
+        Exporta el índice completo (IDs, vectores y metadatos) a un snapshot local
+        
+        Args:
+            path (str): Directorio del snapshot (se reemplaza si existe)
+            float16 (bool): Guardar los vectores en float16 (la mitad de espacio)
+            
+        Returns:
+            dict: Descripción del snapshot
+        """
+        index = self.pc.Index(self.index_name)
+        dimension = self.pc.describe_index(self.index_name).dimension
+        known_ids = [doc_id for source in self.manifest.sources for doc_id in self.manifest.chunk_ids(source)]
+        info = export_index(index, path, self.index_name, dimension, float16=float16, fallback_ids=known_ids)
+        print(f"✅ Snapshot exportado en {path}: {info['count']} vectores de dimensión {dimension} ({info['dtype']})")
+        return info
+    
+    def import_snapshot(self, path):
+        """
+        Carga un snapshot en el índice (arranque en frío o restauración de un backup)
+        
+        Reconstruye el manifiesto a partir del `source` de cada vector, sin huellas:
+        la próxima carga de cada archivo lo vuelve a fragmentar, pero como los IDs
+        coinciden no sube nada que ya esté en el índice.
+        
+        Returns:
+            int: Vectores importados
+        """
+        snapshot = IndexSnapshot.open(path)
+        try:
+            index = self.create_or_get_index(dimension=snapshot.dimension)
+            uploaded = import_snapshot(snapshot, index)
+            by_source = {}
+            for row in range(len(snapshot)):
+                source = snapshot.metadata(row).get('source')
+                if source:
+                    by_source.setdefault(source, set()).add(str(snapshot.ids[row]))
+            for source, ids in by_source.items():
+                self.manifest.update_source(source, ids | set(self.manifest.chunk_ids(source)))
+            self.manifest.save()
+        finally:
+            snapshot.close()
+        print(f"✅ Snapshot importado en '{self.index_name}': {uploaded} vectores")
+        return uploaded
+    
+    def migrate_dimensions(self, dimensions, reembed=False):
+        """
+        Construye un índice paralelo con otra dimensión de embeddings
+        
+        Por defecto no llama a la API: los vectores del índice actual se acortan
+        (primeras componentes, normalizadas), que es lo que hace text-embedding-3 con
+        `dimensions`. Con `reembed` se vuelve a embeber el texto guardado en los
+        metadatos. El índice actual no se toca; el nuevo recibe los mismos IDs, una
+        copia del manifiesto y de las firmas de casi duplicados, y sus vectores quedan
+        en el almacén de embeddings de su dimensión.
+        
+        Args:
+            dimensions (int): Dimensión del índice nuevo
+            reembed (bool): Embeber de nuevo en lugar de acortar
+            
+        Returns:
+            DocumentProcessor: Procesador del índice nuevo
+        """
+        source_dimensions = self.pc.describe_index(self.index_name).dimension
+        if dimensions == source_dimensions:
+            raise ValueError(f"El índice '{self.index_name}' ya es de dimensión {dimensions}")
+        if dimensions > source_dimensions and not reembed:
+            raise ValueError(f"No se puede agrandar de {source_dimensions} a {dimensions} acortando; usa --reembed")
+        
+        suffix = f"-{source_dimensions}"
+        base = self.index_name[:-len(suffix)] if self.index_name.endswith(suffix) else self.index_name
+        target = DocumentProcessor(index_name=index_name_for(dimensions, base), workers=self.workers,
+                                   dedup_threshold=self.dedup_threshold, dimensions=dimensions)
+        print(f"🔄 Migrando '{self.index_name}' ({source_dimensions}) → '{target.index_name}' ({dimensions})")
+        source_index = self.pc.Index(self.index_name)
+        target_index = target.create_or_get_index()
+        known_ids = [doc_id for source in self.manifest.sources for doc_id in self.manifest.chunk_ids(source)]
+        ids = list_index_ids(source_index, known_ids)
+        
+        def fetched_batches():
+            for start in range(0, len(ids), 100):
+                yield fetch_vectors(source_index, ids[start:start + 100])
+        
+        if reembed:
+            from langchain_core.documents import Document
+            def documents():
+                for fetched in fetched_batches():
+                    for doc_id, (_, metadata) in fetched.items():
+                        metadata = dict(metadata)
+                        yield doc_id, Document(page_content=metadata.pop('text', ''), metadata=metadata)
+            IngestPipeline(target.embeddings, target_index, store=target.embedding_store).run(documents(), total=len(ids))
+        else:
+            migrated = 0
+            for fetched in fetched_batches():
+                if not fetched:
+                    continue
+                doc_ids = list(fetched)
+                vectors = shorten([fetched[doc_id][0] for doc_id in doc_ids], dimensions)
+                target_index.upsert(vectors=[
+                    {"id": doc_id, "values": vector.tolist(), "metadata": fetched[doc_id][1]}
+                    for doc_id, vector in zip(doc_ids, vectors)
+                ])
+                if target.embedding_store is not None:
+                    hashes = [fetched[doc_id][1].get('chunk_hash') for doc_id in doc_ids]
+                    target.embedding_store.put_many(
+                        [h for h in hashes if h], [v for h, v in zip(hashes, vectors) if h]
+                    )
+                migrated += len(doc_ids)
+                print(f"📦 {migrated}/{len(ids)} vectores migrados")
+        
+        # Mismos fragmentos e IDs: el índice nuevo sigue sincronizándose de forma incremental
+        target.manifest.sources = json.loads(json.dumps(self.manifest.sources))
+        target.manifest.save()
+        if os.path.exists(self.signatures_path):
+            shutil.copyfile(self.signatures_path, target.signatures_path)
+        print(f"✅ Índice '{target.index_name}' listo con {len(ids)} vectores. "
+              f"Para usarlo: EMBEDDING_DIMENSIONS={dimensions}")
+        return target
+    
+    def remove_file(self, file_path):
+        """
+        Quita del índice y del manifiesto los fragmentos de un archivo borrado
+        
+        Returns:
+            int: Vectores borrados, o None si el archivo no estaba indexado
+        """
+        source = source_key(file_path)
+        if source not in self.manifest.sources:
+            return None
+        ids = self.manifest.chunk_ids(source)
+        self._delete_chunks(self.create_or_get_index(), ids)
+        self.manifest.remove_source(source)
+        self._invalidate_dependents(ids)
+        self.manifest.save()
+        print(f"🗑️ {source} eliminado del índice")
+        return len(ids)
+    
+    def _near_duplicate_filter(self, fingerprints):
+        """
+        Filtro MinHash sembrado con los fragmentos indexados de los archivos que no se recargan
+        
+        Así un fragmento nuevo también se compara con lo que ya está en el índice.
+        """
+        if not self.dedup_threshold:
+            return None
+        dedup = NearDuplicateFilter(threshold=self.dedup_threshold)
+        stored = load_signatures(self.signatures_path)
+        for source in self.manifest.sources:
+            if source in fingerprints:
+                continue
+            for doc_id in self.manifest.chunk_ids(source):
+                if doc_id in stored:
+                    dedup.add(doc_id, stored[doc_id], source)
+        return dedup
+    
+    def _invalidate_dependents(self, deleted_ids, exclude=()):
+        """
+        Quita la huella de los archivos cuyos casi duplicados apuntaban a fragmentos borrados
+        
+        Esos fragmentos no están en el índice: sin huella, la próxima carga del archivo
+        lo vuelve a fragmentar y los sube si ya no tienen un original.
+        """
+        for source in self.manifest.dependents(deleted_ids):
+            if source not in exclude:
+                self.manifest.invalidate(source)
+                print(f"♻️ {source}: dependía de fragmentos eliminados, se volverá a fragmentar")
+    
+    def _delete_chunks(self, index, ids):
+        """Borra del índice los vectores de fragmentos que ya no existen"""
+        DELETE_BATCH_SIZE = 1000  # Máximo de IDs por llamada a delete
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            index.delete(ids=ids[i:i+DELETE_BATCH_SIZE])
+        if ids:
+            print(f"🗑️ {len(ids)} fragmentos obsoletos eliminados del índice")
+    
     def process_single_file(self, file_path):
         """
         Procesa un solo archivo: carga, divide y sube a Pinecone
@@ -169,18 +616,18 @@ class DocumentProcessor:
         """
         print(f"🔄 Procesando archivo: {file_path}")
         
-        # Cargar documento
-        documents = self.load_document(file_path)
-        if not documents:
-            raise ValueError(f"No se pudo cargar el documento: {file_path}")
-        
-        # Dividir en fragmentos
-        docs = self.split_documents(documents)
-        if not docs:
-            raise ValueError(f"No se pudieron generar fragmentos del documento: {file_path}")
+        fingerprint = self.file_fingerprint(file_path)
+        if self.manifest.fingerprint(source_key(file_path)) == fingerprint:
+            print(f"⏭️ Sin cambios desde la última carga: {file_path}")
+            return None
         
-        # Subir a Pinecone
-        docsearch = self.upload_documents_to_pinecone(docs)
+        # Cargar, dividir y subir página a página
+        failed = set()
+        docsearch = self.upload_documents_to_pinecone(
+            self.iter_chunks([file_path], failed), {source_key(file_path): fingerprint}, failed
+        )
+        if failed:
+            raise ValueError(f"No se pudo cargar el documento: {file_path}")
         
         print(f"✅ Procesamiento completo de: {file_path}")
         return docsearch
@@ -189,6 +636,9 @@ class DocumentProcessor:
         """
         Procesa múltiples archivos y los combina en un solo índice
         
+        Los archivos se leen uno tras otro en streaming, sin juntar todos sus
+        fragmentos en memoria.
+        
         Args:
             file_paths (list): Lista de rutas a archivos
             
@@ -197,22 +647,28 @@ class DocumentProcessor:
         """
         print(f"🔄 Procesando {len(file_paths)} archivos...")
         
-        all_docs = []
+        changed = []
+        fingerprints = {}
         
-        # Procesar cada archivo
         for file_path in file_paths:
-            documents = self.load_document(file_path)
-            if documents:
-                docs = self.split_documents(documents)
-                all_docs.extend(docs)
+            fingerprint = self.file_fingerprint(file_path)
+            if self.manifest.fingerprint(source_key(file_path)) == fingerprint:
+                print(f"⏭️ Sin cambios desde la última carga: {file_path}")
+                continue
+            changed.append(file_path)
+            fingerprints[source_key(file_path)] = fingerprint
         
-        if not all_docs:
-            raise ValueError("No se pudieron procesar los documentos")
+        if not changed:
+            print("✅ Todos los archivos están al día en el índice")
+            return None
         
-        print(f"🔄 Total de fragmentos a subir: {len(all_docs)}")
+        print(f"🔄 Archivos a sincronizar: {len(changed)}")
         
-        # Subir todos los fragmentos
-        docsearch = self.upload_documents_to_pinecone(all_docs)
+        # Sincronizar todos los fragmentos
+        failed = set()
+        docsearch = self.upload_documents_to_pinecone(self.iter_chunks(changed, failed), fingerprints, failed)
+        if len(failed) == len(changed):
+            raise ValueError("No se pudieron procesar los documentos")
         
         print(f"✅ Procesamiento completo de {len(file_paths)} archivos")
         return docsearch
@@ -277,21 +733,67 @@ def select_files_interactively():
 if __name__ == "__main__":
     import sys
     
+    parser = argparse.ArgumentParser(description="Carga documentos de materials/ en Pinecone")
+    parser.add_argument("files", nargs="*", help="Archivos a procesar (sin argumentos: selección interactiva)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Procesos para leer y dividir archivos (por defecto INGEST_WORKERS o un proceso por núcleo)")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Similitud para descartar fragmentos casi duplicados (por defecto INGEST_DEDUP_THRESHOLD o 0.9; 0 desactiva)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Modo vigilancia: sincroniza materials/ de forma continua ante cada cambio")
+    parser.add_argument("--debounce", type=float, default=float(os.getenv('INGEST_WATCH_DEBOUNCE', 2.0)),
+                        help="Segundos sin cambios antes de sincronizar en modo vigilancia (INGEST_WATCH_DEBOUNCE)")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Exporta el índice (IDs, vectores y metadatos) a un snapshot local")
+    parser.add_argument("--import", dest="import_path", metavar="DIR",
+                        help="Sube al índice un snapshot exportado con --export")
+    parser.add_argument("--float16", action="store_true", help="Con --export: vectores en float16")
+    parser.add_argument("--migrate-dimensions", type=int, metavar="DIM",
+                        help="Construye un índice paralelo con embeddings de otra dimensión (p. ej. 1024)")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Con --migrate-dimensions: embeber de nuevo en lugar de acortar los vectores")
+    args = parser.parse_args()
+    
     print("🚀 PROCESADOR DE DOCUMENTOS PARA RAG")
     print("=" * 50)
     
     # Inicializar procesador
     try:
-        processor = DocumentProcessor()
+        processor = DocumentProcessor(workers=args.workers, dedup_threshold=args.dedup_threshold)
         print("✅ Procesador inicializado correctamente")
     except Exception as e:
         print(f"❌ Error al inicializar procesador: {e}")
         sys.exit(1)
     
+    if args.migrate_dimensions:
+        try:
+            processor.migrate_dimensions(args.migrate_dimensions, reembed=args.reembed)
+        except Exception as e:
+            print(f"❌ Error en la migración: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    
+    if args.export or args.import_path:
+        try:
+            if args.export:
+                processor.export_snapshot(args.export, float16=args.float16)
+            else:
+                processor.import_snapshot(args.import_path)
+        except Exception as e:
+            print(f"❌ Error con el snapshot: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    
+    if args.watch:
+        from materials_watcher import watch_materials
+        watch_materials(processor, os.path.join(PROJECT_ROOT, 'materials'), debounce=args.debounce)
+        processor.close()
+        sys.exit(0)
+    
     # Seleccionar archivos
-    if len(sys.argv) > 1:
+    if args.files:
         # Usar argumentos de línea de comandos
-        selected_files = sys.argv[1:]
+        selected_files = args.files
         print(f"📁 Archivos desde argumentos: {selected_files}")
     else:
         # Selección interactiva
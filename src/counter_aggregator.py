@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Counter Aggregator - Acumula incrementos de contadores en memoria y los escribe por lotes
+
+Reemplaza un UPDATE + commit por cada incremento con un único UPDATE por lote,
+ejecutado cada cierto intervalo o cuando se acumulan suficientes incrementos.
+Ante un fallo de escritura los deltas se conservan para el siguiente intento; ante una
+caída del proceso se pierden como máximo los incrementos del último intervalo.
+"""
+
+import time
+import atexit
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class CounterAggregator:
+    """Agregador de deltas por clave con escritura periódica en segundo plano"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Tuple[str, int]]], None],
+        flush_interval: float = 5.0,
+        flush_threshold: int = 200,
+        name: str = "CounterAggregator",
+        on_flushed: Callable[[List[Tuple[str, int]]], None] = None
+    ):
+        """
+        Args:
+            flush_fn: Escribe una lista de (clave, delta) en una sola operación
+            flush_interval: Segundos máximos que un incremento espera en memoria
+            flush_threshold: Incrementos acumulados que disparan una escritura anticipada
+            name: Nombre del hilo y de los logs
+            on_flushed: Se llama con las filas escritas una vez que dejaron de contarse como
+                pendientes (p. ej. para invalidar caches que ya pueden releer la base)
+        """
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.name = name
+        self.on_flushed = on_flushed
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._pending_total = 0
+
+        # Estadísticas
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._flushed_increments = 0
+        self._last_flush_ms = 0.0
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        # Último intento de escribir lo pendiente si el proceso termina sin close()
+        atexit.register(self.close)
+
+    def add(self, key: str, delta: int = 1):
+        """Acumula un incremento para `key`"""
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + delta
+            self._pending_total += delta
+            if self._pending_total >= self.flush_threshold:
+                self._wakeup.set()
+
+    def pending(self, key: str) -> int:
+        """Delta aún no visible en la base para `key` (acumulado + en escritura)"""
+        with self._lock:
+            return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+
+    def flush(self) -> bool:
+        """Escribe todos los deltas acumulados. Devuelve False si la escritura falló"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                self._in_flight, self._pending = self._pending, {}
+                self._pending_total = 0
+                rows = list(self._in_flight.items())
+
+            start = time.perf_counter()
+            try:
+                self.flush_fn(rows)
+            except Exception as e:
+                logger.warning(f"⚠️ {self.name}: error al escribir {len(rows)} contadores, se reintentará: {e}")
+                with self._lock:
+                    # Devolver los deltas a la acumulación para el siguiente intento
+                    for key, delta in self._in_flight.items():
+                        self._pending[key] = self._pending.get(key, 0) + delta
+                        self._pending_total += delta
+                    self._in_flight = {}
+                    self._failed_flushes += 1
+                return False
+
+            with self._lock:
+                self._in_flight = {}
+                self._flushes += 1
+                self._flushed_increments += sum(delta for _, delta in rows)
+                self._last_flush_ms = (time.perf_counter() - start) * 1000
+            logger.debug(f"🔢 {self.name}: {len(rows)} contadores escritos en {self._last_flush_ms:.1f}ms")
+            # Recién ahora pending() deja de sumar estos deltas: quien relea la base no los cuenta dos veces
+            if self.on_flushed:
+                try:
+                    self.on_flushed(rows)
+                except Exception as e:
+                    logger.warning(f"⚠️ {self.name}: error en on_flushed: {e}")
+            return True
+
+    def close(self):
+        """Detiene el hilo de fondo y escribe lo pendiente"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if not self.flush():
+            logger.error(f"❌ {self.name}: quedaron contadores sin escribir al cerrar")
+
+    def stats(self) -> Dict:
+        """Estado de la acumulación y de las escrituras"""
+        with self._lock:
+            return {
+                "pending_keys": len(self._pending),
+                "pending_increments": self._pending_total,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "flushed_increments": self._flushed_increments,
+                "last_flush_ms": round(self._last_flush_ms, 2),
+            }
+
+    def _run(self):
+        """Escribe cada flush_interval segundos o antes si se supera el umbral"""
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            self.flush()
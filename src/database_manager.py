@@ -1,25 +1,76 @@
 import os
 import psycopg2
 import psycopg2.pool
+import psycopg2.extras
+from psycopg2 import errors as pg_errors
 import uuid
 import time
 import logging
+import threading
 from urllib.parse import urlparse
 from contextlib import contextmanager
 
+from storage_backend import StorageBackend
+from tracing import add_event
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-class DatabaseManager:
-    def __init__(self, max_connections=10, min_connections=1):
+# Registro de sentencias SQL fijas del turno de conversación.
+# Se preparan una sola vez por conexión del pool (PREPARE) y luego se ejecutan
+# por nombre (EXECUTE), evitando que Postgres las parsee y planifique en cada llamada.
+PREPARED_STATEMENTS = {
+    # SessionManager
+    'session_get': "SELECT session_id, created_at, last_activity, user_preferences FROM sessions WHERE session_id = $1::uuid",
+    'session_touch': "UPDATE sessions SET last_activity = $1 WHERE session_id = $2::uuid",
+    'session_insert': "INSERT INTO sessions (session_id, created_at, last_activity) VALUES ($1::uuid, $2, $3) RETURNING session_id, created_at, last_activity, user_preferences",
+    'session_update_preferences': "UPDATE sessions SET user_preferences = user_preferences || $1::jsonb WHERE session_id = $2::uuid",
+    'message_insert': "INSERT INTO conversation_messages (session_id, timestamp, message, is_user) VALUES ($1::uuid, $2, $3, $4)",
+    'history_recent': "SELECT message, is_user FROM conversation_messages WHERE session_id = $1::uuid ORDER BY timestamp DESC LIMIT $2",
+    # UserManager
+    'user_set_session': "UPDATE users SET session_id = $1 WHERE name = $2",
+    'user_by_name': "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE name = $1",
+    'user_by_telegram': "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE telegram_username = $1",
+    'user_increment_by_name': "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE name = $1",
+    'user_increment_by_telegram': "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE telegram_username = $1",
+}
+
+# Sentencias de lote: (SQL con un único VALUES %s, plantilla por fila).
+# Se ejecutan con execute_values como un solo INSERT/UPDATE multi-fila.
+BATCH_STATEMENTS = {
+    'message_insert_batch': (
+        "INSERT INTO conversation_messages (session_id, timestamp, message, is_user) VALUES %s",
+        "(%s::uuid, %s, %s, %s)"
+    ),
+    'session_touch_batch': (
+        "UPDATE sessions AS s SET last_activity = v.last_activity FROM (VALUES %s) AS v(session_id, last_activity) WHERE s.session_id = v.session_id",
+        "(%s::uuid, %s::timestamp)"
+    ),
+    'user_increment_batch': (
+        "UPDATE users AS u SET message_count = COALESCE(u.message_count, 0) + v.delta FROM (VALUES %s) AS v(name, delta) WHERE u.name = v.name",
+        "(%s, %s::integer)"
+    ),
+}
+
+class DatabaseManager(StorageBackend):
+    """Backend de almacenamiento PostgreSQL (psycopg2 + DATABASE_URL)"""
+
+    def __init__(self, max_connections=10, min_connections=None):
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise ValueError("DATABASE_URL environment variable not set.")
         
         # Configurar pool de conexiones
         self.max_connections = max_connections
-        self.min_connections = min_connections
+        # putconn cierra las conexiones por encima de minconn: con un mínimo bajo, la
+        # concurrencia recicla conexiones (y sus sentencias preparadas) en cada turno
+        if min_connections is None:
+            min_connections = int(os.getenv('DB_MIN_CONNECTIONS', max(1, max_connections // 2)))
+        self.min_connections = min(min_connections, max_connections)
         self.connection_pool = None
+        # Sentencias ya preparadas por conexión: id(conn) -> (backend_pid, {nombres})
+        self._prepared = {}
+        self._prepared_lock = threading.Lock()
         self._setup_connection_pool()
         self.create_tables()
 
@@ -43,8 +94,8 @@ class DatabaseManager:
                 'keepalives_idle': 600,  # 10 minutos
                 'keepalives_interval': 30,
                 'keepalives_count': 5,
-                # SSL optimizado para Railway
-                'sslmode': 'require',
+                # SSL optimizado para Railway (DATABASE_SSLMODE=disable para una base local)
+                'sslmode': os.getenv('DATABASE_SSLMODE', 'require'),
                 'sslcert': None,
                 'sslkey': None,
                 'sslrootcert': None
@@ -55,6 +106,9 @@ class DatabaseManager:
                 maxconn=self.max_connections,
                 **connection_params
             )
+            # Un pool nuevo implica conexiones nuevas sin sentencias preparadas
+            with self._prepared_lock:
+                self._prepared.clear()
             logger.info("✅ Pool de conexiones PostgreSQL configurado exitosamente")
             logger.info(f"🔧 Configuración: host={url.hostname}, port={url.port}, db={url.path[1:]}")
         except Exception as e:
@@ -77,7 +131,7 @@ class DatabaseManager:
                     logger.warning("⚠️ Pool de conexiones no disponible, intentando reconectar...")
                     self._reconnect()
                 
-                logger.debug(f"🔄 Intento {retry_count + 1} de obtener conexión del pool")
+                logger.debug("🔄 Intento %d de obtener conexión del pool", retry_count + 1)
                 conn = self.connection_pool.getconn()
                 if conn is None:
                     raise Exception("No se pudo obtener conexión del pool")
@@ -94,6 +148,7 @@ class DatabaseManager:
             except (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.DatabaseError) as e:
                 retry_count += 1
                 logger.warning(f"⚠️ Error de conexión detectado (intento {retry_count}/{max_retries}): {e}")
+                add_event("db.connection_error", attempt=retry_count, error=type(e).__name__)
                 
                 if conn:
                     try:
@@ -111,7 +166,8 @@ class DatabaseManager:
                 
                 if retry_count >= max_retries:
                     logger.error(f"❌ Falló después de {max_retries} intentos: {e}")
-                    raise
+                # Un error de SQL no se reintenta: el bloque del llamador ya se ejecutó
+                raise
                     
             except Exception as e:
                 logger.error(f"❌ Error inesperado en operación de base de datos: {e}")
@@ -131,6 +187,9 @@ class DatabaseManager:
                     try:
                         self.connection_pool.putconn(conn)
                         logger.debug("✅ Conexión devuelta al pool")
+                        if conn.closed:
+                            # El pool la cerró (excedía minconn): sus sentencias ya no existen
+                            self._forget_connection(conn)
                     except Exception as e:
                         logger.error(f"❌ Error al devolver conexión al pool: {e}")
                         # No re-raise aquí para evitar el error "trying to put unkeyed connection"
@@ -139,6 +198,7 @@ class DatabaseManager:
         """Reconecta el pool de conexiones en caso de error"""
         try:
             logger.info("🔄 Intentando reconectar a la base de datos...")
+            add_event("db.reconnect")
             
             # Cerrar pool existente de forma segura
             if self.connection_pool:
@@ -170,6 +230,74 @@ class DatabaseManager:
             self.connection_pool = None
             raise
 
+    def _backend_pid(self, conn):
+        """PID del proceso servidor de la conexión (distingue un objeto reciclado con el mismo id)"""
+        try:
+            return conn.get_backend_pid()
+        except Exception:
+            return None
+
+    def _prepare(self, conn, cursor, name):
+        """Prepara la sentencia `name` en la conexión si aún no lo está"""
+        pid = self._backend_pid(conn)
+        with self._prepared_lock:
+            entry = self._prepared.get(id(conn))
+            if entry and entry[0] == pid and name in entry[1]:
+                return
+            fresh = not entry or entry[0] != pid
+        if fresh:
+            # Sin registro la conexión puede conservar sentencias de antes de olvidarla
+            # (PREPARE no es transaccional): empezar de cero para no chocar con ellas
+            cursor.execute("DEALLOCATE ALL")
+        cursor.execute(f"PREPARE sau_{name} AS {PREPARED_STATEMENTS[name]}")
+        with self._prepared_lock:
+            entry = self._prepared.get(id(conn))
+            if not entry or entry[0] != pid:
+                entry = self._prepared[id(conn)] = (pid, set())
+            entry[1].add(name)
+        logger.debug("🧩 Sentencia '%s' preparada en conexión %s", name, pid)
+
+    def _forget_connection(self, conn):
+        """Olvida las sentencias registradas para una conexión"""
+        with self._prepared_lock:
+            self._prepared.pop(id(conn), None)
+
+    def execute_prepared(self, conn, cursor, name, params=()):
+        """
+        Ejecuta por nombre una sentencia del registro PREPARED_STATEMENTS.
+
+        La sentencia se prepara la primera vez que se usa en cada conexión del pool;
+        las siguientes llamadas solo envían EXECUTE con los parámetros.
+        Los resultados se leen del cursor como con cursor.execute().
+
+        Si la conexión perdió sus sentencias, el error se propaga: la transacción del
+        llamador puede tener escrituras previas y solo él puede descartarla (el
+        rollback de get_connection). El registro de la conexión se olvida, así que el
+        próximo uso las vuelve a preparar.
+        """
+        if name not in PREPARED_STATEMENTS:
+            raise KeyError(f"Sentencia preparada desconocida: {name}")
+
+        placeholders = ", ".join(["%s"] * len(params))
+        execute_sql = f"EXECUTE sau_{name} ({placeholders})" if params else f"EXECUTE sau_{name}"
+        self._prepare(conn, cursor, name)
+        try:
+            cursor.execute(execute_sql, params)
+        except pg_errors.InvalidSqlStatementName:
+            # La conexión perdió sus sentencias (p. ej. el servidor la reinició)
+            logger.warning(f"⚠️ Sentencia '{name}' no encontrada en la conexión; se preparará de nuevo en el próximo uso")
+            self._forget_connection(conn)
+            raise
+
+    def execute_batch(self, conn, cursor, name, rows):
+        """Ejecuta una sentencia de BATCH_STATEMENTS como un único VALUES multi-fila"""
+        if name not in BATCH_STATEMENTS:
+            raise KeyError(f"Sentencia de lote desconocida: {name}")
+        if not rows:
+            return
+        sql, template = BATCH_STATEMENTS[name]
+        psycopg2.extras.execute_values(cursor, sql, rows, template=template, page_size=len(rows))
+
     def _connect(self):
         """Método legacy mantenido para compatibilidad"""
         with self.get_connection() as (conn, cursor):
@@ -184,6 +312,15 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"❌ Error al cerrar pool de conexiones: {e}")
 
+    def pool_stats(self):
+        """Conexiones del pool en uso y libres (lee el estado interno de ThreadedConnectionPool)"""
+        pool = self.connection_pool
+        return {
+            "in_use": len(getattr(pool, '_used', {})) if pool else 0,
+            "idle": len(getattr(pool, '_pool', [])) if pool else 0,
+            "max": self.max_connections
+        }
+
     def health_check(self):
         """Verifica la salud de la conexión a la base de datos"""
         try:
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Embedding Config - Modelo y dimensión de embeddings compartidos por la carga y el bot
+
+text-embedding-3-large produce vectores de 3072 dimensiones y puede acortarlos de
+forma nativa (parámetro `dimensions`). DocumentProcessor y SauAI leen la misma
+dimensión de EMBEDDING_DIMENSIONS, y cada dimensión usa su propio índice: el de
+3072 conserva el nombre base (`sauai`) y los demás llevan la dimensión como sufijo
+(`sauai-1024`), así un índice nunca recibe consultas de otro tamaño.
+"""
+
+import os
+
+import numpy as np
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+NATIVE_DIMENSIONS = 3072
+INDEX_BASE_NAME = "sauai"
+
+def embedding_dimensions() -> int:
+    """Dimensión configurada (EMBEDDING_DIMENSIONS, por defecto 3072)"""
+    dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", NATIVE_DIMENSIONS))
+    if not 1 <= dimensions <= NATIVE_DIMENSIONS:
+        raise ValueError(f"EMBEDDING_DIMENSIONS debe estar entre 1 y {NATIVE_DIMENSIONS}: {dimensions}")
+    return dimensions
+
+def index_name_for(dimensions: int, base: str = INDEX_BASE_NAME) -> str:
+    """Índice de Pinecone para una dimensión: `sauai` (3072) o `sauai-<dim>`"""
+    return base if dimensions == NATIVE_DIMENSIONS else f"{base}-{dimensions}"
+
+def create_embeddings(dimensions: int = None):
+    """OpenAIEmbeddings con la dimensión configurada (sin `dimensions` para la nativa)"""
+    from langchain_openai import OpenAIEmbeddings
+    dimensions = dimensions or embedding_dimensions()
+    if dimensions == NATIVE_DIMENSIONS:
+        return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions)
+
+def shorten(vectors, dimensions: int) -> np.ndarray:
+    """
+    Acorta embeddings ya calculados: primeras `dimensions` componentes, normalizadas
+
+    Es lo mismo que hace la API con `dimensions` para los modelos text-embedding-3,
+    así que un índice más chico se puede armar sin volver a embeber.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
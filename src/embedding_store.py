@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Embedding Store - Vectores ya calculados, persistidos en disco por hash de contenido
+
+Cada par (modelo, dimensión) tiene dos archivos en el directorio del almacén:
+- `<modelo>-<dim>.f32`: matriz float32 de vectores, una fila por texto, que se lee
+  con un memmap de numpy (no se carga entera en memoria);
+- `<modelo>-<dim>.idx`: una línea por fila con el hash SHA-256 del texto.
+
+Ambos archivos solo crecen (append). Los vectores se escriben antes que el índice,
+así que si el proceso se corta a mitad de una escritura como mucho se pierde la
+última fila, nunca se asocia un hash con un vector equivocado.
+
+Varios procesos pueden compartir el almacén (modo vigilancia, cargas manuales,
+benchmarks): las escrituras toman un flock exclusivo sobre `<modelo>-<dim>.lock`,
+la fila inicial se calcula del tamaño de `.f32` bajo ese lock, y antes de cada
+búsqueda se leen las líneas de `.idx` que otros procesos agregaron.
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+class EmbeddingStore:
+    """Almacén de embeddings (modelo, dimensión, hash de contenido) → vector"""
+
+    def __init__(self, directory: str, model: str, dimensions: int):
+        """
+        Args:
+            directory: Directorio del almacén (se crea si no existe)
+            model: Modelo de embeddings (p. ej. text-embedding-3-large)
+            dimensions: Dimensión de los vectores
+        """
+        self.directory = directory
+        self.model = model
+        self.dimensions = int(dimensions)
+        base = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{model}-{self.dimensions}")
+        self.vectors_path = os.path.join(directory, f"{base}.f32")
+        self.index_path = os.path.join(directory, f"{base}.idx")
+        self.lock_path = os.path.join(directory, f"{base}.lock")
+        self._rows: Dict[str, int] = {}
+        self._row_count = 0  # Líneas completas de .idx leídas (= filas de .f32 que referencian)
+        self._index_offset = 0  # Bytes de .idx ya leídos
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """flock sobre el archivo .lock (compartido para leer, exclusivo para escribir o reparar)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        """Repara los archivos (bajo lock exclusivo) y lee el índice"""
+        with self._file_lock(exclusive=True):
+            self._repair()
+            self._refresh()
+
+    def _repair(self):
+        """
+        Descarta restos de una escritura interrumpida: una línea de índice sin terminar y
+        vectores sin línea de índice. Requiere el lock exclusivo (nadie está escribiendo)
+        """
+        row_bytes = self.dimensions * 4
+        data = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        complete = data.rfind(b"\n") + 1
+        vector_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = min(data[:complete].count(b"\n"), vector_size // row_bytes)
+        if complete < len(data) or data[:complete].count(b"\n") > rows:
+            keep = b"".join(line + b"\n" for line in data[:complete].split(b"\n")[:rows])
+            with open(self.index_path, "wb") as f:
+                f.write(keep)
+            self._index_offset = min(self._index_offset, len(keep))
+        if vector_size != rows * row_bytes:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+
+    def _refresh(self):
+        """Incorpora las líneas completas de .idx agregadas desde la última lectura"""
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) <= self._index_offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1  # Una línea sin terminar la está escribiendo otro proceso
+        for line in data[:complete].split(b"\n")[:-1]:
+            self._rows[line.strip().decode("ascii")] = self._row_count
+            self._row_count += 1
+        self._index_offset += complete
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, text_hash: str) -> bool:
+        return text_hash in self._rows
+
+    def _view(self) -> np.memmap:
+        """Memmap de solo lectura sobre las filas escritas (se rehace tras cada append)"""
+        if self._matrix is None or len(self._matrix) != self._row_count:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self._row_count, self.dimensions))
+        return self._matrix
+
+    def get_many(self, text_hashes: Sequence[str]) -> List[Optional[List[float]]]:
+        """Vectores de cada hash (None si no está almacenado)"""
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._refresh()
+            rows = [self._rows.get(text_hash) for text_hash in text_hashes]
+            found = [row for row in rows if row is not None]
+            self.hits += len(found)
+            self.misses += len(rows) - len(found)
+            if not found:
+                return [None] * len(rows)
+            vectors = iter(self._view()[found].tolist())
+            return [next(vectors) if row is not None else None for row in rows]
+
+    def put_many(self, text_hashes: Iterable[str], vectors: Iterable[Sequence[float]]):
+        """Agrega vectores nuevos (los hashes ya almacenados se ignoran)"""
+        with self._lock, self._file_lock(exclusive=True):
+            # Lo que otros procesos agregaron: no duplicar y continuar después de sus filas
+            self._refresh()
+            new_hashes, new_vectors, seen = [], [], set()
+            for text_hash, vector in zip(text_hashes, vectors):
+                if text_hash in self._rows or text_hash in seen:
+                    continue
+                seen.add(text_hash)
+                if len(vector) != self.dimensions:
+                    raise ValueError(f"Vector de dimensión {len(vector)}, se esperaba {self.dimensions}")
+                new_hashes.append(text_hash)
+                new_vectors.append(vector)
+            if not new_hashes:
+                return
+            self._repair()
+            self._refresh()
+            # La fila inicial sale del archivo de vectores, no del estado en memoria
+            start = (os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0) // (self.dimensions * 4)
+            # Vectores primero y con fsync: el índice nunca apunta a filas sin escribir
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.asarray(new_vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, "ab") as f:
+                f.write("".join(f"{h}\n" for h in new_hashes).encode("ascii"))
+                self._index_offset = f.tell()
+            for offset, text_hash in enumerate(new_hashes):
+                self._rows[text_hash] = start + offset
+            self._row_count = start + len(new_hashes)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "dimensions": self.dimensions,
+                "vectors": len(self._rows),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Executors - Pools de hilos instrumentados para separar cargas de trabajo (bulkheads)
+
+Cada tipo de trabajo bloqueante (base de datos, búsqueda vectorial, LLM) tiene su
+propio pool, de modo que una ráfaga de llamadas lentas al LLM no deje sin hilos a
+las operaciones rápidas de base de datos.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor que mide ocupación, cola y tiempo de espera"""
+
+    def __init__(self, max_workers: int, name: str):
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"{name}-")
+        self.name = name
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._max_active = 0
+        self._max_queued = 0
+        self._submitted = 0
+        self._completed = 0
+        self._total_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        """Encola una tarea registrando cuánto espera hasta tener un hilo libre; corre en el contexto de quien la envía"""
+        submitted_at = time.perf_counter()
+        started = threading.Event()
+        # run_in_executor no propaga contextvars: copiar el contexto (request ID, span actual)
+        context = contextvars.copy_context()
+
+        def run():
+            wait_ms = (time.perf_counter() - submitted_at) * 1000
+            with self._stats_lock:
+                started.set()
+                self._queued -= 1
+                self._active += 1
+                self._max_active = max(self._max_active, self._active)
+                self._total_wait_ms += wait_ms
+                self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        with self._stats_lock:
+            self._queued += 1
+            self._submitted += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        future = super().submit(run)
+
+        def on_done(fut):
+            # Una tarea cancelada antes de empezar nunca pasa por run()
+            if fut.cancelled():
+                with self._stats_lock:
+                    if not started.is_set():
+                        self._queued -= 1
+
+        future.add_done_callback(on_done)
+        return future
+
+    def stats(self) -> Dict:
+        """Ocupación actual y acumulada del pool"""
+        with self._stats_lock:
+            started = self._completed + self._active
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "saturation": round(self._active / self.max_workers, 4),
+                "max_active": self._max_active,
+                "max_queued": self._max_queued,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "avg_wait_ms": round(self._total_wait_ms / started, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait_ms, 2),
+            }
+
+def create_executor(name: str, env_var: str, default_workers: int) -> InstrumentedExecutor:
+    """Crea un pool con el tamaño indicado en `env_var` (o `default_workers`)"""
+    workers = int(os.getenv(env_var, default_workers))
+    if workers < 1:
+        raise ValueError(f"{env_var} debe ser al menos 1 (recibido {workers})")
+    return InstrumentedExecutor(max_workers=workers, name=name)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Index Snapshot - Exportación e importación del índice de Pinecone en disco
+
+Un snapshot es un directorio con columnas que se abren con mmap:
+- `vectors.npy`: matriz (n, dim) float32 o float16;
+- `ids.npy`: IDs de los vectores (unicode de ancho fijo);
+- `metadata.jsonl` + `metadata_offsets.npy`: metadatos (incluido el texto del
+  fragmento) una línea JSON por fila, con el desplazamiento de cada línea para
+  leer cualquier fila sin recorrer el archivo;
+- `snapshot.json`: índice de origen, dimensión, tipo, cantidad y fecha.
+
+Al abrirlo con IndexSnapshot.open nada se copia a memoria: varios procesos en la
+misma máquina comparten una sola copia de los archivos en la caché de páginas.
+"""
+
+import os
+import json
+import mmap
+import shutil
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+FETCH_BATCH_SIZE = 100
+UPSERT_BATCH_SIZE = 100
+
+def list_index_ids(index, fallback_ids: Iterable[str] = ()) -> List[str]:
+    """
+    IDs de todos los vectores del índice
+
+    Los índices serverless permiten listarlos con index.list(); si no está
+    disponible se usan los IDs conocidos (p. ej. los del manifiesto local).
+    """
+    try:
+        ids = []
+        for page in index.list():
+            ids.extend(page)
+        return ids
+    except Exception as e:
+        print(f"⚠️ El índice no permite listar IDs ({e}); se usan los del manifiesto")
+        return sorted(set(fallback_ids))
+
+def fetch_vectors(index, ids: List[str]) -> Dict[str, Tuple[List[float], Dict]]:
+    """(valores, metadatos) de cada ID encontrado, con el SDK de Pinecone o respuestas dict"""
+    response = index.fetch(ids=ids)
+    vectors = response.vectors if hasattr(response, "vectors") else response["vectors"]
+    return {
+        vector_id: (
+            vector.values if hasattr(vector, "values") else vector["values"],
+            (vector.metadata if hasattr(vector, "metadata") else vector.get("metadata")) or {}
+        )
+        for vector_id, vector in vectors.items()
+    }
+
+def export_index(index, path: str, index_name: str, dimension: int, float16: bool = False,
+                 fallback_ids: Iterable[str] = ()) -> Dict:
+    """
+    Exporta IDs, vectores y metadatos del índice a un snapshot
+
+    Los vectores se escriben directo en un .npy abierto con memmap, por lotes, sin
+    juntarlos en memoria. El snapshot se arma en un directorio temporal y se
+    renombra al final, así que un export interrumpido no deja uno a medias.
+
+    Returns:
+        dict: Contenido de snapshot.json
+    """
+    ids = list_index_ids(index, fallback_ids)
+    dtype = np.float16 if float16 else np.float32
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                        dtype=dtype, shape=(len(ids), dimension))
+    exported_ids, offsets = [], []
+    with open(os.path.join(tmp_path, "metadata.jsonl"), "wb") as metadata_file:
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            batch = ids[start:start + FETCH_BATCH_SIZE]
+            fetched = fetch_vectors(index, batch)
+            for vector_id in batch:
+                if vector_id not in fetched:
+                    continue  # Borrado entre el listado y el fetch
+                values, metadata = fetched[vector_id]
+                vectors[len(exported_ids)] = np.asarray(values, dtype=np.float32)
+                exported_ids.append(vector_id)
+                offsets.append(metadata_file.tell())
+                metadata_file.write(json.dumps(metadata, ensure_ascii=False).encode("utf-8") + b"\n")
+            print(f"📦 {len(exported_ids)}/{len(ids)} vectores exportados")
+        offsets.append(metadata_file.tell())
+    vectors.flush()
+    del vectors
+
+    if len(exported_ids) < len(ids):
+        # Compactar las filas que quedaron vacías
+        full = np.load(os.path.join(tmp_path, "vectors.npy"), mmap_mode="r")
+        np.save(os.path.join(tmp_path, "vectors_compact.npy"), full[:len(exported_ids)])
+        del full
+        os.replace(os.path.join(tmp_path, "vectors_compact.npy"), os.path.join(tmp_path, "vectors.npy"))
+
+    id_width = max((len(vector_id) for vector_id in exported_ids), default=1)
+    np.save(os.path.join(tmp_path, "ids.npy"), np.array(exported_ids, dtype=f"U{id_width}"))
+    np.save(os.path.join(tmp_path, "metadata_offsets.npy"), np.array(offsets, dtype=np.int64))
+    info = {
+        "version": SNAPSHOT_VERSION,
+        "index_name": index_name,
+        "dimension": dimension,
+        "dtype": np.dtype(dtype).name,
+        "count": len(exported_ids),
+        "created_at": datetime.now().isoformat(),
+    }
+    with open(os.path.join(tmp_path, "snapshot.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return info
+
+class IndexSnapshot:
+    """Snapshot abierto con mmap: acceso por fila y búsqueda por similitud coseno local"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "snapshot.json"), encoding="utf-8") as f:
+            self.info = json.load(f)
+        if self.info.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Versión de snapshot no soportada: {self.info.get('version')}")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "metadata_offsets.npy"), mmap_mode="r")
+        self._metadata_file = open(os.path.join(path, "metadata.jsonl"), "rb")
+        size = os.fstat(self._metadata_file.fileno()).st_size
+        self._metadata = mmap.mmap(self._metadata_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._norms: Optional[np.ndarray] = None
+
+    @classmethod
+    def open(cls, path: str) -> "IndexSnapshot":
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.info["dimension"]
+
+    def metadata(self, row: int) -> Dict:
+        return json.loads(self._metadata[int(self.offsets[row]):int(self.offsets[row + 1])])
+
+    def rows(self, batch_size: int = UPSERT_BATCH_SIZE) -> Iterator[List[Tuple[str, np.ndarray, Dict]]]:
+        """Recorre el snapshot en lotes de (id, vector float32, metadatos)"""
+        for start in range(0, len(self), batch_size):
+            end = min(start + batch_size, len(self))
+            vectors = np.asarray(self.vectors[start:end], dtype=np.float32)
+            yield [(str(self.ids[row]), vectors[row - start], self.metadata(row)) for row in range(start, end)]
+
+    def _blocks(self, block_size: int = 8192) -> Iterator[Tuple[int, np.ndarray]]:
+        """Bloques de filas convertidos a float32 (acota la memoria con snapshots float16)"""
+        for start in range(0, len(self), block_size):
+            yield start, np.asarray(self.vectors[start:start + block_size], dtype=np.float32)
+
+    def search(self, query: Iterable[float], k: int = 3) -> List[Tuple[str, float, Dict]]:
+        """Los k vectores más parecidos por similitud coseno (fuerza bruta sobre el mmap)"""
+        if self._norms is None:
+            norms = np.concatenate([np.linalg.norm(block, axis=1) for _, block in self._blocks()]) if len(self) else np.zeros(0)
+            norms[norms == 0] = 1.0
+            self._norms = norms
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start, block in self._blocks():
+            scores[start:start + len(block)] = block @ query
+        scores /= self._norms
+        top = np.argsort(-scores)[:k]
+        return [(str(self.ids[row]), float(scores[row]), self.metadata(row)) for row in top]
+
+    def close(self):
+        if isinstance(self._metadata, mmap.mmap):
+            self._metadata.close()
+        self._metadata_file.close()
+
+def import_snapshot(snapshot: IndexSnapshot, index) -> int:
+    """
+    Sube todos los vectores de un snapshot al índice (mismos IDs: no duplica)
+
+    Returns:
+        int: Vectores subidos
+    """
+    uploaded = 0
+    for batch in snapshot.rows():
+        index.upsert(vectors=[
+            {"id": vector_id, "values": vector.tolist(), "metadata": metadata}
+            for vector_id, vector, metadata in batch
+        ])
+        uploaded += len(batch)
+        print(f"📦 {uploaded}/{len(snapshot)} vectores importados")
+    return uploaded
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Ingest Manifest - Registro local de los fragmentos indexados en Pinecone
+
+Cada fragmento tiene un ID determinista derivado de su archivo de origen y del hash
+de su contenido, de modo que volver a cargar el mismo archivo produce los mismos IDs.
+El manifiesto guarda, por archivo, los IDs ya indexados; comparándolo con los
+fragmentos actuales se sabe qué subir (nuevos o modificados) y qué borrar (los que
+desaparecieron del archivo). También guarda, para cada fragmento descartado por
+casi duplicado, el fragmento indexado del que depende: si ese se borra, el archivo
+pierde su huella y la próxima carga lo vuelve a fragmentar.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_VERSION = 1
+
+# Raíz del proyecto: los orígenes se guardan relativos a ella para que el ID no
+# dependa del directorio desde el que se ejecuta la carga
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+def source_key(file_path: str) -> str:
+    """Identificador estable de un archivo de origen (ruta relativa al proyecto, con '/')"""
+    path = os.path.abspath(file_path)
+    if path.startswith(PROJECT_ROOT + os.sep):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    return path.replace(os.sep, "/")
+
+def content_hash(text: str) -> str:
+    """SHA-256 del texto de un fragmento"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(source: str, text_hash: str) -> str:
+    """
+    ID determinista de un fragmento: prefijo por archivo + hash del contenido
+
+    El prefijo común permite listar en Pinecone todos los vectores de un archivo.
+    """
+    source_prefix = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    return f"{source_prefix}-{text_hash[:32]}"
+
+class IngestManifest:
+    """Archivo JSON con los IDs indexados por archivo de origen"""
+
+    def __init__(self, path: str, index_name: str):
+        self.path = path
+        self.index_name = index_name
+        self.sources: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self.sources = {}
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("index_name") != self.index_name:
+            raise ValueError(
+                f"El manifiesto {self.path} corresponde al índice '{data.get('index_name')}', "
+                f"no a '{self.index_name}'"
+            )
+        self.sources = data.get("sources", {})
+
+    def save(self):
+        """Escribe el manifiesto de forma atómica (archivo temporal + rename)"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "index_name": self.index_name,
+                "sources": self.sources
+            }, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def chunk_ids(self, source: str) -> List[str]:
+        """IDs indexados actualmente para un archivo"""
+        return list(self.sources.get(source, {}).get("chunk_ids", []))
+
+    def fingerprint(self, source: str) -> Optional[str]:
+        """Huella (contenido + configuración de fragmentación) con la que se indexó el archivo"""
+        return self.sources.get(source, {}).get("fingerprint")
+
+    def update_source(self, source: str, chunk_ids: Iterable[str], fingerprint: Optional[str] = None,
+                      duplicate_of: Optional[Dict[str, str]] = None):
+        """
+        Registra los IDs que quedaron indexados para un archivo
+
+        Args:
+            duplicate_of: ID descartado por casi duplicado -> ID indexado que lo cubre
+        """
+        self.sources[source] = {
+            "chunk_ids": sorted(set(chunk_ids)),
+            "fingerprint": fingerprint,
+            "duplicate_of": dict(sorted((duplicate_of or {}).items())),
+            "updated_at": datetime.now().isoformat()
+        }
+
+    def dependents(self, chunk_ids: Iterable[str]) -> List[str]:
+        """Archivos con fragmentos descartados como casi duplicados de alguno de `chunk_ids`"""
+        removed = set(chunk_ids)
+        return sorted(
+            source for source, entry in self.sources.items()
+            if removed & set(entry.get("duplicate_of", {}).values())
+        )
+
+    def invalidate(self, source: str):
+        """Olvida la huella de un archivo: la próxima carga lo vuelve a fragmentar"""
+        if source in self.sources:
+            self.sources[source]["fingerprint"] = None
+
+    def stale_sources(self) -> List[str]:
+        """Archivos registrados sin huella (invalidados o importados de un snapshot)"""
+        return sorted(source for source, entry in self.sources.items() if not entry.get("fingerprint"))
+
+    def remove_source(self, source: str):
+        self.sources.pop(source, None)
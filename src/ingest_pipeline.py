@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Ingest Pipeline - Embedding y upsert concurrentes para la carga de documentos
+
+Los fragmentos se agrupan en lotes por cantidad de tokens (no por cantidad de
+documentos), se embeben con varias peticiones simultáneas a la API y se suben a
+Pinecone desde un hilo aparte mientras los siguientes lotes se siguen embebiendo.
+Ante respuestas 429 la concurrencia se reduce a la mitad y se espera con backoff
+exponencial; tras una racha de éxitos vuelve a crecer.
+
+Con un EmbeddingStore, los textos cuyo vector ya está en disco van directo al
+upsert sin llamar a la API, y cada vector nuevo se guarda en cuanto se recibe.
+"""
+
+import os
+import time
+import queue
+import random
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from ingest_manifest import content_hash
+
+def token_counter() -> Callable[[str], int]:
+    """Cuenta tokens con tiktoken si está instalado; si no, estima 1 token cada 4 caracteres"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: max(1, len(text) // 4)
+
+def token_batches(items: Iterable[Tuple[str, object]], count_tokens: Callable[[str], int],
+                  max_tokens: int, max_items: int) -> Iterator[Tuple[List[Tuple[str, object]], int]]:
+    """
+    Agrupa (id, documento) en lotes de hasta `max_tokens` tokens y `max_items` elementos
+
+    Yields:
+        (lote, tokens del lote)
+    """
+    batch, batch_tokens = [], 0
+    for item in items:
+        tokens = count_tokens(item[1].page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Detecta un 429 de OpenAI sin depender de la versión del SDK"""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "http_status", None) == 429:
+        return True
+    return "RateLimit" in type(error).__name__ or "429" in str(error)
+
+class AdaptiveLimiter:
+    """Límite de concurrencia que se reduce a la mitad ante 429 y crece de a uno tras éxitos"""
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self.limit < self.max_limit and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_rate_limited(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+
+@dataclass
+class IngestStats:
+    """Progreso y rendimiento de una carga"""
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_cached: int = 0
+    chunks_upserted: int = 0
+    tokens_embedded: int = 0
+    embed_requests: int = 0
+    rate_limited: int = 0
+    retries: int = 0
+    upsert_requests: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts):
+        """Suma contadores desde varios hilos"""
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"{self.chunks_upserted} fragmentos y {self.tokens_embedded} tokens en {elapsed:.1f}s "
+            f"({self.chunks_upserted / elapsed:.1f} fragmentos/s, {self.tokens_embedded / elapsed:.0f} tokens/s), "
+            f"{self.chunks_cached} vectores reutilizados del almacén, "
+            f"{self.embed_requests} peticiones de embedding, {self.rate_limited} respuestas 429, "
+            f"{self.upsert_requests} upserts"
+        )
+
+class IngestPipeline:
+    """Embebe y sube fragmentos con concurrencia adaptativa y upsert solapado"""
+
+    def __init__(self, embeddings, index, concurrency: int = None, max_batch_tokens: int = None,
+                 max_batch_items: int = None, upsert_batch_size: int = None, max_retries: int = 6,
+                 text_key: str = "text", store=None):
+        """
+        Args:
+            embeddings: Objeto con embed_documents(textos) (p. ej. OpenAIEmbeddings)
+            index: Índice de Pinecone (upsert)
+            concurrency: Peticiones de embedding simultáneas (INGEST_EMBED_CONCURRENCY, por defecto 4)
+            max_batch_tokens: Tokens por petición de embedding (INGEST_BATCH_TOKENS, por defecto 100000)
+            max_batch_items: Textos por petición de embedding (INGEST_BATCH_ITEMS, por defecto 1000)
+            upsert_batch_size: Vectores por upsert (INGEST_UPSERT_BATCH, por defecto 100)
+            max_retries: Reintentos por lote ante errores (429 incluidos)
+            text_key: Metadato con el texto del fragmento (el que lee PineconeVectorStore)
+            store: EmbeddingStore opcional para reutilizar vectores ya calculados
+        """
+        self.embeddings = embeddings
+        self.index = index
+        self.concurrency = concurrency or int(os.getenv("INGEST_EMBED_CONCURRENCY", 4))
+        self.max_batch_tokens = max_batch_tokens or int(os.getenv("INGEST_BATCH_TOKENS", 100000))
+        self.max_batch_items = max_batch_items or int(os.getenv("INGEST_BATCH_ITEMS", 1000))
+        self.upsert_batch_size = upsert_batch_size or int(os.getenv("INGEST_UPSERT_BATCH", 100))
+        self.max_retries = max_retries
+        self.text_key = text_key
+        self.store = store
+        self.count_tokens = token_counter()
+        self.limiter = AdaptiveLimiter(self.concurrency)
+
+    def _embed_batch(self, batch, tokens, stats: IngestStats):
+        """Embebe un lote con reintentos; ante 429 reduce la concurrencia y espera"""
+        texts = [doc.page_content for _, doc in batch]
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                stats.add(embed_requests=1)
+                vectors = self.embeddings.embed_documents(texts)
+                self.limiter.on_success()
+                break
+            except Exception as e:
+                error = e
+            finally:
+                # El lugar se libera antes del backoff: mientras este lote espera,
+                # otros pueden usarlo (la concurrencia la baja on_rate_limited, no la espera)
+                self.limiter.release()
+            if attempt >= self.max_retries:
+                raise error
+            rate_limited = is_rate_limit_error(error)
+            stats.add(retries=1, rate_limited=int(rate_limited))
+            if rate_limited:
+                self.limiter.on_rate_limited()
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"⚠️ Lote de {len(batch)} fragmentos falló ({type(error).__name__}), "
+                  f"reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s "
+                  f"(concurrencia {self.limiter.limit})")
+            time.sleep(delay)
+        
+        if self.store is not None:
+            # Guardar antes del upsert: si este falla, el reintento no vuelve a pagar el embedding.
+            # Fuera de los reintentos: un error de disco no repite la llamada a la API
+            try:
+                self.store.put_many([self._text_hash(doc) for _, doc in batch], vectors)
+            except Exception as e:
+                print(f"⚠️ No se pudieron guardar {len(batch)} vectores en el almacén: {e}")
+        stats.add(chunks_embedded=len(batch), tokens_embedded=tokens)
+        return batch, vectors
+
+    @staticmethod
+    def _text_hash(doc) -> str:
+        return doc.metadata.get("chunk_hash") or content_hash(doc.page_content)
+
+    def _without_cached(self, items, results: "queue.Queue", stats: IngestStats):
+        """Manda al upsert los fragmentos con vector almacenado y deja pasar el resto"""
+        items = iter(items)
+        while True:
+            group = list(islice(items, self.upsert_batch_size))
+            if not group:
+                return
+            vectors = self.store.get_many([self._text_hash(doc) for _, doc in group])
+            cached = [(item, vector) for item, vector in zip(group, vectors) if vector is not None]
+            if cached:
+                stats.add(chunks_cached=len(cached))
+                results.put(([item for item, _ in cached], [vector for _, vector in cached]))
+            yield from (item for item, vector in zip(group, vectors) if vector is None)
+
+    def _upsert_worker(self, results: "queue.Queue", stats: IngestStats, errors: list):
+        """Sube a Pinecone los lotes embebidos mientras se embeben los siguientes"""
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            if errors:
+                continue  # Tras un fallo solo se vacía la cola
+            batch, vectors = item
+            try:
+                records = [
+                    {
+                        "id": doc_id,
+                        "values": vector,
+                        "metadata": {**doc.metadata, self.text_key: doc.page_content}
+                    }
+                    for (doc_id, doc), vector in zip(batch, vectors)
+                ]
+                for i in range(0, len(records), self.upsert_batch_size):
+                    self.index.upsert(vectors=records[i:i + self.upsert_batch_size])
+                    stats.add(upsert_requests=1)
+                stats.add(chunks_upserted=len(records))
+                self._print_progress(stats)
+            except Exception as e:
+                errors.append(e)
+
+    def _print_progress(self, stats: IngestStats):
+        total = f"/{stats.chunks_total}" if stats.chunks_total else ""
+        elapsed = max(stats.elapsed, 1e-9)
+        print(f"📦 {stats.chunks_upserted}{total} fragmentos subidos "
+              f"({stats.chunks_upserted / elapsed:.1f}/s, {stats.tokens_embedded / elapsed:.0f} tokens/s, "
+              f"concurrencia {self.limiter.limit})")
+
+    def run(self, items: Iterable[Tuple[str, object]], total: int = None) -> IngestStats:
+        """
+        Embebe y sube (id, documento); acepta un generador y mantiene acotado lo que está en vuelo
+
+        Args:
+            items: Pares (id determinista, documento con page_content y metadata)
+            total: Cantidad total de fragmentos, si se conoce, para el progreso
+
+        Returns:
+            IngestStats: Estadísticas de la carga
+
+        Raises:
+            La primera excepción de embedding o upsert, después de detener el pipeline
+        """
+        stats = IngestStats(chunks_total=total)
+        # Cola acotada: si el upsert se atrasa, el embedding espera en lugar de acumular vectores
+        results: "queue.Queue" = queue.Queue(maxsize=self.concurrency * 2)
+        errors: list = []
+        uploader = threading.Thread(target=self._upsert_worker, args=(results, stats, errors),
+                                    name="IngestUpsert", daemon=True)
+        uploader.start()
+
+        if self.store is not None:
+            items = self._without_cached(items, results, stats)
+
+        pending = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="IngestEmbed") as executor:
+                for batch, tokens in token_batches(items, self.count_tokens, self.max_batch_tokens, self.max_batch_items):
+                    if errors:
+                        break
+                    # Ventana acotada de lotes en vuelo
+                    while len(pending) >= self.concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            results.put(future.result())
+                    pending.add(executor.submit(self._embed_batch, batch, tokens, stats))
+                for future in pending:
+                    results.put(future.result())
+                pending = set()
+        finally:
+            for future in pending:
+                future.cancel()
+            results.put(None)
+            uploader.join()
+
+        if errors:
+            raise errors[0]
+        print(f"✅ Carga terminada: {stats.summary()}")
+        return stats
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Job Runner - Ejecuta trabajos de chat en un event loop propio
+
+Los trabajos encolados desde /api/chat/jobs se procesan en un hilo con su propio
+event loop de asyncio, de modo que ningún hilo HTTP queda bloqueado mientras el
+LLM genera la respuesta. El resultado se publica en un JobStore.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict
+
+from admission import AdmissionRejected
+from bot_core import BotCore, MessageInput
+from job_store import JobStore, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from tracing import trace_context, get_request_id
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class ChatJobRunner:
+    """Cola de trabajos de chat con concurrencia y pendientes acotados"""
+
+    def __init__(self, bot_core: BotCore, store: JobStore, max_concurrency: int = None, max_pending: int = None):
+        """
+        Args:
+            bot_core: Procesa cada mensaje
+            store: Donde se publican estado y resultado
+            max_concurrency: Trabajos procesándose a la vez (CHAT_JOB_CONCURRENCY, por defecto 8)
+            max_pending: Trabajos aceptados sin terminar (CHAT_JOB_MAX_PENDING, por defecto 200)
+        """
+        self.bot_core = bot_core
+        self.store = store
+        self.max_concurrency = max_concurrency or int(os.getenv("CHAT_JOB_CONCURRENCY", 8))
+        self.max_pending = max_pending or int(os.getenv("CHAT_JOB_MAX_PENDING", 200))
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._thread = threading.Thread(target=self._run_loop, name="ChatJobRunner", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, message_input: MessageInput) -> str:
+        """
+        Encola un mensaje y devuelve el id del trabajo sin esperar la respuesta
+
+        Raises:
+            AdmissionRejected: si ya hay demasiados trabajos pendientes
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise AdmissionRejected("jobs_full", 5)
+            self._pending += 1
+            self._submitted += 1
+
+        job_id = str(uuid.uuid4())
+        # El trabajo conserva el request ID del POST para correlacionar logs y trazas
+        request_id = get_request_id() or job_id
+        now = datetime.now().isoformat()
+        try:
+            self.store.create({
+                "job_id": job_id,
+                "status": JOB_QUEUED,
+                "name": message_input.username,
+                "request_id": request_id,
+                "created_at": now,
+                "updated_at": now,
+                "response": None,
+                "error": None
+            })
+            asyncio.run_coroutine_threadsafe(self._run_job(job_id, request_id, message_input), self.loop)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job_id
+
+    async def _run_job(self, job_id: str, request_id: str, message_input: MessageInput):
+        with trace_context("chat_job", request_id):
+            await self._process_job(job_id, message_input)
+
+    async def _process_job(self, job_id: str, message_input: MessageInput):
+        try:
+            async with self._semaphore:
+                with self._lock:
+                    self._running += 1
+                try:
+                    await asyncio.to_thread(
+                        self.store.update, job_id, status=JOB_RUNNING, updated_at=datetime.now().isoformat()
+                    )
+                    response = await self.bot_core.process_message(message_input)
+                    await asyncio.to_thread(
+                        self.store.update,
+                        job_id,
+                        status=JOB_DONE,
+                        updated_at=datetime.now().isoformat(),
+                        response={
+                            "content": response.content,
+                            "response_type": response.response_type,
+                            "metadata": response.metadata
+                        }
+                    )
+                    with self._lock:
+                        self._completed += 1
+                finally:
+                    with self._lock:
+                        self._running -= 1
+        except Exception as e:
+            logger.error(f"❌ Error en trabajo de chat {job_id}: {e}")
+            with self._lock:
+                self._failed += 1
+            try:
+                await asyncio.to_thread(
+                    self.store.update, job_id, status=JOB_FAILED, updated_at=datetime.now().isoformat(), error="Error interno del servidor"
+                )
+            except Exception as store_error:
+                logger.error(f"❌ No se pudo registrar el fallo del trabajo {job_id}: {store_error}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict:
+        """Estado de la cola de trabajos"""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected
+            }
+
+    def close(self, timeout: float = 30.0):
+        """Deja terminar los trabajos en curso (hasta `timeout`) y detiene el event loop"""
+        async def drain():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+
+        if self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(drain(), self.loop).result(timeout + 1)
+            except Exception as e:
+                logger.warning(f"⚠️ Trabajos de chat sin terminar al cerrar: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+        self.store.close()
+        logger.info("✅ ChatJobRunner cerrado correctamente")
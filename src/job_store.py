@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Job Store - Almacenamiento de trabajos de chat asíncronos
+
+Guarda el estado y el resultado de cada trabajo encolado en /api/chat/jobs con un
+tiempo de vida limitado. `InMemoryJobStore` sirve para una sola réplica;
+`RedisJobStore` permite consultar el resultado desde cualquier réplica.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+class JobStore(ABC):
+    """Interfaz común de los almacenes de trabajos"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def create(self, job: Dict[str, Any]):
+        """Registra un trabajo nuevo (debe incluir `job_id`)"""
+
+    @abstractmethod
+    def update(self, job_id: str, **fields):
+        """Actualiza campos de un trabajo existente y notifica a quien espera"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve una copia del trabajo o None si no existe o expiró"""
+
+    @abstractmethod
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Espera hasta `timeout` segundos a que el trabajo termine y lo devuelve"""
+
+    def close(self):
+        """Libera los recursos del almacén"""
+
+class InMemoryJobStore(JobStore):
+    """Almacén en memoria del proceso, con expiración y espera por condición"""
+
+    def __init__(self, ttl: float = 600, max_jobs: int = 10000):
+        super().__init__(ttl)
+        self.max_jobs = max_jobs
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._expires: Dict[str, float] = {}
+
+    def create(self, job: Dict[str, Any]):
+        with self._cond:
+            self._purge()
+            self._jobs[job["job_id"]] = dict(job)
+            self._expires[job["job_id"]] = time.monotonic() + self.ttl
+
+    def update(self, job_id: str, **fields):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            self._expires[job_id] = time.monotonic() + self.ttl
+            self._cond.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            return self._get_locked(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            job = self._get_locked(job_id)
+            while job is not None and job["status"] not in FINISHED_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                job = self._get_locked(job_id)
+            return job
+
+    def _get_locked(self, job_id: str) -> Optional[Dict[str, Any]]:
+        expires_at = self._expires.get(job_id)
+        if expires_at is None:
+            return None
+        if expires_at <= time.monotonic():
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+            return None
+        return dict(self._jobs[job_id])
+
+    def _purge(self):
+        """Elimina trabajos expirados y, si sigue lleno, los terminados más antiguos (requiere self._cond)"""
+        now = time.monotonic()
+        for job_id in [j for j, exp in self._expires.items() if exp <= now]:
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+        if len(self._jobs) >= self.max_jobs:
+            finished = [j for j, job in self._jobs.items() if job["status"] in FINISHED_STATES]
+            for job_id in finished[:len(self._jobs) - self.max_jobs + 1]:
+                self._jobs.pop(job_id, None)
+                self._expires.pop(job_id, None)
+
+class RedisJobStore(JobStore):
+    """Almacén compartido en Redis para despliegues con varias réplicas"""
+
+    def __init__(self, url: str, ttl: float = 600, poll_interval: float = 0.25, prefix: str = "sau:job:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisJobStore requiere el paquete 'redis' (pip install redis)") from e
+        super().__init__(ttl)
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        logger.info("✅ RedisJobStore conectado")
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}{job_id}"
+
+    def create(self, job: Dict[str, Any]):
+        self.client.set(self._key(job["job_id"]), json.dumps(job), ex=int(self.ttl))
+
+    def update(self, job_id: str, **fields):
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        # Solo el runner que ejecuta el trabajo lo actualiza, no hace falta transacción
+        self.client.set(self._key(job_id), json.dumps(job), ex=int(self.ttl))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self._key(job_id))
+        return json.loads(raw) if raw else None
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job["status"] not in FINISHED_STATES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+            job = self.get(job_id)
+        return job
+
+    def close(self):
+        self.client.close()
+
+def create_job_store(url: str = None) -> JobStore:
+    """
+    Crea el almacén de trabajos según JOB_STORE_URL
+
+    Sin URL (o `memory://`) usa memoria del proceso; con `redis://` o `rediss://` usa Redis.
+    El tiempo de vida de los trabajos se toma de JOB_TTL (segundos, por defecto 600).
+    """
+    url = url if url is not None else os.getenv("JOB_STORE_URL", "")
+    ttl = float(os.getenv("JOB_TTL", 600))
+    if url.startswith(("redis://", "rediss://")):
+        return RedisJobStore(url, ttl=ttl)
+    if url and not url.startswith("memory://"):
+        raise ValueError(f"JOB_STORE_URL no soportada: {url}")
+    return InMemoryJobStore(ttl=ttl)
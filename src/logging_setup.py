@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Logging Setup - Logging asíncrono y estructurado para el servidor
+
+Los hilos que atienden peticiones solo encolan el registro (QueueHandler); un hilo
+de fondo (QueueListener) lo formatea como JSON y lo escribe en stdout y en un archivo
+con rotación por tamaño. Los registros INFO/DEBUG de los componentes de alto volumen
+se muestrean, los mensajes largos se truncan y, si la cola se llena, se descartan
+registros en lugar de bloquear el turno.
+"""
+
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+from tracing import get_request_id
+
+# Componentes que loguean en cada turno; sus INFO/DEBUG se muestrean
+DEFAULT_SAMPLED_LOGGERS = "session_manager,user_manager,database_manager,sqlite_manager,message_writer,counter_aggregator"
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros INFO/DEBUG de ciertos loggers"""
+
+    def __init__(self, loggers, rate: float):
+        super().__init__()
+        self.loggers = frozenset(loggers)
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        # Los módulos se importan como "src.x" o "x" según el punto de entrada
+        if record.name.rsplit('.', 1)[-1] not in self.loggers:
+            return True
+        return random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea; el texto del mensaje se trunca a `max_message_chars`"""
+
+    def __init__(self, max_message_chars: int = 1000):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            message = message[:self.max_message_chars] + f"... [{len(message) - self.max_message_chars} caracteres omitidos]"
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class TruncatingFormatter(logging.Formatter):
+    """Formato de texto legible (LOG_FORMAT=text) con el mismo límite de longitud"""
+
+    def __init__(self, max_message_chars: int = 1000):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s')
+        self.max_message_chars = max_message_chars
+
+    def formatMessage(self, record):
+        if len(record.message) > self.max_message_chars:
+            record.message = record.message[:self.max_message_chars] + "..."
+        return super().formatMessage(record)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) registros cuando la cola está llena"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolver en el hilo de origen lo que depende de él (request ID, argumentos,
+        # traceback) y dejar el formateo final al listener
+        record = copy.copy(record)
+        record.request_id = get_request_id()
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Configura el logging raíz del proceso
+
+    Variables de entorno:
+        LOG_LEVEL: nivel mínimo (por defecto INFO)
+        LOG_FORMAT: "json" (por defecto) o "text"
+        LOG_FILE: archivo con rotación (por defecto web_bot.log; vacío para solo stdout)
+        LOG_MAX_BYTES / LOG_BACKUP_COUNT: tamaño por archivo y archivos rotados (10 MB, 5)
+        LOG_QUEUE_SIZE: registros en espera antes de descartar (por defecto 10000)
+        LOG_SAMPLE_RATE: fracción de INFO/DEBUG que se conserva de LOG_SAMPLED_LOGGERS (por defecto 0.1)
+        LOG_MAX_MESSAGE_CHARS: longitud máxima de cada mensaje (por defecto 1000)
+
+    Returns:
+        QueueListener ya iniciado (se detiene y vacía la cola al salir del proceso)
+    """
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    max_chars = int(os.getenv("LOG_MAX_MESSAGE_CHARS", 1000))
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = TruncatingFormatter(max_chars)
+    else:
+        formatter = JsonFormatter(max_chars)
+
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = os.getenv("LOG_FILE", "web_bot.log")
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+            encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    sampled = [name.strip() for name in os.getenv("LOG_SAMPLED_LOGGERS", DEFAULT_SAMPLED_LOGGERS).split(",") if name.strip()]
+    # Muestrear antes de encolar: lo descartado no cuesta formateo ni I/O
+    queue_handler.addFilter(SamplingFilter(sampled, float(os.getenv("LOG_SAMPLE_RATE", 0.1))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+def _stop_listener(listener: logging.handlers.QueueListener):
+    """Escribe lo que quede en la cola al salir (si nadie detuvo el listener antes)"""
+    if getattr(listener, "_thread", None) is not None:
+        listener.stop()
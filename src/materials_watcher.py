@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Materials Watcher - Re-indexado continuo de materials/ al detectar cambios
+
+En Linux se usa inotify (vía ctypes, sin dependencias); en otros sistemas, o si
+inotify no está disponible, se compara periódicamente el mtime y tamaño de los
+archivos. Los eventos se agrupan (debounce) hasta que el directorio queda quieto
+`debounce` segundos, y entonces se sincroniza solo lo que cambió: los archivos
+modificados pasan por DocumentProcessor (que sube y borra solo la diferencia de
+fragmentos) y los borrados se quitan del índice.
+"""
+
+import os
+import sys
+import time
+import glob
+import struct
+import select
+import ctypes
+import ctypes.util
+from typing import Dict, Optional, Set, Tuple
+from ingest_manifest import PROJECT_ROOT, source_key
+
+WATCHED_EXTENSIONS = ('.txt', '.pdf')
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+EVENT_HEADER = struct.Struct("iIII")
+
+def is_watched(path: str) -> bool:
+    """Archivos que se indexan: .txt y .pdf visibles (no manifiestos ni temporales)"""
+    name = os.path.basename(path)
+    return not name.startswith('.') and name.lower().endswith(WATCHED_EXTENSIONS)
+
+def list_materials(directory: str):
+    return sorted(path for path in glob.glob(os.path.join(directory, '*')) if is_watched(path) and os.path.isfile(path))
+
+class InotifyWatcher:
+    """Eventos de un directorio con inotify (solo Linux)"""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, directory: str):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify solo está disponible en Linux")
+        self.directory = directory
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch falló para {directory}")
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """
+        Espera eventos hasta `timeout` segundos
+
+        Returns:
+            Rutas afectadas (vacío si no hubo eventos), o None si se perdieron eventos
+            (cola desbordada) y hay que revisar todo el directorio
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        paths, offset = set(), 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                raise FileNotFoundError(f"El directorio vigilado ya no existe: {self.directory}")
+            if name:
+                paths.add(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class PollingWatcher:
+    """Alternativa portable: compara mtime y tamaño de los archivos cada `interval` segundos"""
+
+    def __init__(self, directory: str, interval: float = 2.0):
+        self.directory = directory
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in list_materials(self.directory):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        changed = {path for path in current.keys() | self._snapshot.keys()
+                   if current.get(path) != self._snapshot.get(path)}
+        self._snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+def create_watcher(directory: str, poll_interval: float = 2.0):
+    """inotify si está disponible; si no, sondeo periódico"""
+    try:
+        watcher = InotifyWatcher(directory)
+        print(f"👀 Vigilando {directory} con inotify")
+        return watcher
+    except (OSError, AttributeError) as e:
+        print(f"⚠️ inotify no disponible ({e}); sondeando {directory} cada {poll_interval}s")
+        return PollingWatcher(directory, poll_interval)
+
+def sync_cycle(processor, directory: str, paths: Optional[Set[str]]) -> Dict:
+    """
+    Sincroniza un grupo de cambios
+
+    Args:
+        processor: DocumentProcessor
+        directory: Directorio vigilado
+        paths: Rutas afectadas, o None para reconciliar todo el directorio
+
+    Returns:
+        dict: Resumen del ciclo
+    """
+    started = time.perf_counter()
+    if paths is None:
+        # Reconciliación completa: los archivos presentes más los indexados que ya no existen
+        directory_path = os.path.abspath(directory)
+        indexed = {os.path.join(PROJECT_ROOT, source) for source in processor.manifest.sources}
+        paths = set(list_materials(directory)) | {
+            path for path in indexed if os.path.dirname(os.path.abspath(path)) == directory_path
+        }
+    changed = sorted(path for path in paths if is_watched(path) and os.path.isfile(path))
+    removed = sorted(path for path in paths if is_watched(path) and not os.path.exists(path))
+
+    processor.last_sync = {}
+    if changed:
+        processor.process_multiple_files(changed)
+    sync = dict(processor.last_sync)
+    removed_files = 0
+    for path in removed:
+        deleted = processor.remove_file(path)
+        if deleted is not None:
+            removed_files += 1
+            sync['deleted'] = sync.get('deleted', 0) + deleted
+
+    # Archivos sin cambios cuyos casi duplicados perdieron el original en este ciclo
+    stale = set(processor.manifest.stale_sources())
+    rechunk = [path for path in list_materials(directory) if source_key(path) in stale and path not in changed]
+    if rechunk:
+        processor.last_sync = {}
+        processor.process_multiple_files(rechunk)
+        for key, count in processor.last_sync.items():
+            sync[key] = sync.get(key, 0) + count
+    return {
+        "changed_files": len(changed),
+        "removed_files": removed_files,
+        "rechunked_files": len(rechunk),
+        "uploaded": sync.get('uploaded', 0),
+        "deleted": sync.get('deleted', 0),
+        "unchanged": sync.get('unchanged', 0),
+        "elapsed": time.perf_counter() - started,
+    }
+
+def watch_materials(processor, directory: str, debounce: float = 2.0, retry_interval: float = 30.0):
+    """
+    Bucle del modo vigilancia: reconcilia al iniciar y luego sincroniza cada grupo de cambios
+
+    Cada evento reinicia la espera de `debounce` segundos, así que una copia de varios
+    archivos o un guardado en varias escrituras produce un solo ciclo. Si un ciclo
+    falla, sus rutas quedan pendientes y se reintentan a los `retry_interval` segundos.
+    """
+    watcher = create_watcher(directory, poll_interval=debounce)
+    pending: Optional[Set[str]] = None  # None = reconciliación completa
+    deadline = time.monotonic()
+    try:
+        while True:
+            has_work = pending is None or bool(pending)
+            timeout = max(0.0, deadline - time.monotonic()) if has_work else 60.0
+            events = watcher.wait(timeout) if timeout > 0 else set()
+            if events is None:
+                # Se perdieron eventos: revisar todo el directorio
+                pending = None
+                deadline = time.monotonic() + debounce
+                continue
+            events = {path for path in events if is_watched(path)}
+            if events:
+                if pending is not None:
+                    pending |= events
+                deadline = time.monotonic() + debounce
+                continue
+            if not has_work or time.monotonic() < deadline:
+                continue
+
+            try:
+                summary = sync_cycle(processor, directory, pending)
+                print(f"🔁 Ciclo de sincronización: {summary['changed_files']} archivos modificados, "
+                      f"{summary['removed_files']} eliminados; {summary['uploaded']} fragmentos subidos, "
+                      f"{summary['deleted']} borrados, {summary['unchanged']} sin cambios "
+                      f"({summary['elapsed']:.1f}s)", flush=True)
+                pending = set()
+            except Exception as e:
+                print(f"❌ Ciclo de sincronización fallido, se reintentará en {retry_interval:.0f}s: {e}", flush=True)
+                deadline = time.monotonic() + retry_interval
+    except KeyboardInterrupt:
+        print("👋 Modo vigilancia detenido")
+    finally:
+        watcher.close()
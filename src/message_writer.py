@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Message Writer - Persistencia diferida (write-behind) de mensajes de conversación
+
+Los mensajes se encolan en memoria y un hilo de fondo los escribe por lotes
+(una sola sentencia multi-fila por lote), con reintentos fuera del camino crítico
+de la respuesta al usuario.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Marca que despierta al hilo escritor para que escriba sin esperar a completar el lote
+_FLUSH_SENTINEL = object()
+
+@dataclass
+class MessageRecord:
+    """Mensaje pendiente de persistir en conversation_messages"""
+    session_id: str
+    message: str
+    is_user: bool
+    timestamp: datetime = field(default_factory=datetime.now)
+
+class MessageWriter:
+    """Cola acotada + hilo escritor que persiste mensajes por lotes"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[MessageRecord]], None],
+        max_queue_size: int = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_retries: int = 5,
+        retry_backoff: float = 0.5
+    ):
+        """
+        Args:
+            flush_fn: Función que escribe un lote de MessageRecord en una sola transacción
+            max_queue_size: Tamaño máximo de la cola (MESSAGE_WRITER_QUEUE_SIZE, por defecto 1000)
+            batch_size: Mensajes máximos por lote (MESSAGE_WRITER_BATCH_SIZE, por defecto 100)
+            flush_interval: Segundos máximos que un mensaje espera a completar lote
+                (MESSAGE_WRITER_FLUSH_INTERVAL, por defecto 0.2)
+            max_retries: Intentos por lote antes de descartarlo
+            retry_backoff: Espera inicial entre reintentos (se duplica en cada intento)
+        """
+        self.flush_fn = flush_fn
+        self.max_queue_size = max_queue_size or int(os.getenv('MESSAGE_WRITER_QUEUE_SIZE', 1000))
+        self.batch_size = batch_size or int(os.getenv('MESSAGE_WRITER_BATCH_SIZE', 100))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('MESSAGE_WRITER_FLUSH_INTERVAL', 0.2))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._cond = threading.Condition()
+        self._pending = 0  # Encolados y aún no escritos ni descartados
+
+        # Estadísticas
+        self._written = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._batches = 0
+        self._failed_attempts = 0
+        self._last_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="MessageWriter", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ MessageWriter iniciado (cola={self.max_queue_size}, lote={self.batch_size}, intervalo={self.flush_interval}s)")
+
+    def submit(self, record: MessageRecord, timeout: float = 0.05) -> bool:
+        """
+        Encola un mensaje para escritura diferida
+
+        Returns:
+            bool: False si el writer está cerrado o la cola sigue llena tras `timeout`;
+                  el llamador debe entonces escribir el mensaje de forma síncrona
+        """
+        if self._stop.is_set():
+            return False
+        with self._cond:
+            self._pending += 1
+        try:
+            self._queue.put(record, timeout=timeout)
+            return True
+        except queue.Full:
+            with self._cond:
+                self._pending -= 1
+                self._rejected += 1
+                self._cond.notify_all()
+            logger.warning("⚠️ Cola de MessageWriter llena, se escribirá de forma síncrona")
+            return False
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Fuerza la escritura de lo encolado y espera a que termine. Devuelve True si quedó vacío"""
+        with self._cond:
+            if self._pending == 0:
+                return True
+        self._flush_requested.set()
+        try:
+            self._queue.put_nowait(_FLUSH_SENTINEL)
+        except queue.Full:
+            pass  # Con la cola llena el escritor no espera: los lotes salen completos
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Detiene el writer escribiendo antes todo lo pendiente"""
+        if self._stop.is_set():
+            return
+        logger.info(f"🧹 Cerrando MessageWriter ({self._queue.qsize()} mensajes pendientes)...")
+        drained = self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout)
+        if drained:
+            logger.info("✅ MessageWriter cerrado sin mensajes pendientes")
+        else:
+            logger.error(f"❌ MessageWriter cerrado con {self._pending} mensajes sin escribir")
+
+    def stats(self) -> Dict:
+        """Profundidad de cola y latencia de escritura por lote"""
+        with self._cond:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_queue_size,
+                "pending": self._pending,
+                "written": self._written,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+                "batches": self._batches,
+                "failed_attempts": self._failed_attempts,
+                "last_flush_ms": round(self._last_flush_ms, 2),
+                "avg_flush_ms": round(self._total_flush_ms / self._batches, 2) if self._batches else 0.0,
+                "max_flush_ms": round(self._max_flush_ms, 2),
+            }
+
+    def _collect_batch(self) -> List[MessageRecord]:
+        """Espera el primer mensaje y completa el lote hasta batch_size o flush_interval"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        if first is _FLUSH_SENTINEL:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self._flush_requested.is_set() or self._stop.is_set():
+                remaining = 0
+            else:
+                remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    record = self._queue.get_nowait()
+                else:
+                    record = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if record is _FLUSH_SENTINEL:
+                break
+            batch.append(record)
+        return batch
+
+    def _write_batch(self, batch: List[MessageRecord]):
+        """Escribe un lote con reintentos y backoff exponencial"""
+        for attempt in range(self.max_retries):
+            start = time.perf_counter()
+            try:
+                self.flush_fn(batch)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with self._cond:
+                    self._written += len(batch)
+                    self._batches += 1
+                    self._last_flush_ms = elapsed_ms
+                    self._total_flush_ms += elapsed_ms
+                    self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                logger.debug("💾 Lote de %d mensajes escrito en %.1fms", len(batch), elapsed_ms)
+                return
+            except Exception as e:
+                with self._cond:
+                    self._failed_attempts += 1
+                logger.warning(f"⚠️ Intento {attempt + 1}/{self.max_retries} fallido al escribir lote de {len(batch)} mensajes: {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+
+        with self._cond:
+            self._dropped += len(batch)
+        logger.error(f"❌ Se descartó un lote de {len(batch)} mensajes tras {self.max_retries} intentos")
+
+    def _run(self):
+        """Bucle del hilo escritor"""
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._pending -= len(batch)
+                    if self._pending == 0:
+                        self._flush_requested.clear()
+                    self._cond.notify_all()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Near Dedup - Detección de fragmentos casi duplicados con MinHash y LSH
+
+Cada fragmento se reduce a su conjunto de shingles (secuencias de `shingle_size`
+palabras normalizadas) y a una firma MinHash de `num_perm` valores; la fracción de
+valores iguales entre dos firmas estima la similitud de Jaccard de los textos. Las
+firmas se dividen en bandas (LSH) para comparar cada fragmento solo con los que
+comparten alguna banda, no con todos.
+
+El filtro es de una pasada: el primer fragmento de un grupo de casi duplicados se
+conserva y los siguientes se descartan y quedan en el reporte. Se puede sembrar con
+firmas de fragmentos ya indexados para detectar duplicados entre cargas.
+"""
+
+import os
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+WORD = re.compile(r"\w+", re.UNICODE)
+
+def shingles(text: str, size: int = 3) -> set:
+    """Shingles de `size` palabras en minúsculas (el texto corto es un único shingle)"""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Bandas y filas por banda cuyo umbral aproximado (1/b)^(1/r) está más cerca de `threshold`
+
+    Returns:
+        (bandas, filas)
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+class NearDuplicateFilter:
+    """Descarta fragmentos cuya similitud de Jaccard estimada con uno ya visto supera el umbral"""
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        """
+        Args:
+            threshold: Similitud de Jaccard a partir de la cual un fragmento es duplicado
+            num_perm: Valores por firma MinHash (más = estimación más precisa)
+            shingle_size: Palabras por shingle
+            seed: Semilla de las permutaciones (las firmas guardadas dependen de ella)
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[str]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._labels: Dict[str, str] = {}
+        self.checked = 0
+        self.dropped: List[Dict] = []
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash del texto (uint32 de largo num_perm)"""
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in shingles(text, self.shingle_size)),
+            dtype=np.uint64
+        )
+        # (a·h + b) mod p con h, a, b < 2^32: el producto cabe en 64 bits
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, signature: np.ndarray, label: str = None):
+        """Registra un fragmento conservado (o ya indexado) para las comparaciones siguientes"""
+        self._signatures[key] = signature
+        if label:
+            self._labels[key] = label
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].append(key)
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """(clave, similitud estimada) del fragmento registrado más parecido sobre el umbral"""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        best = None
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def filter(self, docs: Iterable, key_fn, label_fn=None) -> Iterator:
+        """
+        Deja pasar los fragmentos que no son casi duplicados de uno anterior
+
+        Args:
+            docs: Fragmentos (Documents); se consumen de a uno
+            key_fn: Clave única de un fragmento (p. ej. su ID determinista)
+            label_fn: Descripción para el reporte (p. ej. el archivo de origen)
+        """
+        for doc in docs:
+            self.checked += 1
+            key = key_fn(doc)
+            label = label_fn(doc) if label_fn else None
+            signature = self.signature(doc.page_content)
+            duplicate = self.find_duplicate(signature)
+            if duplicate and duplicate[0] != key:
+                kept_key, similarity = duplicate
+                self.dropped.append({
+                    "key": key,
+                    "label": label,
+                    "duplicate_of": kept_key,
+                    "duplicate_label": self._labels.get(kept_key),
+                    "similarity": round(similarity, 3),
+                    "preview": doc.page_content[:120],
+                })
+                continue
+            if key not in self._signatures:
+                self.add(key, signature, label)
+            yield doc
+
+    def signatures(self) -> Dict[str, np.ndarray]:
+        """Firmas registradas, por clave (para guardarlas y sembrar la próxima carga)"""
+        return dict(self._signatures)
+
+    def report(self, limit: int = 10) -> str:
+        """Resumen legible de los fragmentos descartados"""
+        lines = [f"🧹 Casi duplicados: {len(self.dropped)} de {self.checked} fragmentos descartados "
+                 f"(umbral {self.threshold}, {self.bands} bandas × {self.rows} filas)"]
+        for entry in self.dropped[:limit]:
+            lines.append(f"   - {entry['label'] or entry['key']} ≈ {entry['duplicate_label'] or entry['duplicate_of']} "
+                         f"({entry['similarity']:.0%}): {entry['preview']!r}")
+        if len(self.dropped) > limit:
+            lines.append(f"   ... y {len(self.dropped) - limit} más")
+        return "\n".join(lines)
+
+def load_signatures(path: str) -> Dict[str, np.ndarray]:
+    """Firmas guardadas por save_signatures ({} si el archivo no existe)"""
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        return dict(zip(data["keys"].tolist(), data["signatures"]))
+
+def save_signatures(path: str, signatures: Dict[str, np.ndarray]):
+    """Guarda firmas por clave en un .npz, de forma atómica"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    keys = sorted(signatures)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            keys=np.array(keys, dtype=str),
+            signatures=np.stack([signatures[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.uint32)
+        )
+    os.replace(tmp_path, path)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Pipeline - Ejecución de etapas asíncronas como grafo de dependencias
+
+Cada etapa declara de qué etapas depende y recibe sus resultados como argumentos
+con nombre. Las etapas independientes se ejecutan en paralelo y se registra la
+duración de cada una.
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from tracing import span
+
+class StageGraph:
+    """Grafo de etapas async con medición de tiempos por etapa"""
+
+    def __init__(self):
+        self._stages: "OrderedDict[str, tuple]" = OrderedDict()
+        self.timings: Dict[str, float] = {}  # etapa -> milisegundos
+
+    def add(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = ()):
+        """
+        Registra una etapa
+
+        Args:
+            name: Nombre único de la etapa
+            fn: Corrutina que recibe como kwargs los resultados de sus dependencias
+            deps: Etapas (ya registradas) que deben terminar antes
+        """
+        deps = tuple(deps)
+        if name in self._stages:
+            raise ValueError(f"Etapa duplicada: {name}")
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"La etapa '{name}' depende de etapas no registradas: {missing}")
+        self._stages[name] = (fn, deps)
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Ejecuta todas las etapas lo antes posible según sus dependencias
+
+        Returns:
+            Dict: Resultado de cada etapa. Si una etapa falla, se cancelan las demás
+                  y se propaga su excepción.
+        """
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_stage(name, fn, deps):
+            kwargs = {dep: await tasks[dep] for dep in deps}
+            start = time.perf_counter()
+            try:
+                with span(f"stage.{name}"):
+                    return await fn(**kwargs)
+            finally:
+                self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+        for name, (fn, deps) in self._stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, fn, deps))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # Recoger las excepciones restantes para no dejar tareas sin consumir
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter - Límites de peticiones por usuario e IP con token buckets
+
+Cada combinación (ruta, ámbito, clave) tiene un bucket de `capacity` fichas que se
+recarga a `capacity / period` fichas por segundo; cada petición consume una. El
+rechazo ocurre antes de tocar la base de datos o el LLM. Con varias réplicas los
+buckets pueden vivir en Redis para que el límite sea global.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RateLimit:
+    """`capacity` peticiones cada `period` segundos (ráfaga máxima = capacity)"""
+    capacity: int
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["RateLimit"]:
+        """Interpreta "N/S" (N peticiones cada S segundos); "off" o "0" desactiva el límite"""
+        spec = spec.strip().lower()
+        if spec in ("", "0", "off", "none"):
+            return None
+        capacity, _, period = spec.partition("/")
+        return cls(capacity=int(capacity), period=float(period or 60))
+
+class RateLimitExceeded(Exception):
+    """La petición superó el límite de su bucket"""
+
+    def __init__(self, route: str, scope: str, retry_after: int):
+        super().__init__(f"Límite de peticiones excedido en '{route}' por {scope}, reintentar en {retry_after}s")
+        self.route = route
+        self.scope = scope
+        self.retry_after = retry_after
+
+class RateLimitStore(ABC):
+    """Almacén de buckets"""
+
+    @abstractmethod
+    def consume(self, key: str, limit: RateLimit) -> float:
+        """Consume una ficha; devuelve 0 si se permitió o los segundos hasta la próxima ficha"""
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Buckets en memoria del proceso (límite por réplica)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float, RateLimit]] = {}
+
+    def consume(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (limit.capacity, now, limit))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, limit)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now, limit)
+                wait = (1 - tokens) / limit.refill_rate
+            if len(self._buckets) > self.max_keys:
+                self._purge(now)
+            return wait
+
+    def _purge(self, now: float):
+        """Descarta buckets que ya se habrían recargado por completo (requiere self._lock)"""
+        for key in [
+            k for k, (tokens, updated, limit) in self._buckets.items()
+            if tokens + (now - updated) * limit.refill_rate >= limit.capacity
+        ]:
+            del self._buckets[key]
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets compartidos en Redis; la actualización es atómica mediante un script Lua"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or capacity
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = "sau:rl:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisRateLimitStore requiere el paquete 'redis' (pip install redis)") from e
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._script = self.client.register_script(self.SCRIPT)
+        logger.info("✅ RedisRateLimitStore conectado")
+
+    def consume(self, key: str, limit: RateLimit) -> float:
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[limit.capacity, limit.refill_rate]))
+        except Exception as e:
+            # Sin Redis se prioriza seguir atendiendo sobre limitar
+            logger.warning(f"⚠️ Rate limit no disponible, se permite la petición: {e}")
+            return 0.0
+
+def create_rate_limit_store(url: str = None) -> RateLimitStore:
+    """Crea el almacén de buckets según RATE_LIMIT_STORE_URL (vacío o memory:// = en memoria, redis:// = Redis)"""
+    url = url if url is not None else os.getenv("RATE_LIMIT_STORE_URL", "")
+    if url.startswith(("redis://", "rediss://")):
+        return RedisRateLimitStore(url)
+    if url and not url.startswith("memory://"):
+        raise ValueError(f"RATE_LIMIT_STORE_URL no soportada: {url}")
+    return InMemoryRateLimitStore()
+
+class RateLimiter:
+    """Aplica límites configurados por ruta y ámbito (p. ej. "name", "ip")"""
+
+    def __init__(self, store: RateLimitStore, defaults: Dict[str, Dict[str, str]]):
+        """
+        Args:
+            store: Almacén de buckets
+            defaults: {ruta: {ámbito: "N/S"}}; cada valor se puede reemplazar con la
+                variable RATE_LIMIT_<RUTA>_<ÁMBITO> (p. ej. RATE_LIMIT_CHAT_NAME=20/60)
+        """
+        self.store = store
+        self.limits: Dict[str, Dict[str, RateLimit]] = {}
+        for route, scopes in defaults.items():
+            self.limits[route] = {}
+            for scope, spec in scopes.items():
+                limit = RateLimit.parse(os.getenv(f"RATE_LIMIT_{route.upper()}_{scope.upper()}", spec))
+                if limit:
+                    self.limits[route][scope] = limit
+
+        self._lock = threading.Lock()
+        self._allowed: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+
+    def check(self, route: str, **keys: str):
+        """
+        Consume una ficha de cada bucket indicado, p. ej. check("chat", ip="1.2.3.4")
+
+        Raises:
+            RateLimitExceeded: en el primer bucket sin fichas
+        """
+        for scope, value in keys.items():
+            limit = self.limits.get(route, {}).get(scope)
+            if limit is None or not value:
+                continue
+            counter = f"{route}.{scope}"
+            wait = self.store.consume(f"{route}:{scope}:{value}", limit)
+            with self._lock:
+                if wait > 0:
+                    self._rejected[counter] = self._rejected.get(counter, 0) + 1
+                else:
+                    self._allowed[counter] = self._allowed.get(counter, 0) + 1
+            if wait > 0:
+                raise RateLimitExceeded(route, scope, max(1, math.ceil(wait)))
+
+    def stats(self) -> Dict:
+        """Límites configurados y conteo de peticiones permitidas/rechazadas por ruta y ámbito"""
+        with self._lock:
+            return {
+                "limits": {
+                    route: {scope: f"{limit.capacity}/{limit.period:g}s" for scope, limit in scopes.items()}
+                    for route, scopes in self.limits.items()
+                },
+                "allowed": dict(self._allowed),
+                "rejected": dict(self._rejected)
+            }
@@ -3,13 +3,19 @@
 Gestor de sesiones y memoria por usuario - SIMPLIFICADO
 """
 
+import os
+import time
 import uuid
 import threading
 import logging
 import datetime
+from collections import OrderedDict, deque
 from typing import Dict, List, Optional
 from dataclasses import dataclass, field
-from database_manager import DatabaseManager # Importa DatabaseManager
+from storage_backend import StorageBackend
+from message_writer import MessageRecord
+from metrics import timed
+from tracing import traced, set_attribute
 import json # Añadir esta línea
 
 # Usar el logger configurado en run_telegram_bot.py
@@ -27,18 +33,73 @@ class UserSession:
     # Nota: first_name, last_name, personal_name, age, user_needs
     # ahora se gestionan en UserManager y UserInfo. Aquí solo el username.
 
+@dataclass
+class _CachedSession:
+    """Entrada de la cache de sesiones: la sesión y sus últimos mensajes"""
+    session: UserSession
+    history: deque  # (message, is_user) en orden cronológico
+    expires_at: float
+
 class SessionManager:
-    """Gestiona sesiones y memoria por usuario usando PostgreSQL"""
+    """Gestiona sesiones y memoria por usuario sobre el backend de almacenamiento"""
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(
+        self,
+        db_manager: StorageBackend,
+        cache_size: int = None,
+        cache_ttl: float = None,
+        history_size: int = None,
+        activity_flush_interval: float = None
+    ):
+        """
+        Args:
+            db_manager: Backend de almacenamiento
+            cache_size: Sesiones máximas en la cache LRU (SESSION_CACHE_SIZE, por defecto 1000)
+            cache_ttl: Segundos antes de recargar una sesión desde la base (SESSION_CACHE_TTL, por defecto 300)
+            history_size: Mensajes recientes guardados por sesión (SESSION_HISTORY_SIZE, por defecto 20)
+            activity_flush_interval: Segundos entre escrituras agrupadas de last_activity
+                (SESSION_ACTIVITY_FLUSH_INTERVAL, por defecto 30)
+        """
         self.db_manager = db_manager
-        self._lock = threading.Lock()
-        logger.info("🔧 Inicializando SessionManager con DatabaseManager")
-        # No es necesario cargar sesiones aquí, se obtienen/crean on-demand
+        self._lock = threading.Lock()  # Serializa cargas/creaciones de sesión (caminos sin cache)
+        self._message_writer = None  # Writer de fondo opcional (ver set_message_writer)
+        logger.info(f"🔧 Inicializando SessionManager con {type(db_manager).__name__}")
+        
+        # Cache LRU con TTL: session_id -> _CachedSession
+        self.cache_size = cache_size or int(os.getenv('SESSION_CACHE_SIZE', 1000))
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.getenv('SESSION_CACHE_TTL', 300))
+        self.history_size = history_size or int(os.getenv('SESSION_HISTORY_SIZE', 20))
+        self._cache: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._history_hits = 0
+        self._history_misses = 0
+        
+        # last_activity pendiente de escribir: session_id -> datetime
+        self.activity_flush_interval = activity_flush_interval if activity_flush_interval is not None else float(os.getenv('SESSION_ACTIVITY_FLUSH_INTERVAL', 30))
+        self._dirty_activity: Dict[str, datetime.datetime] = {}
+        self._activity_flushes = 0
+        self._stop = threading.Event()
+        self._flush_thread = threading.Thread(target=self._activity_flush_loop, name="SessionActivityFlush", daemon=True)
+        self._flush_thread.start()
         logger.info("✅ SessionManager inicializado")
     
+    @timed("session")
+    @traced("session_manager.get_or_create_session")
     def get_or_create_session(self, username: str, user_info) -> UserSession:
-        """Obtiene sesión existente o crea una nueva."""
+        """Obtiene sesión existente (desde la cache si es posible) o crea una nueva."""
+        if user_info.session_id:
+            entry = self._cache_get(str(user_info.session_id))
+            set_attribute("cache_hit", bool(entry))
+            if entry:
+                self._touch(entry.session)
+                return entry.session
+            # Mensajes aún en la cola del writer deben estar en la base antes de leer el historial.
+            # Se espera fuera del lock y sin conexión tomada: el writer necesita una para vaciar la cola
+            if self._message_writer is not None:
+                self._message_writer.flush()
+        
         with self._lock:
             try:
                 with self.db_manager.get_connection() as (conn, cursor):
@@ -46,105 +107,268 @@ class SessionManager:
                     
                     # Si el usuario ya tiene session_id, buscarla
                     if user_info.session_id:
-                        cursor.execute(
-                            "SELECT session_id, created_at, last_activity, user_preferences FROM sessions WHERE session_id = %s;",
+                        self.db_manager.execute_prepared(
+                            conn, cursor, 'session_get',
                             (str(user_info.session_id),)
                         )
                         row = cursor.fetchone()
                         
                         if row:
-                            # Actualizar last_activity
-                            cursor.execute(
-                                "UPDATE sessions SET last_activity = %s WHERE session_id = %s;",
-                                (datetime.datetime.now(), str(user_info.session_id))
+                            # Precargar el historial reciente en la misma conexión
+                            self.db_manager.execute_prepared(
+                                conn, cursor, 'history_recent',
+                                (str(user_info.session_id), self.history_size)
                             )
-                            conn.commit()
-                            return UserSession(
+                            history = list(reversed(cursor.fetchall()))
+                            session = UserSession(
                                 session_id=row[0],
                                 username=username_clean,
                                 created_at=row[1],
                                 last_activity=row[2],
                                 user_preferences=row[3] if row[3] else {}
                             )
+                            # last_activity se escribe en el próximo flush agrupado
+                            self._touch(session)
+                            self._cache_put(session, history)
+                            return session
                     
                     # Crear nueva sesión
                     new_session_id = uuid.uuid4()
-                    cursor.execute(
-                        "INSERT INTO sessions (session_id, created_at, last_activity) VALUES (%s, %s, %s) RETURNING session_id, created_at, last_activity, user_preferences;",
+                    self.db_manager.execute_prepared(
+                        conn, cursor, 'session_insert',
                         (str(new_session_id), datetime.datetime.now(), datetime.datetime.now())
                     )
-                    conn.commit()
                     new_row = cursor.fetchone()
+                    conn.commit()
                     
                     # Actualizar users.session_id
-                    cursor.execute(
-                        "UPDATE users SET session_id = %s WHERE name = %s;",
+                    self.db_manager.execute_prepared(
+                        conn, cursor, 'user_set_session',
                         (str(new_session_id), user_info.name)
                     )
                     conn.commit()
                     
-                    return UserSession(
+                    session = UserSession(
                         session_id=new_row[0],
                         username=username_clean,
                         created_at=new_row[1],
                         last_activity=new_row[2],
                         user_preferences=new_row[3] if new_row[3] else {}
                     )
+                    self._cache_put(session, [])
+                    return session
                     
             except Exception as e:
                 logger.error(f"Error en get_or_create_session: {e}")
                 raise
 
+    @timed("persistence")
+    @traced("session_manager.add_message_to_history")
     def add_message_to_history(self, session_id: uuid.UUID, message: str, is_user: bool = True):
-        """Añade mensaje al historial de conversación de una sesión."""
-        with self._lock:
-            try:
-                with self.db_manager.get_connection() as (conn, cursor):
-                    logger.info(f"💬 Guardando mensaje en sesión {session_id} de {'usuario' if is_user else 'bot'}: {message[:50]}...")
-                    cursor.execute(
-                        "INSERT INTO conversation_messages (session_id, timestamp, message, is_user) VALUES (%s, %s, %s, %s);",
-                        (str(session_id), datetime.datetime.now(), message, is_user)
-                    )
-                    conn.commit()
-            except Exception as e:
-                logger.error(f"❌ Error al guardar mensaje en sesión {session_id}: {e}")
-                raise
+        """Añade mensaje al historial de conversación de una sesión (escritura síncrona)."""
+        try:
+            with self.db_manager.get_connection() as (conn, cursor):
+                # Sin el texto del mensaje: el log no debe guardar conversaciones
+                logger.debug("💬 Guardando mensaje en sesión %s de %s (%d caracteres)", session_id, 'usuario' if is_user else 'bot', len(message))
+                self.db_manager.execute_prepared(
+                    conn, cursor, 'message_insert',
+                    (str(session_id), datetime.datetime.now(), message, is_user)
+                )
+                conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Error al guardar mensaje en sesión {session_id}: {e}")
+            raise
+        self._remember_message(session_id, message, is_user)
+
+    def set_message_writer(self, message_writer):
+        """Asocia un MessageWriter para persistir mensajes en segundo plano."""
+        self._message_writer = message_writer
+
+    def enqueue_message(self, session_id: uuid.UUID, message: str, is_user: bool = True) -> bool:
+        """
+        Encola un mensaje en el writer de fondo sin esperar a la base de datos.
+
+        Returns:
+            bool: False si no hay writer o su cola está llena (usar add_message_to_history)
+        """
+        if self._message_writer is None:
+            return False
+        record = MessageRecord(session_id=str(session_id), message=message, is_user=is_user)
+        if not self._message_writer.submit(record):
+            return False
+        self._remember_message(session_id, message, is_user)
+        return True
+
+    @timed("persistence")
+    @traced("session_manager.add_messages_to_history")
+    def add_messages_to_history(self, records: List[MessageRecord]):
+        """Escribe un lote de mensajes con un único INSERT multi-fila (usado por MessageWriter)."""
+        if not records:
+            return
+        rows = [(r.session_id, r.timestamp, r.message, r.is_user) for r in records]
+        with self.db_manager.get_connection() as (conn, cursor):
+            self.db_manager.execute_batch(conn, cursor, 'message_insert_batch', rows)
+            conn.commit()
 
+    @timed("history")
+    @traced("session_manager.get_conversation_context")
     def get_conversation_context(self, session_id: uuid.UUID, limit: int = 10) -> str:
-        """Obtiene contexto de conversación reciente para una sesión."""
-        with self._lock:
-            try:
-                with self.db_manager.get_connection() as (conn, cursor):
-                    cursor.execute(
-                        "SELECT message, is_user FROM conversation_messages WHERE session_id = %s ORDER BY timestamp DESC LIMIT %s;",
-                        (str(session_id), limit)
-                    )
-                    rows = cursor.fetchall()
-                    context = []
-                    for msg, is_user in reversed(rows): # Invertir para orden cronológico
-                        role = "Usuario" if is_user else "SAÚ"
-                        context.append(f"{role}: {msg}")
-                    return "\n".join(context)
-            except Exception as e:
-                logger.error(f"❌ Error al obtener contexto de conversación para sesión {session_id}: {e}")
-                return ""
+        """Obtiene contexto de conversación reciente para una sesión (desde la cache si es posible)."""
+        entry = self._cache_get(str(session_id), count=False)
+        set_attribute("cache_hit", bool(entry and limit <= self.history_size))
+        if entry and limit <= self.history_size:
+            with self._cache_lock:
+                self._history_hits += 1
+                rows = list(entry.history)[-limit:] if limit > 0 else []
+            return self._format_context(rows)
+        
+        with self._cache_lock:
+            self._history_misses += 1
+        try:
+            with self.db_manager.get_connection() as (conn, cursor):
+                self.db_manager.execute_prepared(
+                    conn, cursor, 'history_recent',
+                    (str(session_id), limit)
+                )
+                rows = cursor.fetchall()
+                return self._format_context(reversed(rows)) # Invertir para orden cronológico
+        except Exception as e:
+            logger.error(f"❌ Error al obtener contexto de conversación para sesión {session_id}: {e}")
+            return ""
+
+    @staticmethod
+    def _format_context(rows) -> str:
+        """Formatea (mensaje, is_user) en orden cronológico como texto de contexto"""
+        context = []
+        for msg, is_user in rows:
+            role = "Usuario" if is_user else "SAÚ"
+            context.append(f"{role}: {msg}")
+        return "\n".join(context)
 
     def update_session_preferences(self, session_id: uuid.UUID, preferences: Dict):
         """Actualiza las preferencias JSONB de una sesión."""
-        with self._lock:
-            try:
-                with self.db_manager.get_connection() as (conn, cursor):
-                    # psycopg2 requiere que los JSONB se pasen como cadenas JSON
-                    json_pref = json.dumps(preferences) # Convertir dict a string JSON
-                    cursor.execute(
-                        "UPDATE sessions SET user_preferences = user_preferences || %s::jsonb WHERE session_id = %s;",
-                        (json_pref, str(session_id))
-                    )
-                    conn.commit()
-                    logger.info(f"✅ Preferencias de sesión {session_id} actualizadas.")
-            except Exception as e:
-                logger.error(f"❌ Error al actualizar preferencias de sesión {session_id}: {e}")
-                raise
+        try:
+            with self.db_manager.get_connection() as (conn, cursor):
+                # psycopg2 requiere que los JSONB se pasen como cadenas JSON
+                json_pref = json.dumps(preferences) # Convertir dict a string JSON
+                self.db_manager.execute_prepared(
+                    conn, cursor, 'session_update_preferences',
+                    (json_pref, str(session_id))
+                )
+                conn.commit()
+                logger.info(f"✅ Preferencias de sesión {session_id} actualizadas.")
+        except Exception as e:
+            logger.error(f"❌ Error al actualizar preferencias de sesión {session_id}: {e}")
+            raise
+        
+        entry = self._cache_get(str(session_id), count=False)
+        if entry:
+            with self._cache_lock:
+                entry.session.user_preferences = {**entry.session.user_preferences, **preferences}
+
+    # --- Cache de sesiones e historial ---
+
+    def _cache_get(self, session_id: str, count: bool = True) -> Optional[_CachedSession]:
+        """Devuelve la entrada vigente de la cache (y la marca como usada recientemente)"""
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry and entry.expires_at <= time.monotonic():
+                del self._cache[session_id]
+                entry = None
+            if entry:
+                self._cache.move_to_end(session_id)
+            if count:
+                if entry:
+                    self._cache_hits += 1
+                else:
+                    self._cache_misses += 1
+            return entry
+
+    def _cache_put(self, session: UserSession, history: List):
+        """Guarda una sesión recién leída/creada con su historial reciente"""
+        entry = _CachedSession(
+            session=session,
+            history=deque(history, maxlen=self.history_size),
+            expires_at=time.monotonic() + self.cache_ttl
+        )
+        with self._cache_lock:
+            self._cache[str(session.session_id)] = entry
+            self._cache.move_to_end(str(session.session_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _remember_message(self, session_id, message: str, is_user: bool):
+        """Añade el mensaje al historial en memoria de la sesión, si está en cache"""
+        with self._cache_lock:
+            entry = self._cache.get(str(session_id))
+            if entry:
+                entry.history.append((message, is_user))
+
+    def invalidate_session(self, session_id):
+        """Elimina una sesión de la cache (la próxima lectura irá a la base)"""
+        with self._cache_lock:
+            self._cache.pop(str(session_id), None)
+
+    def cache_stats(self) -> Dict:
+        """Tamaño y tasas de acierto de la cache de sesiones e historial"""
+        with self._cache_lock:
+            session_total = self._cache_hits + self._cache_misses
+            history_total = self._history_hits + self._history_misses
+            return {
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+                "session_hits": self._cache_hits,
+                "session_misses": self._cache_misses,
+                "session_hit_rate": round(self._cache_hits / session_total, 4) if session_total else 0.0,
+                "history_hits": self._history_hits,
+                "history_misses": self._history_misses,
+                "history_hit_rate": round(self._history_hits / history_total, 4) if history_total else 0.0,
+                "pending_activity_updates": len(self._dirty_activity),
+                "activity_flushes": self._activity_flushes,
+            }
+
+    # --- last_activity agrupado ---
+
+    def _touch(self, session: UserSession):
+        """Registra actividad; la escritura en la base se agrupa en flush_activity()"""
+        now = datetime.datetime.now()
+        with self._cache_lock:
+            session.last_activity = now
+            self._dirty_activity[str(session.session_id)] = now
+
+    def flush_activity(self):
+        """Escribe en un solo lote los last_activity acumulados"""
+        with self._cache_lock:
+            if not self._dirty_activity:
+                return
+            pending, self._dirty_activity = self._dirty_activity, {}
+        
+        rows = list(pending.items())
+        try:
+            with self.db_manager.get_connection() as (conn, cursor):
+                self.db_manager.execute_batch(conn, cursor, 'session_touch_batch', rows)
+                conn.commit()
+            with self._cache_lock:
+                self._activity_flushes += 1
+            logger.debug("🕒 last_activity actualizado para %d sesiones", len(rows))
+        except Exception as e:
+            logger.warning(f"⚠️ Error al escribir last_activity de {len(rows)} sesiones, se reintentará: {e}")
+            with self._cache_lock:
+                # Conservar el valor más reciente si hubo actividad nueva mientras tanto
+                for session_id, last_activity in pending.items():
+                    self._dirty_activity.setdefault(session_id, last_activity)
+
+    def _activity_flush_loop(self):
+        """Hilo de fondo que escribe last_activity cada activity_flush_interval segundos"""
+        while not self._stop.wait(self.activity_flush_interval):
+            self.flush_activity()
+
+    def close(self):
+        """Detiene el hilo de fondo y escribe la actividad pendiente"""
+        self._stop.set()
+        self._flush_thread.join(timeout=5)
+        self.flush_activity()
+        logger.info("✅ SessionManager cerrado (actividad de sesiones escrita)")
 
 # Eliminar la línea duplicada o asegurar que solo haya una instancia de SessionManager si no se usa como singleton.
 # Si esta línea es para compatibilidad con código antiguo, se debería revisar la arquitectura.
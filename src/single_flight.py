@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Single Flight - Deduplicación de llamadas idénticas en curso
+
+Si llega una llamada con una clave que ya se está procesando, espera el resultado
+de la primera en lugar de repetir el trabajo. Los resultados exitosos se conservan
+durante una ventana corta para absorber reintentos y dobles clics; los errores no se
+conservan, de modo que el siguiente intento vuelve a ejecutarse.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """Llamada en curso o resultado retenido para una clave"""
+    __slots__ = ("future", "expires_at")
+
+    def __init__(self):
+        self.future = Future()
+        self.expires_at: Optional[float] = None  # None mientras está en curso
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución"""
+
+    def __init__(
+        self,
+        ttl: float = 5.0,
+        max_entries: int = 10000,
+        wait_timeout: float = 180.0,
+        name: str = "SingleFlight"
+    ):
+        """
+        Args:
+            ttl: Segundos que se retiene un resultado exitoso
+            max_entries: Máximo de resultados retenidos
+            wait_timeout: Segundos máximos que un duplicado espera a la llamada original
+            name: Nombre usado en los logs
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._calls: "OrderedDict[str, _Call]" = OrderedDict()
+
+        # Estadísticas
+        self._executed = 0
+        self._joined_in_flight = 0
+        self._replayed = 0
+        self._errors = 0
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        ttl: float = None,
+        cacheable: Callable[[Any], bool] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Ejecuta `fn` una sola vez por clave
+
+        Args:
+            key: Identifica llamadas equivalentes
+            fn: Trabajo a ejecutar si no hay una llamada en curso ni un resultado retenido
+            ttl: Ventana de retención para esta llamada (por defecto `self.ttl`)
+            cacheable: Decide si un resultado puede reutilizarse; los no reutilizables
+                se entregan a quienes ya esperaban pero no se retienen
+
+        Returns:
+            Tuple[Any, bool]: Resultado y si fue compartido con otra llamada
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            call = self._calls.get(key)
+            if call is not None and call.expires_at is not None and call.expires_at <= now:
+                del self._calls[key]
+                call = None
+
+            if call is not None:
+                if call.expires_at is None:
+                    self._joined_in_flight += 1
+                else:
+                    self._replayed += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            return call.future.result(timeout=self.wait_timeout), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._errors += 1
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.future.set_exception(e)
+            raise
+
+        with self._lock:
+            if cacheable is None or cacheable(result):
+                call.expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+                self._calls.move_to_end(key)
+                self._evict()
+            elif self._calls.get(key) is call:
+                del self._calls[key]
+        call.future.set_result(result)
+        return result, False
+
+    def _purge(self, now: float):
+        """Elimina resultados vencidos (requiere self._lock)"""
+        expired = [
+            key for key, call in self._calls.items()
+            if call.expires_at is not None and call.expires_at <= now
+        ] if len(self._calls) > self.max_entries // 2 else []
+        for key in expired:
+            del self._calls[key]
+
+    def _evict(self):
+        """Descarta los resultados retenidos más antiguos por encima del límite (requiere self._lock)"""
+        excess = len(self._calls) - self.max_entries
+        if excess <= 0:
+            return
+        for key in [k for k, c in self._calls.items() if c.expires_at is not None][:excess]:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        """Métricas de deduplicación"""
+        with self._lock:
+            in_flight = sum(1 for c in self._calls.values() if c.expires_at is None)
+            return {
+                "in_flight": in_flight,
+                "retained": len(self._calls) - in_flight,
+                "executed": self._executed,
+                "joined_in_flight": self._joined_in_flight,
+                "replayed": self._replayed,
+                "errors": self._errors,
+            }
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+SQLite Manager - Backend de almacenamiento embebido (SQLite en modo WAL)
+
+Implementa la misma interfaz que DatabaseManager sin depender de un PostgreSQL remoto.
+Pensado para pruebas de carga locales y despliegues de un solo nodo con baja latencia.
+"""
+
+import json
+import queue
+import sqlite3
+import logging
+import datetime
+import threading
+import uuid
+from contextlib import contextmanager
+
+from storage_backend import StorageBackend
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Conversión de tipos equivalente a la de psycopg2 (TIMESTAMP -> datetime, JSONB -> dict)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("JSONB", lambda raw: json.loads(raw) if raw else {})
+sqlite3.register_converter("BOOLEAN", lambda raw: bool(int(raw)))
+
+# Mismos nombres que PREPARED_STATEMENTS de DatabaseManager, en dialecto SQLite.
+# sqlite3 compila cada sentencia una vez por conexión y la reutiliza (cached_statements).
+SQLITE_STATEMENTS = {
+    # SessionManager
+    'session_get': "SELECT session_id, created_at, last_activity, user_preferences FROM sessions WHERE session_id = ?",
+    'session_touch': "UPDATE sessions SET last_activity = ? WHERE session_id = ?",
+    'session_insert': "INSERT INTO sessions (session_id, created_at, last_activity) VALUES (?, ?, ?) RETURNING session_id, created_at, last_activity, user_preferences",
+    'session_update_preferences': "UPDATE sessions SET user_preferences = json_patch(user_preferences, ?) WHERE session_id = ?",
+    'message_insert': "INSERT INTO conversation_messages (session_id, timestamp, message, is_user) VALUES (?, ?, ?, ?)",
+    'history_recent': "SELECT message, is_user FROM conversation_messages WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?",
+    # UserManager
+    'user_set_session': "UPDATE users SET session_id = ? WHERE name = ?",
+    'user_by_name': "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE name = ?",
+    'user_by_telegram': "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE telegram_username = ?",
+    'user_increment_by_name': "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE name = ?",
+    'user_increment_by_telegram': "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE telegram_username = ?",
+}
+
+# Sentencias de lote: SQLite no gana nada con un VALUES multi-fila frente a
+# executemany() dentro de la misma transacción, así que reutiliza la sentencia simple
+SQLITE_BATCH_STATEMENTS = {
+    'message_insert_batch': SQLITE_STATEMENTS['message_insert'],
+    # Filas (session_id, last_activity), igual que en Postgres
+    'session_touch_batch': "UPDATE sessions SET last_activity = ?2 WHERE session_id = ?1",
+    # Filas (name, delta)
+    'user_increment_batch': "UPDATE users SET message_count = COALESCE(message_count, 0) + ?2 WHERE name = ?1",
+}
+
+class SQLiteDatabaseManager(StorageBackend):
+    """Backend SQLite con un pool simple de conexiones y journal WAL"""
+
+    def __init__(self, db_path: str = 'sau_bot.db', max_connections: int = 10, busy_timeout: float = 30.0):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite (":memory:" crea una base compartida en memoria)
+            max_connections: Máximo de conexiones abiertas simultáneamente
+            busy_timeout: Segundos que espera un escritor si la base está bloqueada
+        """
+        self.max_connections = max_connections
+        self.busy_timeout = busy_timeout
+        self._uri = db_path == ':memory:'
+        # Una base en memoria compartida entre conexiones necesita URI con cache compartida
+        self.db_path = f"file:sau-{uuid.uuid4().hex}?mode=memory&cache=shared" if self._uri else db_path
+
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        if self._uri:
+            # La cache compartida bloquea por tabla sin respetar busy_timeout: en memoria
+            # se usa una única conexión, que además mantiene viva la base
+            self.max_connections = 1
+            self._pool.put(self._new_connection())
+            self._created = 1
+
+        logger.info(f"✅ Backend SQLite configurado en {db_path}")
+        self.create_tables()
+
+    def _new_connection(self):
+        """Abre una conexión configurada para acceso concurrente"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # Las conexiones se comparten entre hilos vía el pool
+            cached_statements=256,
+            uri=self._uri
+        )
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _acquire(self):
+        """Obtiene una conexión libre del pool o crea una nueva si hay cupo"""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._new_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._pool.get(timeout=self.busy_timeout)
+
+    @contextmanager
+    def get_connection(self):
+        """Context manager que entrega (conn, cursor) y devuelve la conexión al pool"""
+        if self._closed:
+            raise RuntimeError("El backend SQLite está cerrado")
+        conn = self._acquire()
+        cursor = conn.cursor()
+        try:
+            yield conn, cursor
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.debug(f"Error cerrando cursor: {e}")
+            self._pool.put(conn)
+
+    def execute_prepared(self, conn, cursor, name, params=()):
+        """Ejecuta por nombre una sentencia de SQLITE_STATEMENTS"""
+        if name not in SQLITE_STATEMENTS:
+            raise KeyError(f"Sentencia preparada desconocida: {name}")
+        cursor.execute(SQLITE_STATEMENTS[name], params)
+
+    def execute_batch(self, conn, cursor, name, rows):
+        """Ejecuta una sentencia de SQLITE_BATCH_STATEMENTS para todas las filas"""
+        if name not in SQLITE_BATCH_STATEMENTS:
+            raise KeyError(f"Sentencia de lote desconocida: {name}")
+        cursor.executemany(SQLITE_BATCH_STATEMENTS[name], rows)
+
+    def create_tables(self):
+        """Crea las tablas necesarias (incluye users, que en Postgres se gestiona externamente)"""
+        try:
+            logger.info("🔧 Iniciando creación/verificación de tablas SQLite...")
+            with self.get_connection() as (conn, cursor):
+                cursor.executescript("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        telegram_username TEXT PRIMARY KEY,
+                        session_id TEXT,
+                        name TEXT,
+                        email TEXT,
+                        message_count INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_users_name ON users(name);
+
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        session_id TEXT PRIMARY KEY,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        user_preferences JSONB DEFAULT '{}'
+                    );
+
+                    CREATE TABLE IF NOT EXISTS conversation_messages (
+                        message_id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+                        session_id TEXT REFERENCES sessions(session_id) ON DELETE CASCADE,
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        message TEXT,
+                        is_user BOOLEAN
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_messages_session_ts
+                        ON conversation_messages(session_id, timestamp);
+                """)
+                conn.commit()
+            logger.info("✅ Todas las tablas SQLite verificadas/creadas exitosamente")
+        except Exception as e:
+            logger.error(f"❌ Error al crear/verificar tablas SQLite: {e}")
+            raise
+
+    def pool_stats(self):
+        """Conexiones abiertas en uso y libres en el pool"""
+        with self._lock:
+            created = self._created
+        idle = self._pool.qsize()
+        return {"in_use": created - idle, "idle": idle, "max": self.max_connections}
+
+    def health_check(self):
+        """Verifica la salud de la base SQLite"""
+        try:
+            with self.get_connection() as (conn, cursor):
+                cursor.execute("SELECT 1")
+                result = cursor.fetchone()
+                return bool(result and result[0] == 1)
+        except Exception as e:
+            logger.error(f"❌ Health check de SQLite falló: {e}")
+            return False
+
+    def close(self):
+        """Cierra todas las conexiones del pool"""
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+            except Exception as e:
+                logger.debug(f"Error cerrando conexión SQLite: {e}")
+        logger.info("🔌 Backend SQLite cerrado correctamente")
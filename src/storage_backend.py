@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Storage Backend - Interfaz común de almacenamiento para usuarios, sesiones y mensajes
+
+UserManager y SessionManager solo dependen de esta interfaz: obtienen una conexión
+con get_connection() y ejecutan sentencias del registro por nombre con
+execute_prepared(). Cada implementación define su propio SQL para cada nombre.
+
+Implementaciones:
+- "postgres": DatabaseManager (psycopg2 + DATABASE_URL), usada en producción
+- "sqlite": SQLiteDatabaseManager (archivo local en modo WAL), para pruebas de
+  rendimiento locales y despliegues de un solo nodo
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class StorageBackend(ABC):
+    """Contrato mínimo que deben cumplir los backends de almacenamiento"""
+
+    @abstractmethod
+    def get_connection(self):
+        """Context manager que entrega una tupla (conn, cursor) lista para usar"""
+
+    @abstractmethod
+    def execute_prepared(self, conn, cursor, name, params=()):
+        """Ejecuta por nombre una sentencia del registro del backend"""
+
+    @abstractmethod
+    def execute_batch(self, conn, cursor, name, rows):
+        """Ejecuta por nombre una sentencia de lote con muchas filas de parámetros"""
+
+    @abstractmethod
+    def create_tables(self):
+        """Crea/verifica las tablas necesarias"""
+
+    @abstractmethod
+    def health_check(self) -> bool:
+        """Verifica que el almacenamiento responde"""
+
+    @abstractmethod
+    def pool_stats(self) -> dict:
+        """Uso del pool de conexiones: in_use, idle y max"""
+
+    @abstractmethod
+    def close(self):
+        """Libera las conexiones del backend"""
+
+def create_storage_backend(backend: str = None) -> StorageBackend:
+    """
+    Crea el backend de almacenamiento configurado
+
+    Args:
+        backend: "postgres" o "sqlite" (por defecto la variable STORAGE_BACKEND, o "postgres")
+
+    Returns:
+        StorageBackend: Backend inicializado y con tablas verificadas
+    """
+    backend = (backend or os.getenv('STORAGE_BACKEND', 'postgres')).lower()
+
+    if backend in ('postgres', 'postgresql'):
+        from database_manager import DatabaseManager
+        return DatabaseManager()
+
+    if backend == 'sqlite':
+        from sqlite_manager import SQLiteDatabaseManager
+        db_path = os.getenv('SQLITE_PATH', 'sau_bot.db')
+        logger.info(f"🗄️ Usando backend SQLite en {db_path}")
+        return SQLiteDatabaseManager(db_path)
+
+    raise ValueError(f"STORAGE_BACKEND desconocido: '{backend}' (usa 'postgres' o 'sqlite')")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Structured Splitter - Fragmentación que respeta encabezados e ítems numerados
+
+Pensado para el banco de preguntas y las guías de `materials/`: cada encabezado
+markdown (`#`, `##`, ...) o línea en negrita (`**A1. Humor y Estado de Ánimo**`)
+abre una sección; dentro de ella, los ítems numerados o con viñeta y los párrafos
+son unidades indivisibles que se agrupan hasta `chunk_size` caracteres. Así un
+fragmento nunca corta una pregunta ni mezcla dos categorías, y lleva la categoría
+en sus metadatos y en la primera línea del texto (que también se embebe).
+
+Solo un ítem que por sí solo supera `chunk_size` se divide con
+RecursiveCharacterTextSplitter. Un texto sin estructura queda en párrafos.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+BOLD_HEADING = re.compile(r"^\*\*(.+?)\*\*:?\s*$")
+LIST_ITEM = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+")
+ITEM_COUNT = re.compile(r"\s*[-–]?\s*\(\d+\s+\w+\)\s*$")
+
+# Las líneas en negrita se tratan como un nivel por debajo de los encabezados markdown
+BOLD_LEVEL = 7
+
+class StructuredTextSplitter:
+    """Divide documentos por secciones e ítems; compatible con split_documents de langchain"""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 30):
+        """
+        Args:
+            chunk_size: Máximo de caracteres por fragmento (sin contar la línea de sección)
+            chunk_overlap: Solapamiento al dividir un ítem demasiado largo
+        """
+        # Mismos nombres que los splitters de langchain (los usa la huella de archivo)
+        self._chunk_size = chunk_size
+        self._chunk_overlap = chunk_overlap
+        self._fallback = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=["\n\n", "\n", " ", ""]
+        )
+
+    @staticmethod
+    def _heading(line: str) -> Optional[Tuple[int, str]]:
+        """(nivel, título) si la línea es un encabezado"""
+        match = MARKDOWN_HEADING.match(line)
+        if match:
+            return len(match.group(1)), match.group(2).strip()
+        match = BOLD_HEADING.match(line.strip())
+        if match:
+            return BOLD_LEVEL, match.group(1).strip()
+        return None
+
+    @staticmethod
+    def category_name(title: str) -> str:
+        """Título sin marcas ni el conteo final: '**A1. Humor (10 preguntas)**' → 'A1. Humor'"""
+        return ITEM_COUNT.sub("", title.replace("**", "")).strip()
+
+    def _sections(self, text: str) -> Iterable[Tuple[List[str], List[str]]]:
+        """Recorre el texto devolviendo (ruta de encabezados, unidades) por sección"""
+        stack: List[Tuple[int, str]] = []
+        units: List[str] = []
+        current: List[str] = []
+
+        def close_unit():
+            if current:
+                units.append("\n".join(current).strip())
+                current.clear()
+
+        for line in text.splitlines():
+            heading = self._heading(line)
+            if heading:
+                close_unit()
+                if units:
+                    yield [title for _, title in stack], units
+                    units = []
+                level, title = heading
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, title))
+            elif not line.strip():
+                close_unit()
+            elif LIST_ITEM.match(line):
+                close_unit()
+                current.append(line.rstrip())
+            else:
+                current.append(line.rstrip())
+        close_unit()
+        if units:
+            yield [title for _, title in stack], units
+
+    def _pack(self, units: List[str]) -> List[str]:
+        """Agrupa unidades consecutivas sin pasar de chunk_size; divide solo las que no caben solas"""
+        chunks, current, size = [], [], 0
+        for unit in units:
+            if len(unit) > self._chunk_size:
+                if current:
+                    chunks.append("\n".join(current))
+                    current, size = [], 0
+                chunks.extend(self._fallback.split_text(unit))
+                continue
+            if current and size + 1 + len(unit) > self._chunk_size:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(unit)
+            size += len(unit) + (1 if size else 0)
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [doc.page_content for doc in self.split_documents([Document(page_content=text)])]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """
+        Divide cada documento por secciones
+
+        Metadatos agregados: `section` (ruta completa de encabezados, separada por ' > ')
+        y `category` (encabezado más cercano sin el conteo de ítems).
+        """
+        chunks = []
+        for document in documents:
+            for path, units in self._sections(document.page_content):
+                metadata = dict(document.metadata)
+                if path:
+                    metadata["section"] = " > ".join(self.category_name(title) for title in path)
+                    metadata["category"] = self.category_name(path[-1])
+                for text in self._pack(units):
+                    content = f"{metadata['category']}\n{text}" if path else text
+                    chunks.append(Document(page_content=content, metadata=dict(metadata)))
+        return chunks
+
+def create_text_splitter(kind: str = None):
+    """
+    Splitter de la carga de documentos según INGEST_CHUNKER
+
+    - `structured` (por defecto): StructuredTextSplitter de hasta INGEST_CHUNK_SIZE caracteres (1000)
+    - `recursive`: el RecursiveCharacterTextSplitter original de 300 caracteres con 30 de solapamiento
+    """
+    kind = (kind or os.getenv("INGEST_CHUNKER", "structured")).lower()
+    if kind == "recursive":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=300,
+            chunk_overlap=30,
+            length_function=len,
+            separators=["\n\n", "\n", " ", ""]
+        )
+    if kind == "structured":
+        return StructuredTextSplitter(chunk_size=int(os.getenv("INGEST_CHUNK_SIZE", 1000)))
+    raise ValueError(f"INGEST_CHUNKER desconocido: {kind} (usa 'structured' o 'recursive')")
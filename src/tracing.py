@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Tracing - Trazas por petición con IDs de correlación
+
+Cada petición recibe un request ID (generado en WebHandler o tomado de X-Request-ID)
+que viaja en variables de contexto a través de BotCore, los managers y SauAI. Las
+partes relevantes del turno se registran como spans con duración, atributos y eventos
+(p. ej. reintentos o reconexiones). Solo una fracción de las trazas (TRACE_SAMPLE_RATE)
+registra spans; las demás únicamente propagan el ID, con costo casi nulo. Las trazas
+muestreadas se escriben como líneas JSON en segundo plano (TRACE_EXPORT_PATH).
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class Span:
+    """Operación medida dentro de una traza"""
+    __slots__ = ("name", "span_id", "parent_id", "start", "duration_ms", "attrs", "events", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.attrs = attrs
+        self.events: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+
+class Trace:
+    """Conjunto de spans de una petición"""
+
+    def __init__(self, request_id: str, name: str, sampled: bool):
+        self.request_id = request_id
+        self.name = name
+        self.sampled = sampled
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []  # list.append es atómico: spans de varios hilos
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "error": self.error,
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "offset_ms": round((s.start - self.start) * 1000, 2),
+                    "duration_ms": s.duration_ms,
+                    "attrs": s.attrs,
+                    "events": s.events,
+                    "error": s.error,
+                }
+                for s in self.spans
+            ],
+        }
+
+class JsonLinesExporter:
+    """Escribe trazas como una línea JSON cada una desde un hilo de fondo"""
+
+    def __init__(self, path: str, max_queue_size: int = 1000):
+        self.path = path
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="TraceExporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            # Nunca bloquear la petición por exportar una traza
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                    # Vaciar lo acumulado mientras el archivo está abierto
+                    while True:
+                        try:
+                            f.write(json.dumps(self._queue.get_nowait(), ensure_ascii=False, default=str) + "\n")
+                        except queue.Empty:
+                            break
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo exportar traza a {self.path}: {e}")
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("sau_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("sau_span", default=None)
+
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+_exporter: Optional[JsonLinesExporter] = None
+_exporter_lock = threading.Lock()
+
+def _get_exporter() -> JsonLinesExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = JsonLinesExporter(os.getenv("TRACE_EXPORT_PATH", "traces.jsonl"))
+    return _exporter
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def get_request_id() -> Optional[str]:
+    """Request ID de la petición en curso (None fuera de una petición)"""
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+def begin_trace(name: str, request_id: str = None, sampled: bool = None):
+    """
+    Inicia una traza en el contexto actual
+
+    Returns:
+        Token para end_trace()
+    """
+    if sampled is None:
+        sampled = SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+    trace = Trace(request_id or new_request_id(), name, sampled)
+    return _current_trace.set(trace), _current_span.set(None)
+
+def end_trace(token, error: BaseException = None):
+    """Cierra la traza iniciada con begin_trace() y la exporta si fue muestreada"""
+    trace_token, span_token = token
+    trace = _current_trace.get()
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+    if trace is not None and trace.sampled:
+        if error is not None:
+            trace.error = f"{type(error).__name__}: {error}"
+        _get_exporter().export(trace)
+
+@contextmanager
+def trace_context(name: str, request_id: str = None, sampled: bool = None):
+    """Traza para un bloque (p. ej. un trabajo en segundo plano)"""
+    token = begin_trace(name, request_id, sampled)
+    try:
+        yield
+    except BaseException as e:
+        end_trace(token, e)
+        raise
+    else:
+        end_trace(token)
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Registra un span hijo del span actual; sin traza muestreada no hace nada
+
+    Yields:
+        Span o None (para agregar atributos con set_attribute())
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace.sampled:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ms = round((time.perf_counter() - current.start) * 1000, 2)
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+def traced(name: str):
+    """Decorador: ejecuta la función dentro de un span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def set_attribute(key: str, value: Any):
+    """Agrega un atributo al span actual"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs[key] = value
+
+def add_event(name: str, **attrs):
+    """Registra un evento puntual (reintento, reconexión...) en el span actual"""
+    current = _current_span.get()
+    if current is None:
+        return
+    trace = _current_trace.get()
+    offset = round((time.perf_counter() - trace.start) * 1000, 2) if trace else None
+    current.events.append({"name": name, "offset_ms": offset, **attrs})
@@ -3,10 +3,16 @@
 Gestor de usuarios para el bot de Telegram
 """
 
+import os
+import time
 import datetime
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional, List
-from dataclasses import dataclass, asdict, field
-from database_manager import DatabaseManager # Importa DatabaseManager
+from dataclasses import dataclass, asdict, field, replace
+from storage_backend import StorageBackend
+from counter_aggregator import CounterAggregator
+from tracing import traced, set_attribute
 
 @dataclass
 class UserInfo:
@@ -24,82 +30,259 @@ class UserInfo:
         data['created_at'] = self.created_at.isoformat()
         return data
 
+class UserCache:
+    """
+    Cache de UserInfo con TTL indexada por name y por telegram_username.
+
+    También guarda resultados negativos (usuario inexistente) con un TTL más corto,
+    para que las búsquedas que siempre fallan no vayan a la base en cada turno.
+
+    Cada invalidación avanza una generación y la registra en las claves afectadas.
+    Un fallo de get() devuelve la generación vigente, y put() descarta la fila si
+    alguna de sus claves se invalidó desde entonces: una lectura de la base que
+    empezó antes de una escritura no deja el valor viejo cacheado durante todo el TTL.
+    """
+
+    INDEXES = ('name', 'telegram_username')
+
+    def __init__(self, max_size: int = None, ttl: float = None, negative_ttl: float = None):
+        """
+        Args:
+            max_size: Entradas máximas por índice (USER_CACHE_SIZE, por defecto 5000)
+            ttl: Segundos de vida de un usuario encontrado (USER_CACHE_TTL, por defecto 300)
+            negative_ttl: Segundos de vida de un "no encontrado" (USER_CACHE_NEGATIVE_TTL, por defecto 30)
+        """
+        self.max_size = max_size or int(os.getenv('USER_CACHE_SIZE', 5000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('USER_CACHE_TTL', 300))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(os.getenv('USER_CACHE_NEGATIVE_TTL', 30))
+        self._lock = threading.Lock()
+        # índice -> OrderedDict(clave -> (UserInfo | None, expires_at))
+        self._entries = {index: OrderedDict() for index in self.INDEXES}
+        self._counters = {index: {"hits": 0, "negative_hits": 0, "misses": 0} for index in self.INDEXES}
+        self._invalidations = 0
+        # Generación de la última invalidación de cada (índice, clave); acotado a max_size
+        # claves: las que se descartan suben `_generation_floor` y put() las da por invalidadas
+        self._generation = 0
+        self._invalidated_at: "OrderedDict[tuple, int]" = OrderedDict()
+        self._generation_floor = 0
+        self._stale_puts = 0
+
+    def get(self, index: str, key: str):
+        """
+        Busca una clave en un índice
+
+        Returns:
+            tuple: (encontrado, UserInfo | None, generación). encontrado=False significa que
+                hay que ir a la base y pasar la generación a put() con lo leído
+        """
+        with self._lock:
+            entries = self._entries[index]
+            entry = entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del entries[key]
+                self._counters[index]["misses"] += 1
+                return False, None, self._generation
+            entries.move_to_end(key)
+            user_info = entry[0]
+            self._counters[index]["hits" if user_info else "negative_hits"] += 1
+            # Copia para que quien llama no modifique la entrada cacheada
+            return True, replace(user_info) if user_info else None, self._generation
+
+    def put(self, index: str, key: str, user_info: Optional[UserInfo], generation: int = None):
+        """
+        Guarda un resultado; un usuario encontrado se indexa también por su otra clave
+
+        Args:
+            generation: La devuelta por get() antes de leer la base. Si alguna clave del
+                usuario se invalidó después, el resultado ya no es confiable y no se guarda
+        """
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None:
+                keys = [(index, key)]
+                if user_info is not None:
+                    keys += [('name', user_info.name), ('telegram_username', user_info.telegram_username)]
+                if generation < self._generation_floor or any(
+                        self._invalidated_at.get(k, -1) > generation for k in keys):
+                    self._stale_puts += 1
+                    return
+            if user_info is None:
+                self._store(index, key, None, now + self.negative_ttl)
+                return
+            expires_at = now + self.ttl
+            self._store('name', user_info.name, user_info, expires_at)
+            self._store('telegram_username', user_info.telegram_username, user_info, expires_at)
+            # Por si la búsqueda fue con una clave distinta a la normalizada
+            if key not in (user_info.name, user_info.telegram_username):
+                self._store(index, key, user_info, expires_at)
+
+    def _store(self, index, key, user_info, expires_at):
+        entries = self._entries[index]
+        entries[key] = (user_info, expires_at)
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def invalidate(self, name: str = None, telegram_username: str = None):
+        """Elimina un usuario de ambos índices (usar tras cualquier escritura en users)"""
+        with self._lock:
+            keys = {'name': {name}, 'telegram_username': {telegram_username}}
+            # Encontrar la otra clave del mismo usuario para no dejar copias viejas
+            for index, key in (('name', name), ('telegram_username', telegram_username)):
+                entry = self._entries[index].get(key) if key else None
+                if entry and entry[0]:
+                    keys['name'].add(entry[0].name)
+                    keys['telegram_username'].add(entry[0].telegram_username)
+            self._generation += 1
+            for index, index_keys in keys.items():
+                for key in index_keys:
+                    if key is not None:
+                        self._entries[index].pop(key, None)
+                        self._invalidated_at[(index, key)] = self._generation
+                        self._invalidated_at.move_to_end((index, key))
+            while len(self._invalidated_at) > self.max_size:
+                _, generation = self._invalidated_at.popitem(last=False)
+                self._generation_floor = max(self._generation_floor, generation)
+            self._invalidations += 1
+
+    def adjust_message_count(self, index: str, key: str, delta: int):
+        """Suma `delta` al message_count cacheado (ambos índices comparten el mismo objeto)"""
+        with self._lock:
+            entry = self._entries[index].get(key)
+            if entry and entry[0]:
+                entry[0].message_count += delta
+
+    def clear(self):
+        """Vacía la cache (las lecturas en curso tampoco se guardan)"""
+        with self._lock:
+            for entries in self._entries.values():
+                entries.clear()
+            self._generation += 1
+            self._generation_floor = self._generation
+
+    def stats(self) -> Dict:
+        """Tamaño y tasa de aciertos por índice"""
+        with self._lock:
+            stats = {"invalidations": self._invalidations, "stale_puts": self._stale_puts}
+            for index in self.INDEXES:
+                counters = self._counters[index]
+                total = counters["hits"] + counters["negative_hits"] + counters["misses"]
+                stats[index] = {
+                    **counters,
+                    "size": len(self._entries[index]),
+                    "hit_rate": round((counters["hits"] + counters["negative_hits"]) / total, 4) if total else 0.0,
+                }
+            return stats
+
 class UserManager:
-    """Gestiona información de usuarios del bot usando PostgreSQL"""
+    """Gestiona información de usuarios del bot sobre el backend de almacenamiento"""
 
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: StorageBackend, cache: UserCache = None):
         self.db_manager = db_manager
+        self.cache = cache or UserCache()
+        # Incrementos de message_count por name, escritos por lotes
+        # (MESSAGE_COUNT_FLUSH_INTERVAL segundos o MESSAGE_COUNT_FLUSH_THRESHOLD incrementos)
+        self.message_counter = CounterAggregator(
+            self._flush_message_counts,
+            flush_interval=float(os.getenv('MESSAGE_COUNT_FLUSH_INTERVAL', 5)),
+            flush_threshold=int(os.getenv('MESSAGE_COUNT_FLUSH_THRESHOLD', 200)),
+            name="MessageCountAggregator",
+            on_flushed=self._invalidate_counted
+        )
 
+    @traced("user_manager.get_user_by_name")
     def get_user_by_name(self, name: str) -> Optional[UserInfo]:
-        """Obtiene un usuario de la tabla users por name."""
-        try:
-            with self.db_manager.get_connection() as (conn, cursor):
-                cursor.execute(
-                    "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE name = %s;",
-                    (name,)
-                )
-                row = cursor.fetchone()
-                if row:
-                    return UserInfo(
-                        telegram_username=row[0],
-                        session_id=row[1],
-                        name=row[2],
-                        email=row[3],
-                        message_count=row[4] if row[4] is not None else 0,
-                        created_at=row[5]
-                    )
+        """Obtiene un usuario de la tabla users por name (cacheado)."""
+        found, user_info, generation = self.cache.get('name', name)
+        set_attribute("cache_hit", found)
+        if not found:
+            try:
+                with self.db_manager.get_connection() as (conn, cursor):
+                    self.db_manager.execute_prepared(conn, cursor, 'user_by_name', (name,))
+                    user_info = self._row_to_user(cursor.fetchone())
+            except Exception as e:
+                print(f"Error al obtener usuario por name {name}: {e}")
                 return None
-        except Exception as e:
-            print(f"Error al obtener usuario por name {name}: {e}")
-            return None
+            self.cache.put('name', name, user_info, generation)
+            user_info = replace(user_info) if user_info else None
+        return self._with_pending_count(user_info)
 
+    @traced("user_manager.get_user")
     def get_user(self, username: str) -> Optional[UserInfo]:
-        """Obtiene un usuario de la tabla users por telegram_username."""
-        try:
-            with self.db_manager.get_connection() as (conn, cursor):
-                username_clean = username.lstrip('@')  # Remover @ si existe
-                cursor.execute(
-                    "SELECT telegram_username, session_id, name, email, message_count, created_at FROM users WHERE telegram_username = %s;",
-                    (username_clean,)
-                )
-                row = cursor.fetchone()
-                if row:
-                    return UserInfo(
-                        telegram_username=row[0],
-                        session_id=row[1],
-                        name=row[2],
-                        email=row[3],
-                        message_count=row[4] if row[4] is not None else 0,
-                        created_at=row[5]
-                    )
+        """Obtiene un usuario de la tabla users por telegram_username (cacheado)."""
+        username_clean = username.lstrip('@')  # Remover @ si existe
+        found, user_info, generation = self.cache.get('telegram_username', username_clean)
+        set_attribute("cache_hit", found)
+        if not found:
+            try:
+                with self.db_manager.get_connection() as (conn, cursor):
+                    self.db_manager.execute_prepared(conn, cursor, 'user_by_telegram', (username_clean,))
+                    user_info = self._row_to_user(cursor.fetchone())
+            except Exception as e:
+                print(f"Error al obtener usuario {username}: {e}")
                 return None
-        except Exception as e:
-            print(f"Error al obtener usuario {username}: {e}")
+            self.cache.put('telegram_username', username_clean, user_info, generation)
+            user_info = replace(user_info) if user_info else None
+        return self._with_pending_count(user_info)
+
+    def _with_pending_count(self, user_info: Optional[UserInfo]) -> Optional[UserInfo]:
+        """Suma a message_count los incrementos aún no escritos en la base"""
+        if user_info:
+            user_info.message_count += self.message_counter.pending(user_info.name)
+        return user_info
+
+    @staticmethod
+    def _row_to_user(row) -> Optional[UserInfo]:
+        """Convierte una fila de users en UserInfo"""
+        if not row:
             return None
+        return UserInfo(
+            telegram_username=row[0],
+            session_id=row[1],
+            name=row[2],
+            email=row[3],
+            message_count=row[4] if row[4] is not None else 0,
+            created_at=row[5]
+        )
+
+    def invalidate_user(self, name: str = None, telegram_username: str = None):
+        """Descarta de la cache un usuario modificado fuera de UserManager (p. ej. users.session_id)."""
+        if telegram_username:
+            telegram_username = telegram_username.lstrip('@')
+        self.cache.invalidate(name=name, telegram_username=telegram_username)
+
+    def cache_stats(self) -> Dict:
+        """Estadísticas de la cache de usuarios y del agregador de contadores."""
+        return {**self.cache.stats(), "message_counter": self.message_counter.stats()}
 
     def increment_message_count_by_name(self, name: str):
-        """Incrementa el contador de mensajes de un usuario por name."""
-        try:
-            with self.db_manager.get_connection() as (conn, cursor):
-                cursor.execute(
-                    "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE name = %s;",
-                    (name,)
-                )
-                conn.commit()
-        except Exception as e:
-            print(f"Error al incrementar contador de mensajes para el usuario {name}: {e}")
-            raise
+        """Incrementa el contador de mensajes de un usuario por name (escritura agrupada)."""
+        self.message_counter.add(name)
+
+    def _flush_message_counts(self, rows: List):
+        """Escribe (name, delta) acumulados con un único UPDATE ... FROM (VALUES ...)."""
+        with self.db_manager.get_connection() as (conn, cursor):
+            self.db_manager.execute_batch(conn, cursor, 'user_increment_batch', rows)
+            conn.commit()
+
+    def _invalidate_counted(self, rows: List):
+        """Tras un flush el valor cacheado ya no coincide con la base: recargar en la próxima lectura."""
+        for name, _ in rows:
+            self.cache.invalidate(name=name)
+
+    def close(self):
+        """Escribe los contadores pendientes."""
+        self.message_counter.close()
 
     def increment_message_count(self, username: str):
         """Incrementa el contador de mensajes de un usuario."""
         try:
             with self.db_manager.get_connection() as (conn, cursor):
                 username_clean = username.lstrip('@')
-                cursor.execute(
-                    "UPDATE users SET message_count = COALESCE(message_count, 0) + 1 WHERE telegram_username = %s;",
-                    (username_clean,)
-                )
+                self.db_manager.execute_prepared(conn, cursor, 'user_increment_by_telegram', (username_clean,))
                 conn.commit()
         except Exception as e:
             print(f"Error al incrementar contador de mensajes para el usuario {username}: {e}")
             raise
+        self.cache.adjust_message_count('telegram_username', username.lstrip('@'), 1)
@@ -4,20 +4,43 @@ Web Handler - Ejemplo de integración web para el bot SAÚ AI
 Este archivo muestra cómo integrar el BotCore con una API web
 """
 
+import os
+import re
+import math
+import time
 import logging
 import asyncio
+import hashlib
 from typing import Dict, Any
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 
 from bot_core import BotCore, MessageInput, MessageResponse
-from database_manager import DatabaseManager
+from admission import AdmissionController, AdmissionRejected
+from single_flight import SingleFlight
+from job_store import create_job_store
+from job_runner import ChatJobRunner
+from rate_limiter import RateLimiter, RateLimitExceeded, create_rate_limit_store
+from metrics import REGISTRY, HTTP_REQUESTS, HTTP_LATENCY
+from tracing import begin_trace, end_trace, get_request_id
+from storage_backend import create_storage_backend
 from user_manager import UserManager
 from session_manager import SessionManager
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# X-Request-ID aceptado del cliente o del proxy; cualquier otro valor se reemplaza
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Límites por defecto "N/S" (N peticiones cada S segundos) por ruta y ámbito;
+# cada uno se puede cambiar con RATE_LIMIT_<RUTA>_<ÁMBITO>, p. ej. RATE_LIMIT_CHAT_NAME=20/60
+RATE_LIMITS = {
+    "chat": {"name": "10/60", "ip": "30/60"},
+    "chat_jobs": {"name": "10/60", "ip": "30/60"},
+    "chat_jobs_poll": {"ip": "120/60"},
+}
+
 class WebHandler:
     """
     Handler para integración web del bot SAÚ AI
@@ -27,6 +50,18 @@ class WebHandler:
     def __init__(self, bot_core: BotCore):
         """Inicializa el handler web con BotCore"""
         self.bot_core = bot_core
+        # Limita las conversaciones en curso para responder "ocupado" rápido bajo sobrecarga
+        self.chat_admission = AdmissionController(name="chat")
+        # Reintentos y dobles clics con el mismo mensaje comparten una sola ejecución
+        self.chat_dedup_window = float(os.getenv("CHAT_DEDUP_WINDOW", 5))
+        self.chat_idempotency_ttl = float(os.getenv("CHAT_IDEMPOTENCY_TTL", 600))
+        self.chat_single_flight = SingleFlight(ttl=self.chat_dedup_window, name="chat")
+        # Token buckets por usuario e IP; se revisan antes de cualquier trabajo costoso
+        self.rate_limiter = RateLimiter(create_rate_limit_store(), RATE_LIMITS)
+        self.trust_proxy = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+        # Trabajos asíncronos: POST devuelve un id y el resultado se consulta con long-poll
+        self.job_runner = ChatJobRunner(bot_core, create_job_store())
+        self.job_max_wait = float(os.getenv("CHAT_JOB_MAX_WAIT", 25))
         self.app = Flask(__name__)
         CORS(self.app, origins=[
             "https://gamersmed.apversus.com",  # Producción APV-Web
@@ -34,6 +69,92 @@ class WebHandler:
             "http://localhost:3000"  # Desarrollo local
         ])
         self._setup_routes()
+        self._setup_tracing()
+        self._setup_metrics()
+    
+    def _setup_tracing(self):
+        """Asigna un request ID a cada petición y lo propaga como contexto de la traza"""
+        
+        @self.app.before_request
+        def start_trace():
+            incoming = request.headers.get('X-Request-ID', '')
+            request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else None
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            g.trace_token = begin_trace(f"{request.method} {route}", request_id)
+        
+        @self.app.after_request
+        def add_request_id_header(response):
+            request_id = get_request_id()
+            if request_id:
+                response.headers['X-Request-ID'] = request_id
+            return response
+        
+        @self.app.teardown_request
+        def finish_trace(error=None):
+            token = g.pop('trace_token', None)
+            if token is not None:
+                end_trace(token, error)
+    
+    def _setup_metrics(self):
+        """Mide cada petición HTTP y publica el estado interno en /api/metrics"""
+        
+        @self.app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+        
+        @self.app.after_request
+        def record_request(response):
+            # La regla ("/api/chat/jobs/<job_id>") evita una serie por cada id
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+            started = g.get('request_started')
+            if started is not None:
+                HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+            return response
+        
+        REGISTRY.register_collector(self._collect_runtime_metrics)
+    
+    def _collect_runtime_metrics(self):
+        """Convierte las estadísticas de pools, colas y caches en métricas al momento de exponerlas"""
+        stats = self.bot_core.get_runtime_stats()
+        executors = stats["executors"]
+        db_pool = stats["db_pool"]
+        writer = stats["message_writer"]
+        admission = self.chat_admission.stats()
+        jobs = self.job_runner.stats()
+        
+        def per_pool(key):
+            return [({"pool": name}, pool[key]) for name, pool in executors.items()]
+        
+        return [
+            ("sau_executor_workers", "gauge", "Hilos de cada pool de BotCore", per_pool("workers")),
+            ("sau_executor_active", "gauge", "Tareas ejecutándose en cada pool", per_pool("active")),
+            ("sau_executor_queued", "gauge", "Tareas esperando hilo en cada pool", per_pool("queued")),
+            ("sau_db_pool_connections", "gauge", "Conexiones del pool de base de datos", [
+                ({"state": "in_use"}, db_pool.get("in_use", 0)),
+                ({"state": "idle"}, db_pool.get("idle", 0)),
+            ]),
+            ("sau_db_pool_max_connections", "gauge", "Máximo de conexiones del pool de base de datos", [
+                ({}, db_pool.get("max", 0))
+            ]),
+            ("sau_message_writer_queue_depth", "gauge", "Mensajes esperando persistencia", [({}, writer["queue_depth"])]),
+            ("sau_message_writer_dropped_total", "counter", "Mensajes descartados por la cola de persistencia", [
+                ({}, writer["dropped"])
+            ]),
+            ("sau_admission_active", "gauge", "Peticiones de chat en proceso", [({}, admission["active"])]),
+            ("sau_admission_queue_depth", "gauge", "Peticiones de chat esperando turno", [({}, admission["queue_depth"])]),
+            ("sau_admission_rejected_total", "counter", "Peticiones de chat rechazadas por sobrecarga", [
+                ({"reason": "queue_full"}, admission["rejected_queue_full"]),
+                ({"reason": "queue_timeout"}, admission["rejected_timeout"]),
+            ]),
+            ("sau_chat_jobs", "gauge", "Trabajos de chat asíncronos por estado", [
+                ({"state": "queued"}, jobs["queued"]),
+                ({"state": "running"}, jobs["running"]),
+            ]),
+            ("sau_session_cache_hit_ratio", "gauge", "Tasa de acierto de la cache de sesiones", [
+                ({}, stats["session_cache"]["session_hit_rate"])
+            ]),
+        ]
     
     def _setup_routes(self):
         """Configura las rutas de la API web"""
@@ -47,6 +168,7 @@ class WebHandler:
             {
                 "name": "Julian",
                 "message": "Hola, ¿cómo estás?",
+                "idempotency_key": "opcional, también vía header Idempotency-Key",
                 "metadata": {
                     "user_agent": "...",
                     "ip": "..."
@@ -56,6 +178,7 @@ class WebHandler:
             Respuesta:
             {
                 "success": true,
+                "deduplicated": false,
                 "response": {
                     "content": "¡Hola! Soy SAÚ...",
                     "response_type": "text",
@@ -67,6 +190,7 @@ class WebHandler:
             }
             """
             try:
+                self.rate_limiter.check("chat", ip=self._client_ip())
                 data = request.get_json()
                 
                 # Validar datos de entrada
@@ -75,25 +199,28 @@ class WebHandler:
                         "success": False,
                         "error": "Se requieren 'name' y 'message'"
                     }), 400
+                self.rate_limiter.check("chat", name=data['name'])
                 
                 # Crear entrada de mensaje genérica
-                message_input = MessageInput(
-                    username=data['name'],  # Usar name como username en MessageInput
-                    message=data['message'],
-                    origin="web",
-                    metadata={
-                        "user_agent": request.headers.get('User-Agent'),
-                        "ip": request.remote_addr,
-                        **data.get('metadata', {})
-                    }
-                )
+                message_input = self._message_input_from_request(data)
+                
+                def process():
+                    # Procesar mensaje usando BotCore (síncrono) si hay capacidad
+                    with self.chat_admission.admit():
+                        return asyncio.run(self.bot_core.process_message(message_input))
                 
-                # Procesar mensaje usando BotCore (síncrono)
-                response = asyncio.run(self.bot_core.process_message(message_input))
+                # Los duplicados se unen a la ejecución en curso en vez de repetirla
+                key, ttl = self._chat_dedup_key(data)
+                response, deduplicated = self.chat_single_flight.do(
+                    key, process, ttl=ttl, cacheable=self._is_reusable_response
+                )
+                if deduplicated:
+                    logger.info(f"♻️ Mensaje duplicado de {data['name']} atendido con la respuesta en curso")
                 
                 # Retornar respuesta en formato JSON
                 return jsonify({
                     "success": True,
+                    "deduplicated": deduplicated,
                     "response": {
                         "content": response.content,
                         "response_type": response.response_type,
@@ -101,6 +228,12 @@ class WebHandler:
                     }
                 })
                 
+            except RateLimitExceeded as e:
+                return self._rate_limited_response(e)
+                
+            except AdmissionRejected as e:
+                return self._overloaded_response(e)
+                
             except Exception as e:
                 logger.error(f"Error en endpoint /api/chat: {e}")
                 return jsonify({
@@ -108,6 +241,106 @@ class WebHandler:
                     "error": "Error interno del servidor"
                 }), 500
         
+        @self.app.route('/api/chat/jobs', methods=['POST'])
+        def create_chat_job_endpoint():
+            """
+            Encola un mensaje y responde de inmediato con el id del trabajo
+            
+            Mismo formato de entrada que /api/chat.
+            
+            Respuesta 202:
+            {
+                "success": true,
+                "job_id": "uuid",
+                "status": "queued",
+                "poll_url": "/api/chat/jobs/uuid"
+            }
+            """
+            try:
+                self.rate_limiter.check("chat_jobs", ip=self._client_ip())
+                data = request.get_json()
+                
+                if not data or 'name' not in data or 'message' not in data:
+                    return jsonify({
+                        "success": False,
+                        "error": "Se requieren 'name' y 'message'"
+                    }), 400
+                self.rate_limiter.check("chat_jobs", name=data['name'])
+                
+                message_input = self._message_input_from_request(data)
+                
+                # Un reintento del mismo envío recibe el mismo trabajo
+                key, ttl = self._chat_dedup_key(data)
+                job_id, deduplicated = self.chat_single_flight.do(
+                    f"job:{key}", lambda: self.job_runner.submit(message_input), ttl=ttl
+                )
+                
+                return jsonify({
+                    "success": True,
+                    "job_id": job_id,
+                    "status": "queued",
+                    "deduplicated": deduplicated,
+                    "poll_url": f"/api/chat/jobs/{job_id}"
+                }), 202
+                
+            except RateLimitExceeded as e:
+                return self._rate_limited_response(e)
+                
+            except AdmissionRejected as e:
+                return self._overloaded_response(e)
+                
+            except Exception as e:
+                logger.error(f"Error en endpoint /api/chat/jobs: {e}")
+                return jsonify({
+                    "success": False,
+                    "error": "Error interno del servidor"
+                }), 500
+        
+        @self.app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+        def get_chat_job_endpoint(job_id):
+            """
+            Consulta un trabajo; con ?wait=N espera hasta N segundos a que termine (long-poll)
+            
+            Respuesta 200:
+            {
+                "success": true,
+                "job": {
+                    "job_id": "uuid",
+                    "status": "queued | running | done | failed",
+                    "response": {"content": "...", "response_type": "text", "metadata": {...}},
+                    "error": null
+                }
+            }
+            """
+            try:
+                self.rate_limiter.check("chat_jobs_poll", ip=self._client_ip())
+                wait = request.args.get('wait', 0, type=float)
+                if not math.isfinite(wait):
+                    return jsonify({
+                        "success": False,
+                        "error": "'wait' debe ser un número finito de segundos"
+                    }), 400
+                wait = min(max(wait, 0), self.job_max_wait)
+                job = self.job_runner.store.wait(job_id, wait) if wait else self.job_runner.store.get(job_id)
+                
+                if job is None:
+                    return jsonify({
+                        "success": False,
+                        "error": "Trabajo no encontrado o expirado"
+                    }), 404
+                
+                return jsonify({"success": True, "job": job})
+                
+            except RateLimitExceeded as e:
+                return self._rate_limited_response(e)
+                
+            except Exception as e:
+                logger.error(f"Error en endpoint /api/chat/jobs/{job_id}: {e}")
+                return jsonify({
+                    "success": False,
+                    "error": "Error interno del servidor"
+                }), 500
+        
         @self.app.route('/api/health', methods=['GET'])
         def health_check():
             """Endpoint de salud para verificar que el servicio está funcionando"""
@@ -118,11 +351,25 @@ class WebHandler:
                 "version": "1.0.0",
                 "endpoints": {
                     "chat": "/api/chat",
+                    "chat_jobs": "/api/chat/jobs",
+                    "metrics": "/api/metrics",
                     "check_user": "/api/check-user",
                     "typing": "/api/typing"
+                },
+                "stats": {
+                    **self.bot_core.get_runtime_stats(),
+                    "admission": {"chat": self.chat_admission.stats()},
+                    "single_flight": {"chat": self.chat_single_flight.stats()},
+                    "chat_jobs": self.job_runner.stats(),
+                    "rate_limits": self.rate_limiter.stats()
                 }
             })
         
+        @self.app.route('/api/metrics', methods=['GET'])
+        def metrics_endpoint():
+            """Métricas en formato de exposición de texto de Prometheus"""
+            return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+        
         @self.app.route('/api/check-user', methods=['POST'])
         def check_user_endpoint():
             """
@@ -206,6 +453,75 @@ class WebHandler:
                     "error": "Error interno del servidor"
                 }), 500
     
+    def _message_input_from_request(self, data: Dict[str, Any]) -> MessageInput:
+        """Crea la entrada de mensaje genérica a partir del body y los headers del request"""
+        return MessageInput(
+            username=data['name'],  # Usar name como username en MessageInput
+            message=data['message'],
+            origin="web",
+            metadata={
+                "user_agent": request.headers.get('User-Agent'),
+                "ip": request.remote_addr,
+                **data.get('metadata', {})
+            }
+        )
+    
+    def _client_ip(self) -> str:
+        """IP del cliente; detrás de un proxy confiable (RATE_LIMIT_TRUST_PROXY=true) usa X-Forwarded-For"""
+        if self.trust_proxy:
+            forwarded = request.headers.get('X-Forwarded-For', '')
+            if forwarded:
+                # La última entrada la agrega nuestro proxy; las anteriores las controla el cliente
+                return forwarded.split(',')[-1].strip()
+        return request.remote_addr
+    
+    @staticmethod
+    def _rate_limited_response(error: RateLimitExceeded):
+        """Respuesta 429 con Retry-After para peticiones que superan su límite"""
+        response = jsonify({
+            "success": False,
+            "error": "Demasiados mensajes seguidos, espera un momento antes de volver a intentar",
+            "retry_after": error.retry_after
+        })
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 429
+    
+    @staticmethod
+    def _overloaded_response(error: AdmissionRejected):
+        """Respuesta 503 con Retry-After para peticiones rechazadas por sobrecarga"""
+        response = jsonify({
+            "success": False,
+            "error": "SAÚ está atendiendo muchas conversaciones, intenta de nuevo en unos segundos",
+            "retry_after": error.retry_after
+        })
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+    
+    def _chat_dedup_key(self, data: Dict[str, Any]):
+        """
+        Clave de deduplicación de un mensaje de chat y su ventana de retención
+        
+        Con `Idempotency-Key` (header o campo del body) el resultado se retiene más tiempo
+        para cubrir reintentos de red; sin ella solo se agrupan mensajes idénticos del
+        mismo usuario dentro de una ventana corta.
+        """
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key:
+            return f"key:{data['name']}:{idempotency_key}", self.chat_idempotency_ttl
+        digest = hashlib.sha256(data['message'].encode('utf-8')).hexdigest()
+        return f"msg:{data['name']}:{digest}", self.chat_dedup_window
+    
+    @staticmethod
+    def _is_reusable_response(response: MessageResponse) -> bool:
+        """Solo se reutilizan respuestas exitosas; los errores deben poder reintentarse"""
+        return response.response_type == "text" and not response.content.startswith("❌")
+    
+    def close(self):
+        """Termina los trabajos en curso y libera los recursos de BotCore"""
+        REGISTRY.unregister_collector(self._collect_runtime_metrics)
+        self.job_runner.close()
+        self.bot_core.cleanup()
+    
     def run(self, host='0.0.0.0', port=5000, debug=False):
         """Ejecuta el servidor web"""
         print(f"🌐 SAÚ AI Web Server iniciando en {host}:{port}")
@@ -243,8 +559,8 @@ if __name__ == "__main__":
     # En tu aplicación principal:
     from src.web_handler import create_web_handler
     
-    # Inicializar managers
-    db_manager = DatabaseManager()
+    # Inicializar managers (STORAGE_BACKEND=postgres|sqlite)
+    db_manager = create_storage_backend()
     user_manager = UserManager(db_manager)
     session_manager = SessionManager(db_manager)
     